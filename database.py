@@ -1,12 +1,13 @@
 from databases import Database
 import sqlalchemy
-from sqlalchemy import create_engine, MetaData, Table, Column, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import create_engine, event, MetaData, Table, Column, Integer, String, Boolean, DateTime, Text, Index, inspect
 from sqlalchemy.sql import select, insert, update, delete, func
 from datetime import datetime
 import os
 
-DATABASE_URL = "sqlite+aiosqlite:///./photos/photo_server.db"
-SYNC_DATABASE_URL = "sqlite:///./photos/photo_server.db"
+DATABASE_FILE = "./photos/photo_server.db"
+DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_FILE}"
+SYNC_DATABASE_URL = f"sqlite:///{DATABASE_FILE}"
 
 database = Database(DATABASE_URL)
 metadata = MetaData()
@@ -25,28 +26,298 @@ users_table = Table(
     Column("created_at", DateTime, server_default=func.now(), nullable=False),
 )
 
-# Photo metadata table (for future use)
+# Photo index table - one row per stored file, keyed by "folder/filename".
+# Dates are kept as ISO strings so ordering and range filters behave exactly
+# like the values that used to live in metadata.json.
 photos_table = Table(
     "photos",
     metadata,
     Column("id", Integer, primary_key=True, autoincrement=True),
-    Column("filename", String(255), unique=True, nullable=False),
+    Column("unique_key", String(512), unique=True, nullable=False),
+    Column("filename", String(255), nullable=False),
     Column("original_name", String(255), nullable=False),
+    Column("folder", String(50), nullable=False),
+    Column("file_path", String(512), nullable=False),
     Column("uploaded_by", String(50), nullable=False),
-    Column("upload_date", DateTime, default=datetime.utcnow, nullable=False),
+    Column("upload_date", String(32), nullable=False),
+    # When the photo was taken (EXIF DateTimeOriginal, else upload_date), ISO format
+    Column("taken_at", String(32), nullable=True),
     Column("file_size", Integer, nullable=False),
     Column("file_type", String(10), nullable=False),
     Column("is_favorite", Boolean, default=False, nullable=False),
+    Column("has_thumbnail", Boolean, default=False, nullable=False),
+    # "none" (not an image), "pending", "ready" or "failed"
+    Column("thumbnail_status", String(10), server_default="none", nullable=False),
     Column("metadata_json", Text, nullable=True),  # Store additional metadata as JSON
     Column("created_at", DateTime, server_default=func.now(), nullable=False),
+    # SHA-256 of the file (hex), recorded at upload; identical uploads are stored
+    # as hardlinks of one file. NULL for files indexed before hashing or by the reconciler
+    Column("content_hash", String(64), nullable=True),
+    Index("ix_photos_folder_upload_date", "folder", "upload_date"),
+    Index("ix_photos_filename", "filename"),
+    Index("ix_photos_file_size", "file_size"),
+    Index("ix_photos_is_favorite", "is_favorite"),
+    Index("ix_photos_content_hash", "content_hash"),
 )
 
+# Keyset pagination of /photos walks these in (sort value, unique_key) order,
+# per folder for users and across all folders for admins
+Index("ix_photos_folder_date_key", photos_table.c.folder, photos_table.c.upload_date, photos_table.c.unique_key)
+Index("ix_photos_folder_name_key", photos_table.c.folder, func.lower(photos_table.c.filename), photos_table.c.unique_key)
+Index("ix_photos_folder_size_key", photos_table.c.folder, photos_table.c.file_size, photos_table.c.unique_key)
+Index("ix_photos_date_key", photos_table.c.upload_date, photos_table.c.unique_key)
+Index("ix_photos_name_key", func.lower(photos_table.c.filename), photos_table.c.unique_key)
+Index("ix_photos_size_key", photos_table.c.file_size, photos_table.c.unique_key)
+Index("ix_photos_folder_taken_key", photos_table.c.folder, photos_table.c.taken_at, photos_table.c.unique_key)
+Index("ix_photos_taken_key", photos_table.c.taken_at, photos_table.c.unique_key)
+
+# Photos per folder per day taken, for the timeline. Maintained by triggers
+# on photos (see _create_timeline_triggers), so it never needs a scan.
+photo_day_counts_table = Table(
+    "photo_day_counts",
+    metadata,
+    Column("folder", String(50), primary_key=True),
+    Column("day", String(10), primary_key=True),  # YYYY-MM-DD
+    Column("count", Integer, nullable=False),
+)
+
+# Deleted photos awaiting purge. A delete moves the photos row here (so every
+# listing, count and search drops it at once) and leaves the files in place;
+# photo_utils' trash purger unlinks them after purge_after, and a restore
+# moves the row back. row_json holds the photos row to restore.
+photo_trash_table = Table(
+    "photo_trash",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("unique_key", String(512), unique=True, nullable=False),
+    Column("filename", String(255), nullable=False),
+    Column("folder", String(50), nullable=False),
+    Column("file_path", String(512), nullable=False),
+    Column("uploaded_by", String(50), nullable=False),
+    Column("file_size", Integer, nullable=False),
+    Column("deleted_by", String(50), nullable=False),
+    Column("deleted_at", String(32), nullable=False),
+    Column("purge_after", String(32), nullable=False),
+    Column("row_json", Text, nullable=False),
+    # Set while the purger unlinks the row's files; the row goes once they're gone
+    Column("purge_started", String(32)),
+    Index("ix_photo_trash_purge_after", "purge_after"),
+    Index("ix_photo_trash_folder_filename", "folder", "filename"),
+)
+
+# Single-row change counter for the photo index, bumped by every committed
+# index write; processes compare it against their cached snapshot
+photo_index_state_table = Table(
+    "photo_index_state",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("version", Integer, server_default="0", nullable=False),
+)
+
+# Resumable upload sessions (see python/upload_sessions.py)
+upload_sessions_table = Table(
+    "upload_sessions",
+    metadata,
+    Column("id", String(32), primary_key=True),
+    Column("username", String(50), nullable=False),
+    Column("filename", String(255), nullable=False),
+    Column("total_size", Integer, nullable=False),
+    Column("temp_path", String(512), nullable=False),
+    Column("created_at", DateTime, default=datetime.utcnow, nullable=False),
+    # Set while a request finalizes the session, so a second one backs off
+    Column("completing_at", DateTime),
+    # Final filename once the file is in place, so a retried finalize can report it
+    Column("completed_filename", String(255)),
+)
+
+# Byte ranges received for each upload session
+upload_chunks_table = Table(
+    "upload_chunks",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("session_id", String(32), nullable=False, index=True),
+    Column("offset", Integer, nullable=False),
+    Column("length", Integer, nullable=False),
+)
+
+_sync_engine = None
+
+def get_sync_engine():
+    """
+    Get the shared synchronous engine used by the photo index
+
+    Returns:
+        Engine: SQLAlchemy engine bound to SYNC_DATABASE_URL
+    """
+    global _sync_engine
+    if _sync_engine is None:
+        _sync_engine = create_engine(
+            SYNC_DATABASE_URL,
+            connect_args={"check_same_thread": False, "timeout": 30},
+        )
+        event.listen(_sync_engine, "connect", _configure_sqlite_connection)
+    return _sync_engine
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """
+    Use WAL journaling for the photo index: commits append to the journal and
+    are fsynced together when the journal is checkpointed
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Checkpoints normally come from photo_utils' maintenance thread; this
+    # is only a backstop (~40MB of journal) for processes that don't run it
+    cursor.execute("PRAGMA wal_autocheckpoint=10000")
+    cursor.close()
+
+def _drop_legacy_photos_table(engine):
+    """Drop the old placeholder photos table, which was never written to"""
+    inspector = inspect(engine)
+    if "photos" not in inspector.get_table_names():
+        return
+    columns = {column["name"] for column in inspector.get_columns("photos")}
+    if "unique_key" not in columns:
+        photos_table.drop(engine)
+
+def _upgrade_schema(engine):
+    """
+    Add columns and indexes introduced after a table was first created.
+    create_all() only creates missing tables, so existing databases are
+    brought up to date here (new columns must have a server default).
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        # Reflection skips expression indexes, so look names up directly
+        existing_indexes = set(conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'index'").scalars())
+        for table in metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    default = column.server_default.arg
+                    default = f"'{default}'" if isinstance(default, str) else default.text
+                    ddl += f" NOT NULL DEFAULT {default}" if not column.nullable else f" DEFAULT {default}"
+                conn.exec_driver_sql(ddl)
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(conn)
+
+# Full-text index over photo filenames and camera make/model. FTS5's trigram
+# tokenizer turns any 3+ character substring query into an index lookup; the
+# triggers keep it in step with every insert, update and delete on photos.
+PHOTO_SEARCH_TABLE = "photos_search"
+_search_index_available = False
+
+def _search_values(row: str) -> str:
+    """Column values for a photos_search row, taken from the photos row alias `row`"""
+    camera = (
+        f"CASE WHEN json_valid({row}.metadata_json) THEN trim("
+        f"coalesce(json_extract({row}.metadata_json, '$.camera_make'), '') || ' ' || "
+        f"coalesce(json_extract({row}.metadata_json, '$.camera_model'), '')) END"
+    )
+    return f"{row}.id, {row}.filename, {row}.original_name, {camera}"
+
+def _create_search_index(engine) -> bool:
+    """
+    Create the photos_search index and its triggers, filling it from photos
+    the first time
+    
+    Returns:
+        bool: False if this SQLite build has no FTS5 trigram tokenizer
+    """
+    columns = "rowid, filename, original_name, camera"
+    try:
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE name = ?", (PHOTO_SEARCH_TABLE,)
+            ).first() is not None
+            if not exists:
+                conn.exec_driver_sql(
+                    f"CREATE VIRTUAL TABLE {PHOTO_SEARCH_TABLE} "
+                    f"USING fts5(filename, original_name, camera, tokenize='trigram')"
+                )
+                conn.exec_driver_sql(
+                    f"INSERT INTO {PHOTO_SEARCH_TABLE} ({columns}) SELECT {_search_values('photos')} FROM photos"
+                )
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS photos_search_insert AFTER INSERT ON photos BEGIN
+                    INSERT INTO {PHOTO_SEARCH_TABLE} ({columns}) VALUES ({_search_values('new')});
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS photos_search_delete AFTER DELETE ON photos BEGIN
+                    DELETE FROM {PHOTO_SEARCH_TABLE} WHERE rowid = old.id;
+                END""")
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS photos_search_update
+                AFTER UPDATE OF id, filename, original_name, metadata_json ON photos BEGIN
+                    DELETE FROM {PHOTO_SEARCH_TABLE} WHERE rowid = old.id;
+                    INSERT INTO {PHOTO_SEARCH_TABLE} ({columns}) VALUES ({_search_values('new')});
+                END""")
+    except sqlalchemy.exc.OperationalError as e:
+        print(f"Warning: photo search index unavailable, falling back to filename scans: {e}")
+        return False
+    return True
+
+def _create_timeline_triggers(engine):
+    """
+    Create the triggers that keep photo_day_counts in step with photos,
+    counting it from scratch the first time
+    """
+    add = """
+        INSERT INTO photo_day_counts (folder, day, count)
+        VALUES (new.folder, substr(new.taken_at, 1, 10), 1)
+        ON CONFLICT (folder, day) DO UPDATE SET count = count + 1;"""
+    remove = """
+        UPDATE photo_day_counts SET count = count - 1
+        WHERE folder = old.folder AND day = substr(old.taken_at, 1, 10);
+        DELETE FROM photo_day_counts
+        WHERE folder = old.folder AND day = substr(old.taken_at, 1, 10) AND count <= 0;"""
+    with engine.begin() as conn:
+        if conn.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'photo_day_counts_insert'"
+        ).first() is None:
+            conn.exec_driver_sql("DELETE FROM photo_day_counts")
+            conn.exec_driver_sql(
+                "INSERT INTO photo_day_counts (folder, day, count) "
+                "SELECT folder, substr(taken_at, 1, 10), count(*) FROM photos "
+                "WHERE taken_at IS NOT NULL GROUP BY 1, 2"
+            )
+        conn.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS photo_day_counts_insert AFTER INSERT ON photos
+            WHEN new.taken_at IS NOT NULL BEGIN {add}
+            END""")
+        conn.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS photo_day_counts_delete AFTER DELETE ON photos
+            WHEN old.taken_at IS NOT NULL BEGIN {remove}
+            END""")
+        conn.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS photo_day_counts_update_old AFTER UPDATE OF folder, taken_at ON photos
+            WHEN old.taken_at IS NOT NULL BEGIN {remove}
+            END""")
+        conn.exec_driver_sql(f"""
+            CREATE TRIGGER IF NOT EXISTS photo_day_counts_update_new AFTER UPDATE OF folder, taken_at ON photos
+            WHEN new.taken_at IS NOT NULL BEGIN {add}
+            END""")
+
+def search_index_available() -> bool:
+    """Whether the photos_search full-text index exists (see create_tables)"""
+    return _search_index_available
+
 # Create database and tables
 def create_tables():
     """Create database tables if they don't exist"""
-    engine = create_engine(SYNC_DATABASE_URL)
+    global _search_index_available
+    engine = get_sync_engine()
+    _drop_legacy_photos_table(engine)
     metadata.create_all(engine)
-    engine.dispose()
+    _upgrade_schema(engine)
+    with engine.begin() as conn:
+        conn.exec_driver_sql("INSERT OR IGNORE INTO photo_index_state (id, version) VALUES (1, 0)")
+    _create_timeline_triggers(engine)
+    _search_index_available = _create_search_index(engine)
 
 # Initialize database
 def init_database():
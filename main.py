@@ -1,6 +1,6 @@
 from fastapi import FastAPI, Depends, HTTPException, status, Request, UploadFile, File, Form
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
@@ -11,8 +11,13 @@ import jwt
 from datetime import datetime, timedelta
 import os
 import shutil
+import asyncio
+import hashlib
+from urllib.parse import quote
 from python import db_utils_sql
 from python import photo_utils
+from python import upload_sessions
+from python import signed_urls
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.types import ASGIApp
 from database import database, init_database
@@ -22,6 +27,14 @@ SECRET_KEY = os.environ.get("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.environ.get("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.environ.get("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
+# Seconds a thumbnail request waits for background generation before answering 202
+THUMBNAIL_WAIT_SECONDS = float(os.environ.get("THUMBNAIL_WAIT_SECONDS", 5))
+
+# Internal nginx location aliased to the photo store (e.g. "/_photos"). When set,
+# thumbnails and originals are answered with X-Accel-Redirect and nginx sends the
+# bytes itself; unset, the app streams them (for running without nginx)
+ACCEL_REDIRECT_PREFIX = os.environ.get("PHOTO_ACCEL_REDIRECT_PREFIX", "").rstrip("/")
+
 # Password hashing with defensive bcrypt initialization
 try:
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -38,6 +51,17 @@ app = FastAPI()
 async def startup():
     """Initialize database connection and create tables"""
     init_database()
+    # Build the photo index (and import a legacy metadata.json) before serving
+    photo_utils.ensure_upload_dir()
+    photo_utils.start_index_maintenance()
+    # Files added or removed outside the server are indexed in the background
+    photo_utils.start_reconciler()
+    # Deleted photos' files are removed after the trash retention window
+    photo_utils.start_trash_purger()
+    # Temp files of uploads cut off by a shutdown or crash; not awaited, as it walks the whole store
+    asyncio.get_running_loop().run_in_executor(
+        None, photo_utils.remove_stale_temp_files, upload_sessions.active_temp_paths()
+    )
     await database.connect()
     # Ensure default users exist
     await db_utils_sql.ensure_default_users()
@@ -46,6 +70,17 @@ async def startup():
 async def shutdown():
     """Close database connection"""
     await database.disconnect()
+    photo_utils.stop_reconciler()
+    photo_utils.stop_trash_purger()
+    photo_utils.stop_index_maintenance()
+
+@app.exception_handler(photo_utils.AmbiguousFilenameError)
+async def ambiguous_filename_handler(request: Request, exc: photo_utils.AmbiguousFilenameError):
+    """Bare filenames that exist in several folders need the folder spelled out"""
+    return JSONResponse(
+        status_code=status.HTTP_409_CONFLICT,
+        content={"detail": str(exc), "filename": exc.filename, "candidates": exc.candidates},
+    )
 
 # Add CORS middleware
 app.add_middleware(
@@ -65,7 +100,6 @@ PHOTOS_UPLOAD_DIR = os.environ.get("PHOTOS_UPLOAD_DIR", "./photos")
 
 # Setup static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploads", StaticFiles(directory=PHOTOS_UPLOAD_DIR), name="uploads")
 templates = Jinja2Templates(directory="templates")
 
 # Create photos directory and global folder if they don't exist
@@ -137,9 +171,50 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+async def get_user_from_request(request: Request, token: Optional[str] = None):
+    """
+    Resolve the active user from a token query parameter or the Authorization header
+    """
+    # First, check if token was provided in query parameters
+    if token is None:
+        # Check if token is in the Authorization header
+        auth_header = request.headers.get("Authorization")
+        if auth_header and auth_header.startswith("Bearer "):
+            token = auth_header.split("Bearer ")[1]
+    
+    if not token:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Authentication required",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Invalid token signature")
+    
+    username = payload.get("sub")
+    if not username:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    
+    user = await get_user(username)
+    if not user or user.disabled:
+        raise HTTPException(status_code=401, detail="Invalid user")
+    return user
+
 @app.post("/token", response_model=Token)
-async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = await authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    client_host = request.client.host if request.client else "unknown"
+    try:
+        with db_utils_sql.admit_login(form_data.username, client_host):
+            user = await authenticate_user(form_data.username, form_data.password)
+    except db_utils_sql.LoginThrottled as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e),
+            headers={"Retry-After": "1"}
+        )
     if not user:
         raise HTTPException(status_code=401, detail="Incorrect username or password")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
@@ -157,6 +232,17 @@ async def read_users_me(current_user: User = Depends(get_current_active_user)):
 async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
+# Photos embedded in the user and admin pages; the rest are fetched as the grid scrolls
+LIBRARY_PAGE_SIZE = 100
+
+def _first_library_page(user: User) -> Dict[str, Any]:
+    """First /photos page (newest uploads) for a user's library grid, without the total count"""
+    page = photo_utils.get_photos_paginated(
+        username=None if user.admin else user.username, limit=LIBRARY_PAGE_SIZE, count_total=False
+    )
+    page["photos"] = [_with_file_urls(photo, user) for photo in page["photos"]]
+    return page
+
 @app.get("/admin", response_class=HTMLResponse)
 async def admin_page(request: Request, token: str = None):
     # First, check if token was provided in query parameters (from form submission)
@@ -176,13 +262,13 @@ async def admin_page(request: Request, token: str = None):
                 if user and not user.disabled:
                     # Check if user is an admin
                     if user.admin:
-                        # Get files with metadata using the photo_utils module
-                        files = photo_utils.get_all_files()
+                        # The library pages in the rest through /photos as it is scrolled
+                        first_page = _first_library_page(user)
                         # Load all users to display in the admin panel
                         all_users = await db_utils_sql.load_users()
                         return templates.TemplateResponse("admin.html", {
                             "request": request, 
-                            "files": files, 
+                            "first_page": first_page, 
                             "user": user,
                             "users": all_users,
                             "admin_username": db_utils_sql.ADMIN_USERNAME
@@ -213,20 +299,18 @@ async def user_page(request: Request, token: str = None):
             if username:
                 user = await get_user(username)
                 if user and not user.disabled:
-                    # Get photos categorized by folder
-                    my_photos = photo_utils.get_user_photos(username)
-                    global_photos = photo_utils.get_global_photos()
-                    all_photos = photo_utils.get_all_user_accessible_photos(username)
+                    # Only the first library page is rendered; the grids page
+                    # through /photos as they are scrolled
+                    first_page = _first_library_page(user)
+                    counts = photo_utils.get_folder_counts([username, photo_utils.GLOBAL_FOLDER])
                     
                     return templates.TemplateResponse("user.html", {
                         "request": request, 
                         "user": user,
-                        "my_photos": my_photos,
-                        "global_photos": global_photos,
-                        "all_photos": all_photos,
-                        "my_photos_count": len(my_photos),
-                        "global_photos_count": len(global_photos),
-                        "total_photos_count": len(all_photos)
+                        "first_page": first_page,
+                        "my_photos_count": counts[username],
+                        "global_photos_count": counts[photo_utils.GLOBAL_FOLDER],
+                        "total_photos_count": sum(counts.values())
                     })
         except jwt.PyJWTError:
             pass
@@ -287,7 +371,8 @@ async def upload_file(
                 print(f"Error checking file position: {str(pos_error)}")
                 
             # User is authenticated, process the file upload using photo_utils
-            file_metadata = photo_utils.save_uploaded_file(file.file, file.filename, username)
+            # (streamed off the event loop so other requests keep being served)
+            file_metadata = await photo_utils.save_uploaded_file_async(file, file.filename, username)
             
             # For AJAX requests, return a JSON response
             if "application/json" in request.headers.get("Accept", ""):
@@ -323,6 +408,150 @@ async def upload_file(
     except jwt.PyJWTError:
         raise HTTPException(status_code=401, detail="Invalid token signature")
 
+@app.put("/upload/{filename}")
+async def upload_file_stream(filename: str, request: Request, token: str = None):
+    """
+    Upload a file sent as the raw request body
+    
+    The body is streamed straight into a temp file in the user's folder and
+    renamed into place when complete, skipping the multipart spool copy.
+    """
+    user = await get_user_from_request(request, token)
+    
+    filename = os.path.basename(filename)
+    if not filename or filename.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    try:
+        file_metadata = await photo_utils.save_upload_stream_async(request.stream(), filename, user.username)
+    except IOError as io_error:
+        print(f"File IO error during upload: {str(io_error)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing file: {str(io_error)}"
+        )
+    
+    return {"success": True, "filename": file_metadata["filename"], "metadata": file_metadata}
+
+class UploadSessionCreate(BaseModel):
+    filename: str
+    size: int
+
+def _get_upload_session(session_id: str, current_user: User):
+    """Look up one of the current user's upload sessions or raise 404"""
+    session = upload_sessions.get_session(session_id, current_user.username)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return session
+
+def _public_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Session fields that are safe to return to the client"""
+    return {key: value for key, value in session.items() if key != "temp_path"}
+
+@app.post("/upload/sessions")
+async def create_upload_session(
+    request: UploadSessionCreate,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Start a resumable upload
+    
+    Body parameters:
+    - filename: Name to store the file under
+    - size: Total size of the file in bytes
+    """
+    filename = os.path.basename(request.filename)
+    if not filename or filename.startswith("."):
+        raise HTTPException(status_code=400, detail="Invalid filename")
+    
+    try:
+        session = upload_sessions.create_session(current_user.username, filename, request.size)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    
+    return _public_session(session)
+
+@app.get("/upload/sessions/{session_id}")
+async def get_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Get the progress of a resumable upload, including the byte ranges still missing
+    """
+    return _public_session(_get_upload_session(session_id, current_user))
+
+@app.put("/upload/sessions/{session_id}")
+async def put_upload_chunk(
+    session_id: str,
+    offset: int,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Upload one chunk of a resumable upload as the raw request body
+    
+    Query parameters:
+    - offset: Byte offset of the chunk within the file
+    
+    Chunks may be sent in any order and in parallel; re-sending a chunk is harmless.
+    """
+    session = _get_upload_session(session_id, current_user)
+    try:
+        session = await upload_sessions.write_chunk_async(session, offset, request.stream())
+    except ValueError as e:
+        raise HTTPException(status_code=416, detail=str(e))
+    except upload_sessions.SessionCompletingError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"success": False, "message": str(e)}
+        )
+    
+    return _public_session(session)
+
+@app.post("/upload/sessions/{session_id}/complete")
+async def complete_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Finalize a resumable upload once every byte has been received. Repeating
+    the call for a finalized session returns the same result, so a client
+    that lost the response can retry.
+    """
+    session = _get_upload_session(session_id, current_user)
+    if not session["complete"] and session["completed_filename"] is None:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"success": False, "message": "Upload is incomplete", "missing": session["missing"]}
+        )
+    
+    try:
+        file_metadata = await upload_sessions.complete_session_async(session)
+    except upload_sessions.SessionCompletingError as e:
+        return JSONResponse(
+            status_code=status.HTTP_409_CONFLICT,
+            content={"success": False, "message": str(e)}
+        )
+    except IOError as io_error:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error processing file: {str(io_error)}"
+        )
+    
+    return {"success": True, "filename": file_metadata["filename"], "metadata": file_metadata}
+
+@app.delete("/upload/sessions/{session_id}")
+async def abort_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Cancel a resumable upload and discard the received bytes
+    """
+    upload_sessions.abort_session(_get_upload_session(session_id, current_user))
+    return {"success": True, "message": "Upload session cancelled"}
+
 # Remove the public registration endpoints - these will be deleted
 
 class UserCreate(BaseModel):
@@ -403,8 +632,55 @@ async def update_admin_status(request: AdminUpdateRequest, current_user: User =
             content={"success": False, "message": "Failed to update admin status"}
         )
 
+@app.get("/api/cache-stats")
+async def get_cache_stats(current_user: User = Depends(get_current_active_user)):
+    """
+    Get hit/miss counters for the in-process photo metadata cache, the
+    photo store reconciler, the trash and content deduplication (admin only)
+    """
+    if not current_user.admin:
+        raise HTTPException(status_code=403, detail="Admin privileges required")
+    
+    return {
+        "metadata_cache": photo_utils.get_metadata_cache_stats(),
+        "reconciler": photo_utils.get_reconcile_stats(),
+        "trash": photo_utils.get_trash_stats(),
+        "dedup": photo_utils.get_dedup_stats(),
+    }
+
+def _not_modified(request: Request, etag: str) -> bool:
+    """True if the request's If-None-Match already names this ETag"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+def _listing_etag(request: Request, current_user: User) -> str:
+    """
+    ETag for an index-backed JSON response: it changes with any index write,
+    with the caller (their access and signed URLs) and with the URL expiry window
+    """
+    source = "|".join([
+        str(photo_utils.get_index_version()), current_user.username, str(bool(current_user.admin)),
+        str(signed_urls.url_window()), request.url.path, request.url.query,
+    ])
+    return f'"{hashlib.sha256(source.encode()).hexdigest()[:32]}"'
+
+def _json_response(request: Request, current_user: User, build) -> Response:
+    """
+    304 if the client's copy is current, otherwise the JSON from build() with
+    its ETag; nothing is queried or serialized for a 304
+    """
+    etag = _listing_etag(request, current_user)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _not_modified(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return JSONResponse(content=build(), headers=headers)
+
 @app.get("/photos")
 async def get_photos(
+    request: Request,
     current_user: User = Depends(get_current_active_user),
     limit: int = 30,
     offset: int = 0,
@@ -412,56 +688,153 @@ async def get_photos(
     sort_by: str = "date",
     search: Optional[str] = None,
     date_from: Optional[str] = None,
-    date_to: Optional[str] = None
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    folder: Optional[str] = None
 ):
     """
     Get paginated photos with filtering and sorting
     
     Query parameters:
     - limit: Number of photos to return (default: 30, max: 100)
-    - offset: Number of photos to skip (default: 0)
+    - cursor: next_cursor from the previous response, to fetch the following page
+      (keep the other parameters the same)
+    - offset: Number of photos to skip (default: 0; ignored with cursor)
     - favorite: Filter by favorite status (true/false)
-    - sort_by: Sort field - "date", "name", or "size" (default: "date")
-    - search: Search in filename
+    - sort_by: Sort field - "date" (uploaded), "taken", "name", "size", or "relevance" when
+      searching (default: "date")
+    - search: Substring of the filename, original name or camera make/model
     - date_from: Filter by date from (ISO format)
     - date_to: Filter by date to (ISO format)
+    - folder: Only list this folder (your own, "global", or any folder for admins)
+    
+    Each photo's thumbnail_url and original_url are signed for the caller
+    (see python/signed_urls.py) and can be loaded without the bearer token.
+    Responses carry an ETag; If-None-Match gets 304 until the index changes.
     """
     username = current_user.username if not current_user.admin else None
     
-    return photo_utils.get_photos_paginated(
-        username=username,
-        limit=limit,
-        offset=offset,
-        favorite=favorite,
-        sort_by=sort_by,
-        search=search,
-        date_from=date_from,
-        date_to=date_to
+    def build_page():
+        try:
+            page = photo_utils.get_photos_paginated(
+                username=username,
+                limit=limit,
+                offset=offset,
+                favorite=favorite,
+                sort_by=sort_by,
+                search=search,
+                date_from=date_from,
+                date_to=date_to,
+                cursor=cursor,
+                folder=folder
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        page["photos"] = [_with_file_urls(photo, current_user) for photo in page["photos"]]
+        return page
+    
+    return _json_response(request, current_user, build_page)
+
+@app.get("/photos/timeline")
+async def get_photos_timeline(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    granularity: str = "month"
+):
+    """
+    Count photos per year, month or day taken (EXIF date, else upload date), newest first
+    
+    Query parameters:
+    - granularity: "year", "month" or "day" (default: "month")
+    
+    Each bucket's cursor opens GET /photos?sort_by=taken at that period.
+    """
+    username = current_user.username if not current_user.admin else None
+    
+    def build_timeline():
+        try:
+            return photo_utils.get_timeline(username=username, granularity=granularity)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    return _json_response(request, current_user, build_timeline)
+
+def _lookup_photo(filename: str, folder: Optional[str], current_user: User) -> Optional[Dict[str, Any]]:
+    """
+    Resolve a filename (optionally qualified by ?folder=) to its index record.
+    Admins search every folder; other users their own folder, then global.
+    """
+    lookup = f"{folder}/{filename}" if folder else filename
+    if current_user.admin:
+        return photo_utils.find_file_info(lookup)
+    return photo_utils.get_file_info(
+        lookup, current_user.username, folders=[current_user.username, photo_utils.GLOBAL_FOLDER]
     )
 
+def _with_file_urls(record: Dict[str, Any], current_user: User) -> Dict[str, Any]:
+    """Copy of an index record with signed thumbnail_url/original_url for this user"""
+    photo_data = record.copy()
+    photo_data.update(signed_urls.file_urls(record, current_user.username))
+    return photo_data
+
+async def _authorize_file_request(request: Request, kind: str, filename: str, folder: Optional[str]):
+    """
+    Resolve the user and index record for a /thumbnails or /uploads request.
+    A valid signed URL (as returned by /photos) stands in for the bearer token.
+    
+    Returns:
+        tuple: (user, file record, whether the request was signed)
+    """
+    if "sig" in request.query_params and folder:
+        file_info = photo_utils.find_file_info(f"{folder}/{filename}")
+        username = signed_urls.verify_signed_url(kind, file_info, request.query_params) if file_info else None
+        current_user = await get_user(username) if username else None
+        if not current_user or current_user.disabled:
+            raise HTTPException(status_code=403, detail="Invalid or expired signed URL")
+        signed = True
+    else:
+        current_user = await get_user_from_request(request, request.query_params.get("token"))
+        file_info = _lookup_photo(filename, folder, current_user)
+        signed = False
+    
+    if not file_info:
+        raise HTTPException(status_code=404, detail=f"{'Thumbnail' if kind == signed_urls.THUMBNAIL else 'Original'} file not found")
+    
+    # Admins can see files in any user's folder
+    file_folder = file_info.get("folder")
+    if not current_user.admin and file_folder != current_user.username and file_folder != photo_utils.GLOBAL_FOLDER:
+        raise HTTPException(status_code=403, detail="Access denied")
+    return current_user, file_info, signed
+
 @app.get("/photos/{filename}")
 async def get_photo_info(
     filename: str,
+    request: Request,
+    folder: Optional[str] = None,
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Get detailed information about a specific photo including metadata
-    """
-    photo_info = photo_utils.get_file_info(filename, current_user.username)
-    if not photo_info:
-        raise HTTPException(status_code=404, detail="Photo not found")
-    
-    # Check if user has permission to view this photo
-    photo_folder = photo_info.get("folder")
-    if not current_user.admin and photo_folder != current_user.username and photo_folder != "global":
-        raise HTTPException(status_code=403, detail="Access denied")
     
-    # Add URLs to response
-    photo_data = photo_info.copy()
-    photo_data["thumbnail_url"] = f"/thumbnails/{filename}" if photo_info.get("has_thumbnail") else None
-    photo_data["original_url"] = f"/uploads/{photo_info.get('file_path', '')}"
+    Pass `folder` when the same filename exists in several folders
+    (otherwise 409 lists the candidates). thumbnail_url and original_url are
+    signed for the caller and can be loaded without the bearer token.
+    Responses carry an ETag; If-None-Match gets 304 until the index changes.
+    """
+    def build_photo():
+        photo_info = _lookup_photo(filename, folder, current_user)
+        if not photo_info:
+            raise HTTPException(status_code=404, detail="Photo not found")
+        
+        # Check if user has permission to view this photo
+        photo_folder = photo_info.get("folder")
+        if not current_user.admin and photo_folder != current_user.username and photo_folder != "global":
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        return _with_file_urls(photo_info, current_user)
     
-    return photo_data
+    return _json_response(request, current_user, build_photo)
 
 @app.delete("/photos/{filename}")
 async def delete_photo(
@@ -469,7 +842,7 @@ async def delete_photo(
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Delete a photo
+    Move a photo to the trash (see /trash/restore)
     """
     username = current_user.username
     # ToDo: Check if user is admin and allow deletion of any photo
@@ -477,99 +850,278 @@ async def delete_photo(
     if not success:
         raise HTTPException(status_code=404, detail="Photo not found or permission denied")
     
-    return {"message": "Photo deleted successfully"}
+    return {"message": "Photo moved to trash"}
+
+def _preferred_thumbnail_format(request: Request) -> str:
+    """Pick WebP when the client's Accept header allows it, else JPEG"""
+    if "webp" not in photo_utils.THUMBNAIL_FORMATS:
+        return "jpeg"
+    for media_range in request.headers.get("accept", "").split(","):
+        media_type, _, params = media_range.strip().partition(";")
+        if media_type.strip().lower() != "image/webp":
+            continue
+        quality = params.replace(" ", "").partition("q=")[2]
+        try:
+            return "webp" if not quality or float(quality) > 0 else "jpeg"
+        except ValueError:
+            return "jpeg"
+    return "jpeg"
+
+def _file_response(path: str, media_type: Optional[str] = None, headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Respond with a file under photo_utils.UPLOADS_DIR, through nginx when
+    ACCEL_REDIRECT_PREFIX is set (nginx keeps our Content-Type and Cache-Control
+    and handles Range itself), otherwise from this process
+    """
+    relative_path = os.path.relpath(path, photo_utils.UPLOADS_DIR)
+    if not ACCEL_REDIRECT_PREFIX or relative_path.startswith(".."):
+        return FileResponse(path, media_type=media_type, headers=headers)
+    # No media_type for originals: nginx picks it from its mime.types, by extension
+    return Response(
+        media_type=media_type,
+        headers={**(headers or {}), "X-Accel-Redirect": f"{ACCEL_REDIRECT_PREFIX}/{quote(relative_path)}"}
+    )
 
 @app.get("/thumbnails/{filename}")
 async def get_thumbnail(
     filename: str,
-    current_user: User = Depends(get_current_active_user)
+    request: Request,
+    size: Optional[int] = None,
+    folder: Optional[str] = None
 ):
     """
     Get thumbnail for a photo
+    
+    `size` picks the smallest configured rendition (PHOTO_THUMBNAIL_SIZES,
+    default 128/256/1024/2048) at least that many pixels on its long edge;
+    without it the 256px grid thumbnail is returned. WebP is served to
+    clients whose Accept header includes image/webp, JPEG otherwise.
+    Pass `folder` when the same filename exists in several folders
+    (otherwise 409 lists the candidates).
+    
+    Thumbnails are generated in the background after upload. While that is
+    still running this returns 202 with {"status": "pending"}; poll again
+    (or watch thumbnail_status on /photos/{filename}).
+    
+    Authenticates with the bearer token, or with the signed thumbnail_url
+    from /photos; signed responses are cached as immutable until they expire.
+    The ETag follows the photo's content version, so If-None-Match gets 304
+    without touching the thumbnail.
     """
-    username = current_user.username
-    is_admin = current_user.admin
+    if size is not None and size < 1:
+        raise HTTPException(status_code=400, detail="size must be a positive number of pixels")
+    rendition_size = photo_utils.pick_thumbnail_size(size)
+    image_format = _preferred_thumbnail_format(request)
     
-    # For admin users, try to find the file in any user's folder
-    if is_admin:
-        # Find the file information to get the actual owner
-        file_info = photo_utils.find_file_info(filename)
-        if file_info:
-            file_owner = file_info.get("uploaded_by") or file_info.get("folder")
-            if file_owner:
-                # Try to get thumbnail from the file owner's folder
-                thumbnail_path = photo_utils.get_thumbnail_path(file_owner, filename)
-                
-                # If thumbnail doesn't exist, try to generate it
-                if not thumbnail_path and photo_utils.is_image(filename):
-                    original_file_path = photo_utils.get_file_original_path(filename)
-                    if original_file_path and os.path.exists(original_file_path):
-                        thumbnail_path = photo_utils.generate_thumbnail(file_owner, original_file_path)
-                
-                if thumbnail_path and os.path.exists(thumbnail_path):
-                    return FileResponse(
-                        thumbnail_path,
-                        media_type="image/jpeg",
-                        headers={"Cache-Control": "public, max-age=3600"}
-                    )
+    _, file_info, signed = await _authorize_file_request(request, signed_urls.THUMBNAIL, filename, folder)
+    headers = {
+        "ETag": f'"{signed_urls.content_version(file_info)}-{rendition_size}-{image_format}"',
+        # Cache for 1 hour, or for the life of a signed URL
+        "Cache-Control": signed_urls.cache_control(request.query_params) if signed else "public, max-age=3600",
+        "Vary": "Accept",
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
     
-    # Fallback to regular user logic or if admin logic fails
-    thumbnail_path = photo_utils.get_thumbnail_path(username, filename)
+    folder = file_info["folder"]
+    name = file_info["filename"]
+    thumbnail_path = photo_utils.get_thumbnail_path(folder, name, rendition_size, image_format)
     
     # Check if thumbnail exists
     if not thumbnail_path:
-        # Try to generate thumbnail if it doesn't exist and it's an image
-        if photo_utils.is_image(filename):
-            # Get the original file path
-            user_folder = photo_utils.get_user_folder_path(username)
-            original_file_path = os.path.join(user_folder, filename)
-            
-            # Check if original file exists
-            if os.path.exists(original_file_path):
-                # Generate thumbnail
-                thumbnail_path = photo_utils.generate_thumbnail(username, original_file_path)
-                if not thumbnail_path:
-                    raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
-            else:
-                raise HTTPException(status_code=404, detail="Original file not found")
-        else:
+        if not photo_utils.is_image(name):
             raise HTTPException(status_code=404, detail="Thumbnail not available for this file type")
-    
-    # Verify the thumbnail file exists
-    if not os.path.exists(thumbnail_path):
-        raise HTTPException(status_code=404, detail="Thumbnail not found")
+        
+        # Join the (single, shared) background job for this file for a moment;
+        # it also fills in renditions missing from files thumbnailed earlier
+        job = photo_utils.request_thumbnail(folder, name)
+        try:
+            renditions = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(job)), THUMBNAIL_WAIT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            return JSONResponse(
+                status_code=status.HTTP_202_ACCEPTED,
+                content={"status": "pending", "filename": name},
+                headers={"Retry-After": "1"}
+            )
+        thumbnail_path = photo_utils.get_thumbnail_path(folder, name, rendition_size, image_format)
+        if not renditions or not thumbnail_path:
+            raise HTTPException(status_code=500, detail="Failed to generate thumbnail")
     
     # Return the thumbnail file
-    return FileResponse(
+    return _file_response(
         thumbnail_path,
-        media_type="image/jpeg",
-        headers={"Cache-Control": "public, max-age=3600"}  # Cache for 1 hour
+        media_type=photo_utils.THUMBNAIL_FORMATS[image_format]["media_type"],
+        headers=headers
+    )
+
+@app.get("/uploads/{file_path:path}")
+async def get_original(file_path: str, request: Request):
+    """
+    Get an original file, by its file_path (folder/filename)
+    
+    Authenticates with the signed original_url from /photos, or with the
+    bearer token (header or ?token=); signed responses are cached as
+    immutable until they expire. The ETag is the file's content version:
+    If-None-Match gets 304 without touching the file, and Range / If-Range
+    requests get partial content.
+    """
+    folder, _, filename = file_path.rpartition("/")
+    _, file_info, signed = await _authorize_file_request(
+        request, signed_urls.ORIGINAL, filename, folder or None
+    )
+    headers = {
+        "ETag": f'"{signed_urls.content_version(file_info)}"',
+        "Cache-Control": signed_urls.cache_control(request.query_params) if signed else "private, no-cache",
+    }
+    if _not_modified(request, headers["ETag"]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    original_path = os.path.join(photo_utils.UPLOADS_DIR, file_info["folder"], file_info["filename"])
+    if not os.path.isfile(original_path):
+        raise HTTPException(status_code=404, detail="Original file not found")
+    
+    # FileResponse answers Range requests itself (206, or 416 when unsatisfiable)
+    return _file_response(original_path, headers=headers)
+
+class ThumbnailBatchRequest(BaseModel):
+    files: List[str]
+    size: Optional[int] = None
+
+@app.post("/thumbnails/batch")
+async def get_thumbnail_batch(
+    batch: ThumbnailBatchRequest,
+    request: Request,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Get many thumbnails in one response, for photo grids
+    
+    Body: {"files": ["folder/filename" or "filename", ...], "size": optional}
+    (at most photo_utils.THUMBNAIL_BATCH_LIMIT files). `size` and the Accept
+    header pick the rendition as for GET /thumbnails/{filename}.
+    
+    The response is a packed binary (see photo_utils.pack_thumbnail_batch):
+    a 4-byte big-endian index length, a JSON index with one item per
+    requested file (status "ready", "pending", "not_found", "forbidden",
+    "ambiguous" or "unavailable"; offset/length/media_type when ready, the
+    matching folder/filename keys when ambiguous), then the images.
+    Thumbnails still being generated are waited for up to
+    THUMBNAIL_WAIT_SECONDS, then reported as pending.
+    """
+    username = current_user.username
+    is_admin = current_user.admin
+    
+    if len(batch.files) > photo_utils.THUMBNAIL_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=400, detail=f"At most {photo_utils.THUMBNAIL_BATCH_LIMIT} files per batch"
+        )
+    if batch.size is not None and batch.size < 1:
+        raise HTTPException(status_code=400, detail="size must be a positive number of pixels")
+    rendition_size = photo_utils.pick_thumbnail_size(batch.size)
+    image_format = _preferred_thumbnail_format(request)
+    media_type = photo_utils.THUMBNAIL_FORMATS[image_format]["media_type"]
+    
+    # One index snapshot for the whole batch; a bare filename that several
+    # folders have fails only its own item
+    ambiguous: Dict[str, List[str]] = {}
+    records = photo_utils.get_files_info(batch.files, None if is_admin else username, ambiguous)
+    
+    def resolve(name: str) -> Dict[str, Any]:
+        file_info = records[name]
+        if name in ambiguous:
+            return {"file": name, "status": "ambiguous", "candidates": ambiguous[name]}
+        if not file_info:
+            return {"file": name, "status": "not_found"}
+        folder = file_info["folder"]
+        if not is_admin and folder != username and folder != photo_utils.GLOBAL_FOLDER:
+            return {"file": name, "status": "forbidden"}
+        path = photo_utils.get_thumbnail_path(folder, file_info["filename"], rendition_size, image_format)
+        if path:
+            return {"file": name, "status": "ready", "path": path, "media_type": media_type}
+        if not photo_utils.is_image(file_info["filename"]):
+            return {"file": name, "status": "unavailable"}
+        return {"file": name, "status": "pending", "folder": folder, "filename": file_info["filename"]}
+    
+    items = [resolve(name) for name in batch.files]
+    
+    # Start (or join) the background jobs for missing thumbnails and give
+    # them all one shared wait
+    jobs = {}
+    for item in items:
+        if item["status"] == "pending":
+            key = (item["folder"], item["filename"])
+            if key not in jobs:
+                jobs[key] = asyncio.wrap_future(photo_utils.request_thumbnail(*key))
+    if jobs:
+        await asyncio.wait(jobs.values(), timeout=THUMBNAIL_WAIT_SECONDS)
+        for item in items:
+            if item["status"] == "pending" and jobs[(item["folder"], item["filename"])].done():
+                path = photo_utils.get_thumbnail_path(item["folder"], item["filename"], rendition_size, image_format)
+                item.update(
+                    {"status": "ready", "path": path, "media_type": media_type} if path else {"status": "unavailable"}
+                )
+    
+    body = await asyncio.get_running_loop().run_in_executor(None, photo_utils.pack_thumbnail_batch, items)
+    return Response(
+        content=body,
+        media_type="application/octet-stream",
+        headers={"Cache-Control": "private, no-store", "Vary": "Accept"}
     )
 
 class BulkDeleteRequest(BaseModel):
     filenames: List[str]
 
+class BulkPhotoRequest(BaseModel):
+    action: str
+    filenames: List[str]
+
+@app.post("/photos/bulk")
+async def bulk_photo_action(
+    request: BulkPhotoRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Delete, favorite, unfavorite or move many photos to the global folder at once
+    
+    Body parameters:
+    - action: delete, favorite, unfavorite or move_to_global
+    - filenames: Filenames or folder/filename keys
+    """
+    if request.action not in photo_utils.BULK_ACTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"action must be one of: {', '.join(photo_utils.BULK_ACTIONS)}"
+        )
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, photo_utils.bulk_update_photos,
+        request.action, request.filenames, current_user.username, current_user.admin
+    )
+    failed_count = sum(1 for result in results if not result["success"])
+    return {
+        "success": failed_count == 0,
+        "action": request.action,
+        "succeeded_count": len(results) - failed_count,
+        "failed_count": failed_count,
+        "results": results
+    }
+
 @app.post("/photos/delete-multiple")
 async def delete_multiple_photos(
     request: BulkDeleteRequest,
     current_user: User = Depends(get_current_active_user)
 ):
     """
-    Delete multiple photos in bulk
+    Delete multiple photos in bulk (see /photos/bulk for other actions)
     """
-    username = current_user.username
-    successful_deletes = []
-    failed_deletes = []
-    
-    for filename in request.filenames:
-        try:
-            success = photo_utils.delete_file(filename, username, current_user.admin)
-            if success:
-                successful_deletes.append(filename)
-            else:
-                failed_deletes.append({"filename": filename, "error": "File not found or permission denied"})
-        except Exception as e:
-            failed_deletes.append({"filename": filename, "error": str(e)})
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, photo_utils.bulk_update_photos,
+        "delete", request.filenames, current_user.username, current_user.admin
+    )
+    successful_deletes = [result["filename"] for result in results if result["success"]]
+    failed_deletes = [{"filename": result["filename"], "error": result["error"]}
+                      for result in results if not result["success"]]
     
     return {
         "success": len(failed_deletes) == 0,
@@ -579,6 +1131,61 @@ async def delete_multiple_photos(
         "failed_deletes": failed_deletes
     }
 
+class TrashRequest(BaseModel):
+    filenames: Optional[List[str]] = None
+
+@app.get("/trash")
+async def get_trash(
+    limit: int = 500,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    List the user's deleted photos (every user's for admins), most recently deleted first
+    
+    Query parameters:
+    - limit: Number of items to return (default: 500, max: 5000)
+    """
+    items = photo_utils.get_trash(current_user.username, current_user.admin, min(max(limit, 1), 5000))
+    return {"items": items, "count": len(items), "retention_days": photo_utils.TRASH_RETENTION_DAYS}
+
+@app.post("/trash/restore")
+async def restore_from_trash(
+    request: TrashRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Move deleted photos back into the library
+    
+    Body parameters:
+    - filenames: Filenames or folder/filename keys of trashed photos
+    """
+    if not request.filenames:
+        raise HTTPException(status_code=400, detail="filenames is required")
+    results = await asyncio.get_running_loop().run_in_executor(
+        None, photo_utils.restore_photos, request.filenames, current_user.username, current_user.admin
+    )
+    failed_count = sum(1 for result in results if not result["success"])
+    return {
+        "success": failed_count == 0,
+        "restored_count": len(results) - failed_count,
+        "failed_count": failed_count,
+        "results": results
+    }
+
+@app.post("/trash/purge")
+async def purge_trash(
+    request: TrashRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Remove deleted photos for good without waiting for the retention window
+    
+    Body parameters:
+    - filenames (optional): Filenames or folder/filename keys; omitted empties the whole trash
+    """
+    scheduled = photo_utils.purge_trash(request.filenames, current_user.username, current_user.admin)
+    return {"success": True, "scheduled_count": scheduled}
+
 # Pydantic models for request/response
 class PhotoFavoriteRequest(BaseModel):
     is_favorite: bool
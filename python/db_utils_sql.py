@@ -5,10 +5,14 @@ Handles user management with SQLite database instead of JSON files.
 
 import os
 import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from passlib.context import CryptContext
 from database import database, users_table
 from sqlalchemy import select, insert, update, delete
-from typing import Dict, Optional, List
+from typing import Dict, Optional, List, Tuple
 
 # Password hashing with defensive bcrypt initialization
 try:
@@ -33,6 +37,54 @@ except Exception as e:
 ADMIN_USERNAME = os.environ.get("PHOTO_SERVER_ADMIN")
 ADMIN_PASSWORD = os.environ.get("PHOTO_SERVER_ADMIN_PASSWORD")
 
+# Seconds a cached principal stays valid. Changes to users_config.json and
+# user updates made through this module take effect immediately; the TTL
+# bounds how long database edits from other processes go unnoticed.
+PRINCIPAL_CACHE_TTL = float(os.environ.get("PRINCIPAL_CACHE_TTL", 60))
+
+# hashed_password reported for JSON config users. They sign in against the
+# plain text password in the config, so no hash is ever checked (or computed).
+UNUSABLE_PASSWORD_HASH = "!"
+
+# bcrypt runs on its own small pool so hashing never blocks the event loop
+# and a burst of logins can't occupy more than these threads
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+# Logins allowed in flight (running or waiting for a hash worker); beyond
+# this, and beyond the per-username / per-client caps, logins are refused
+LOGIN_QUEUE_LIMIT = int(os.environ.get("LOGIN_QUEUE_LIMIT", 16))
+LOGIN_PER_CLIENT_LIMIT = int(os.environ.get("LOGIN_PER_CLIENT_LIMIT", 2))
+
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_logins_in_flight = 0
+_logins_by_key: Dict[str, int] = {}
+
+class LoginThrottled(Exception):
+    """Raised when a login is refused because too many are already in progress"""
+
+# Principals resolved by get_user: username -> (expires at, user dict)
+_principal_cache: Dict[str, Tuple[float, Dict]] = {}
+_principal_cache_signature = None
+
+def _users_config_signature(config_file: str = "users_config.json") -> Optional[Tuple[int, int]]:
+    """mtime and size of the users configuration file, or None if it is missing"""
+    try:
+        stat = os.stat(os.path.join(os.path.dirname(os.path.dirname(__file__)), config_file))
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return None
+
+def invalidate_principal_cache(username: Optional[str] = None):
+    """
+    Drop cached principals after a user changes
+    
+    Args:
+        username (str, optional): User to drop; all users if omitted
+    """
+    if username is None:
+        _principal_cache.clear()
+    else:
+        _principal_cache.pop(username, None)
+
 def load_users_config(config_file: str = "users_config.json") -> List[Dict]:
     """
     Load user configuration from JSON file
@@ -96,6 +148,7 @@ def save_users_config(users: List[Dict], config_file: str = "users_config.json")
         
         with open(config_path, 'w') as f:
             json.dump(config, indent=2, fp=f)
+        invalidate_principal_cache()
         
         print(f"✅ Saved {len(users)} users to {config_file}")
         return True
@@ -164,7 +217,7 @@ async def ensure_default_users():
         
         if username not in db_users:
             # User exists in JSON but not in DB - add to DB
-            hashed_password = pwd_context.hash(password_to_use)
+            hashed_password = await hash_password_async(password_to_use)
             
             query = insert(users_table).values(
                 username=username,
@@ -203,6 +256,7 @@ async def ensure_default_users():
                 await database.execute(query)
                 print(f"🔄 Updated {username} in database from JSON config")
     
+    invalidate_principal_cache()
     print(f"✅ User synchronization complete - {len(json_users)} users active")
 
 async def load_users() -> Dict:
@@ -230,7 +284,35 @@ async def load_users() -> Dict:
 
 async def get_user(username: str) -> Optional[Dict]:
     """
-    Get a user by username - checks JSON config first, then database
+    Get a user by username - checks JSON config first, then database.
+    This runs on every authenticated request, so principals are cached until
+    users_config.json changes, the user is updated, or PRINCIPAL_CACHE_TTL passes.
+    
+    Args:
+        username (str): Username to look up
+        
+    Returns:
+        dict: User data if found, None otherwise
+    """
+    global _principal_cache_signature
+    signature = _users_config_signature()
+    if signature != _principal_cache_signature:
+        _principal_cache.clear()
+        _principal_cache_signature = signature
+    
+    cached = _principal_cache.get(username)
+    if cached is not None and cached[0] > time.monotonic():
+        return dict(cached[1])
+    
+    user = await _load_user(username)
+    if user:
+        _principal_cache[username] = (time.monotonic() + PRINCIPAL_CACHE_TTL, user)
+        return dict(user)
+    return None
+
+async def _load_user(username: str) -> Optional[Dict]:
+    """
+    Look a user up in the JSON config, then the database (uncached)
     
     Args:
         username (str): Username to look up
@@ -247,7 +329,7 @@ async def get_user(username: str) -> Optional[Dict]:
                 "username": user["username"],
                 "email": user["email"],
                 "full_name": user["full_name"],
-                "hashed_password": pwd_context.hash(user["password"]),  # Hash the plain text password
+                "hashed_password": UNUSABLE_PASSWORD_HASH,
                 "disabled": user.get("disabled", False),
                 "admin": user.get("admin", False),
             }
@@ -315,7 +397,7 @@ async def create_user(username: str, email: str, full_name: str, password: str,
         return False
     
     # Hash the password for database
-    hashed_password = pwd_context.hash(password)
+    hashed_password = await hash_password_async(password)
     
     # Insert the new user into database
     try:
@@ -329,6 +411,7 @@ async def create_user(username: str, email: str, full_name: str, password: str,
         )
         
         await database.execute(query)
+        invalidate_principal_cache(username)
         print(f"✅ Created user {username} in both JSON config and database")
         return True
         
@@ -337,6 +420,64 @@ async def create_user(username: str, email: str, full_name: str, password: str,
         # TODO: Remove from JSON config if database creation failed
         return False
 
+@contextmanager
+def admit_login(username: str, client_host: str):
+    """
+    Reserve a login slot, refusing immediately when the server is saturated
+    
+    Args:
+        username (str): Username being logged in
+        client_host (str): Client address (uvicorn resolves X-Forwarded-For from nginx)
+        
+    Raises:
+        LoginThrottled: If the global queue or the username's or client's cap is full
+    """
+    global _logins_in_flight
+    keys = [f"user:{username}", f"client:{client_host}"]
+    if _logins_in_flight >= LOGIN_QUEUE_LIMIT:
+        raise LoginThrottled("Too many logins in progress, try again shortly")
+    if any(_logins_by_key.get(key, 0) >= LOGIN_PER_CLIENT_LIMIT for key in keys):
+        raise LoginThrottled("Too many concurrent logins for this account or client")
+    
+    _logins_in_flight += 1
+    for key in keys:
+        _logins_by_key[key] = _logins_by_key.get(key, 0) + 1
+    try:
+        yield
+    finally:
+        _logins_in_flight -= 1
+        for key in keys:
+            _logins_by_key[key] -= 1
+            if not _logins_by_key[key]:
+                del _logins_by_key[key]
+
+async def hash_password_async(password: str) -> str:
+    """
+    Hash a password on the password pool
+    
+    Args:
+        password (str): Plain text password
+        
+    Returns:
+        str: bcrypt hash
+    """
+    return await asyncio.get_running_loop().run_in_executor(_password_executor, pwd_context.hash, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verify a password against its hash on the password pool
+    
+    Args:
+        plain_password (str): Plain text password to verify
+        hashed_password (str): Hashed password to verify against
+        
+    Returns:
+        bool: True if password matches, False otherwise
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _password_executor, verify_password, plain_password, hashed_password
+    )
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
     Verify a password against its hash
@@ -387,10 +528,14 @@ async def authenticate_user(username: str, password: str) -> Optional[Dict]:
                 "username": json_user["username"],
                 "email": json_user["email"],
                 "full_name": json_user["full_name"],
-                "hashed_password": pwd_context.hash(password),  # Hash for consistency
+                "hashed_password": UNUSABLE_PASSWORD_HASH,
                 "disabled": json_user.get("disabled", False),
                 "admin": json_user.get("admin", False)
             }
+        
+        # JSON config users have no other password to check
+        print(f"❌ Password verification failed for {username}")
+        return None
     
     # Fallback to database authentication (for hashed passwords)
     print(f"🔍 Checking database for {username}")
@@ -399,7 +544,7 @@ async def authenticate_user(username: str, password: str) -> Optional[Dict]:
         print(f"❌ User {username} not found in database")
         return None
     
-    if not verify_password(password, user["hashed_password"]):
+    if not await verify_password_async(password, user["hashed_password"]):
         print(f"❌ Password verification failed for {username}")
         return None
     
@@ -434,6 +579,7 @@ async def update_admin_status(admin_username: str, target_username: str, admin_s
     ).values(admin=admin_status)
     
     await database.execute(query)
+    invalidate_principal_cache(target_username)
     return True
 
 async def grant_admin_privileges(admin_username: str, target_username: str) -> bool:
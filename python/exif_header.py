@@ -0,0 +1,271 @@
+"""
+Header-only EXIF reader for the photo server backend.
+Maps the file read-only and walks just its headers: JPEG segment markers up
+to the APP1 "Exif" block and the frame header, PNG and WebP chunk headers up
+to the image data, or the IFDs of a TIFF-based file. The IFD entries are
+decoded in place with struct, so a photo costs a few page reads and a few
+kilobytes of memory however large the file is, and a multi-GB video with an
+image extension is rejected after its first bytes.
+"""
+
+import mmap
+import os
+import struct
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+# Marker and chunk walks give up this far into a file
+HEADER_SCAN_LIMIT = int(os.environ.get("PHOTO_EXIF_SCAN_LIMIT", 1024 * 1024))
+# Malformed or hostile IFDs can't make a read any bigger than this
+_MAX_IFD_ENTRIES = 512
+_MAX_VALUE_BYTES = 4096
+
+# TIFF field type -> (struct code, size in bytes)
+_FIELD_TYPES = {
+    1: ("B", 1),    # BYTE
+    2: ("s", 1),    # ASCII
+    3: ("H", 2),    # SHORT
+    4: ("I", 4),    # LONG
+    5: ("II", 8),   # RATIONAL
+    7: ("s", 1),    # UNDEFINED
+    9: ("i", 4),    # SLONG
+    10: ("ii", 8),  # SRATIONAL
+}
+
+# Tags read from IFD0, the Exif IFD and the GPS IFD
+_MAKE, _MODEL, _IMAGE_WIDTH, _IMAGE_LENGTH, _ORIENTATION = 0x010F, 0x0110, 0x0100, 0x0101, 0x0112
+_EXIF_IFD, _GPS_IFD = 0x8769, 0x8825
+_DATE_TIME_ORIGINAL, _ISO, _EXPOSURE_TIME, _F_NUMBER, _FOCAL_LENGTH = 0x9003, 0x8827, 0x829A, 0x829D, 0x920A
+_GPS_LATITUDE_REF, _GPS_LATITUDE, _GPS_LONGITUDE_REF, _GPS_LONGITUDE = 1, 2, 3, 4
+_GPS_ALTITUDE_REF, _GPS_ALTITUDE = 5, 6
+
+# JPEG start-of-frame markers (SOF0-SOF15 minus DHT, JPG and DAC)
+_SOF_MARKERS = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _read_ifd(data, tiff: int, end: int, offset: int, endian: str) -> Dict[int, Any]:
+    """
+    Decode one IFD of a TIFF block
+
+    Args:
+        data: The mapped file
+        tiff (int): Position of the TIFF header; IFD offsets are relative to it
+        end (int): End of the TIFF block
+        offset (int): Offset of the IFD
+        endian (str): struct byte order, "<" or ">"
+
+    Returns:
+        dict: Tag -> value (int, str, bytes, (numerator, denominator) or a tuple of these)
+    """
+    position = tiff + offset
+    if offset <= 0 or position + 2 > end:
+        return {}
+    count = min(struct.unpack_from(endian + "H", data, position)[0], _MAX_IFD_ENTRIES)
+    tags = {}
+    for entry in range(position + 2, min(position + 2 + count * 12, end - 11), 12):
+        tag, field_type, values = struct.unpack_from(endian + "HHI", data, entry)
+        if field_type not in _FIELD_TYPES:
+            continue
+        code, size = _FIELD_TYPES[field_type]
+        length = size * values
+        if length > _MAX_VALUE_BYTES:
+            continue  # MakerNote and other large blobs
+        start = entry + 8 if length <= 4 else tiff + struct.unpack_from(endian + "I", data, entry + 8)[0]
+        if start + length > end:
+            continue
+        if code == "s":
+            raw = data[start:start + length]
+            tags[tag] = raw.split(b"\x00", 1)[0].decode("utf-8", errors="ignore").strip() if field_type == 2 else raw
+            continue
+        items = struct.unpack_from(endian + code * values, data, start)
+        if len(code) == 2:
+            items = tuple(zip(items[::2], items[1::2]))
+        tags[tag] = items[0] if values == 1 else items
+    return tags
+
+def _read_tiff(data, tiff: int, end: int) -> Dict[str, Dict[int, Any]]:
+    """IFD0, Exif and GPS tags of the TIFF block at data[tiff:end]"""
+    byte_order = data[tiff:tiff + 2]
+    endian = {b"II": "<", b"MM": ">"}.get(byte_order)
+    if endian is None or tiff + 8 > end or struct.unpack_from(endian + "H", data, tiff + 2)[0] != 42:
+        return {}
+    ifd0 = _read_ifd(data, tiff, end, struct.unpack_from(endian + "I", data, tiff + 4)[0], endian)
+    ifds = {"0th": ifd0}
+    for name, pointer in (("Exif", _EXIF_IFD), ("GPS", _GPS_IFD)):
+        if isinstance(ifd0.get(pointer), int):
+            ifds[name] = _read_ifd(data, tiff, end, ifd0[pointer], endian)
+    return ifds
+
+def _scan_jpeg(data) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """
+    Walk JPEG segment headers up to the start of scan
+
+    Returns:
+        tuple: ((TIFF start, TIFF end) of the APP1 Exif block, (width, height)), either may be None
+    """
+    limit = min(len(data), HEADER_SCAN_LIMIT)
+    position, exif, size = 2, None, None
+    while position + 4 <= limit and (exif is None or size is None):
+        if data[position] != 0xFF:
+            break
+        marker = data[position + 1]
+        if marker == 0xFF:
+            position += 1  # Fill byte
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            position += 2  # Markers without a length
+            continue
+        if marker in (0xD9, 0xDA):
+            break  # End of image or start of the compressed data
+        length = struct.unpack_from(">H", data, position + 2)[0]
+        segment = position + 4
+        if marker == 0xE1 and exif is None and data[segment:segment + 6] == b"Exif\x00\x00":
+            exif = (segment + 6, min(position + 2 + length, len(data)))
+        elif marker in _SOF_MARKERS and size is None and segment + 5 <= len(data):
+            height, width = struct.unpack_from(">HH", data, segment + 1)
+            size = (width, height)
+        position += 2 + length
+    return exif, size
+
+def _scan_png(data) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """PNG counterpart of _scan_jpeg: the eXIf chunk and the IHDR size"""
+    limit = min(len(data), HEADER_SCAN_LIMIT)
+    position, exif, size = 8, None, None
+    while position + 8 <= limit:
+        length, chunk = struct.unpack_from(">I4s", data, position)
+        start = position + 8
+        if chunk == b"IHDR" and start + 8 <= len(data):
+            size = struct.unpack_from(">II", data, start)
+        elif chunk == b"eXIf":
+            exif = (start, min(start + length, len(data)))
+        elif chunk in (b"IDAT", b"IEND"):
+            break
+        position = start + length + 4  # Data and CRC
+    return exif, size
+
+def _scan_webp(data) -> Tuple[Optional[Tuple[int, int]], Optional[Tuple[int, int]]]:
+    """WebP counterpart of _scan_jpeg: the EXIF chunk and the VP8X canvas size"""
+    limit = min(len(data), HEADER_SCAN_LIMIT)
+    position, exif, size = 12, None, None
+    while position + 8 <= limit:
+        chunk, length = struct.unpack_from("<4sI", data, position)
+        start = position + 8
+        if chunk == b"VP8X" and start + 10 <= len(data):
+            width = int.from_bytes(data[start + 4:start + 7], "little") + 1
+            height = int.from_bytes(data[start + 7:start + 10], "little") + 1
+            size = (width, height)
+        elif chunk == b"EXIF":
+            # Some writers keep the JPEG "Exif\0\0" prefix
+            if data[start:start + 6] == b"Exif\x00\x00":
+                start += 6
+            exif = (start, min(position + 8 + length, len(data)))
+        position += 8 + length + (length & 1)  # Chunks are padded to even sizes
+    return exif, size
+
+def read_exif(path: str) -> Tuple[Dict[str, Dict[int, Any]], Optional[Tuple[int, int]]]:
+    """
+    Read the raw EXIF tags and pixel size from a file's headers
+
+    Args:
+        path (str): Path to a JPEG, PNG, WebP or TIFF-based (TIFF, DNG and most raw) file
+
+    Returns:
+        tuple: ({"0th", "Exif", "GPS"} tag dicts, present only if found; (width, height) or None)
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return {}, None  # Empty file
+    with data:
+        head = data[:12]
+        if head.startswith(b"\xff\xd8"):
+            exif, size = _scan_jpeg(data)
+        elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+            exif, size = _scan_png(data)
+        elif head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+            exif, size = _scan_webp(data)
+        elif head[:4] in (b"II*\x00", b"MM\x00*"):
+            exif, size = (0, len(data)), None
+        else:
+            return {}, None
+        tags = _read_tiff(data, *exif) if exif else {}
+    if size is None and isinstance(tags.get("0th", {}).get(_IMAGE_WIDTH), int):
+        size = (tags["0th"][_IMAGE_WIDTH], tags["0th"].get(_IMAGE_LENGTH, 0))
+    return tags, size
+
+def _ratio(value) -> Optional[float]:
+    """A (numerator, denominator) rational as a float, or None"""
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], int) and value[1]:
+        return value[0] / value[1]
+    return None
+
+def _gps_degrees(value, reference: Any, negative: str) -> Optional[float]:
+    """Degrees, minutes and seconds rationals as signed decimal degrees"""
+    if not isinstance(value, tuple) or len(value) != 3:
+        return None
+    parts = [_ratio(part) for part in value]
+    if None in parts:
+        return None
+    degrees = parts[0] + parts[1] / 60 + parts[2] / 3600
+    return round(-degrees if reference == negative else degrees, 7)
+
+def _fraction(value) -> Optional[str]:
+    """A rational as "numerator/denominator", the format the photo index has always used"""
+    if isinstance(value, tuple) and len(value) == 2 and isinstance(value[0], int):
+        return f"{value[0]}/{value[1]}"
+    return None
+
+def extract_metadata(path: str) -> Dict[str, Any]:
+    """
+    Photo metadata from a file's EXIF headers
+
+    Args:
+        path (str): Path to the image file
+
+    Returns:
+        dict: camera_make, camera_model, width, height, resolution, orientation, date_taken,
+        iso, exposure_time, f_number, focal_length, has_gps and gps_latitude,
+        gps_longitude and gps_altitude (decimal degrees and meters) where present
+    """
+    tags, size = read_exif(path)
+    ifd0, exif, gps = tags.get("0th", {}), tags.get("Exif", {}), tags.get("GPS", {})
+    metadata: Dict[str, Any] = {}
+
+    for key, value in (("camera_make", ifd0.get(_MAKE)), ("camera_model", ifd0.get(_MODEL))):
+        if isinstance(value, str) and value:
+            metadata[key] = value
+    if size is not None:
+        metadata["width"], metadata["height"] = size
+        metadata["resolution"] = f"{size[0]}x{size[1]}"
+    if isinstance(ifd0.get(_ORIENTATION), int):
+        metadata["orientation"] = ifd0[_ORIENTATION]
+
+    date_taken = exif.get(_DATE_TIME_ORIGINAL)
+    if isinstance(date_taken, str) and date_taken:
+        try:
+            metadata["date_taken"] = datetime.strptime(date_taken, "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            metadata["date_taken"] = date_taken
+    iso = exif.get(_ISO)
+    if isinstance(iso, tuple):
+        iso = iso[0] if iso else None
+    if isinstance(iso, int):
+        metadata["iso"] = iso
+    for key, tag, suffix in (("exposure_time", _EXPOSURE_TIME, ""), ("f_number", _F_NUMBER, ""),
+                             ("focal_length", _FOCAL_LENGTH, "mm")):
+        value = _fraction(exif.get(tag))
+        if value is not None:
+            metadata[key] = value + suffix
+
+    metadata["has_gps"] = bool(gps)
+    latitude = _gps_degrees(gps.get(_GPS_LATITUDE), gps.get(_GPS_LATITUDE_REF), "S")
+    longitude = _gps_degrees(gps.get(_GPS_LONGITUDE), gps.get(_GPS_LONGITUDE_REF), "W")
+    if latitude is not None and longitude is not None:
+        metadata["gps_latitude"] = latitude
+        metadata["gps_longitude"] = longitude
+        altitude = _ratio(gps.get(_GPS_ALTITUDE))
+        if altitude is not None:
+            # Reference 1 means below sea level
+            below = gps.get(_GPS_ALTITUDE_REF) in (1, b"\x01")
+            metadata["gps_altitude"] = round(-altitude if below else altitude, 2)
+    return metadata
@@ -3,143 +3,113 @@ Photo manager utility module for the photo server backend.
 Handles all operations related to photos including:
 - Saving uploaded photos
 - Retrieving photo information
-- Managing photo metadata
+- Managing photo metadata in the SQLite photo index
 """
 
 import os
+import errno
 import shutil
-from datetime import datetime
-from typing import List, Dict, Optional, Any
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Any, Tuple, AsyncIterator, Iterator, Callable
 import json
-from PIL import Image, ImageOps
+import heapq
+import itertools
+import math
+import base64
+import hashlib
+import uuid
+import threading
+import time
+from PIL import Image, ImageOps, features
 import logging
-import piexif
-import exifread
+from sqlalchemy import select, insert, update, delete, func, tuple_, or_, case, table, column, literal_column, bindparam, true
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from python import exif_header
+from database import (
+    photos_table, photo_index_state_table, photo_day_counts_table, photo_trash_table, get_sync_engine, init_database,
+    PHOTO_SEARCH_TABLE, search_index_available,
+)
+# inotify lets the reconciler react to changes instead of waiting for its next sweep
 try:
-    import piexif
-    import exifread
-    EXIF_AVAILABLE = True
+    from inotify_simple import INotify, flags as inotify_flags
+    INOTIFY_AVAILABLE = True
 except ImportError:
-    EXIF_AVAILABLE = False
-    print("Warning: EXIF libraries not available. Install with: pip install piexif exifread")
+    INOTIFY_AVAILABLE = False
+
+# Encoders for thumbnail renditions; WebP is only offered when Pillow was built with it
+_ALL_THUMBNAIL_FORMATS = {
+    "jpeg": {"extension": "jpg", "pil_format": "JPEG", "media_type": "image/jpeg",
+             "options": {"quality": 85, "optimize": True}},
+    "webp": {"extension": "webp", "pil_format": "WEBP", "media_type": "image/webp",
+             "options": {"quality": 80, "method": 4}},
+}
+THUMBNAIL_FORMATS = {
+    name: settings for name, settings in _ALL_THUMBNAIL_FORMATS.items()
+    if name == "jpeg" or features.check("webp")
+}
 
 # Default configuration
 UPLOADS_DIR = "/mnt/photos"
 GLOBAL_FOLDER = "global"
 METADATA_FILE = os.path.join(UPLOADS_DIR, "metadata.json")
 DEFAULT_THUMBNAIL_SIZE = 256  # Default thumbnail size in pixels
+# Rendition sizes generated for every image (grid, retina grid, viewer, full screen)
+THUMBNAIL_SIZES = tuple(sorted(
+    {int(size) for size in os.environ.get("PHOTO_THUMBNAIL_SIZES", "128,256,1024,2048").split(",") if size.strip()}
+    | {DEFAULT_THUMBNAIL_SIZE}
+))
+# Decode JPEGs at reduced resolution (DCT scaling) when only thumbnails are needed
+THUMBNAIL_FAST_DECODE = os.environ.get("PHOTO_THUMBNAIL_FAST_DECODE", "1") != "0"
+# reducing_gap passed to Image.thumbnail(): it reduce()s by integer factors until
+# within this factor of the target, then finishes with LANCZOS (2.0 is Pillow's default)
+THUMBNAIL_REDUCING_GAP = float(os.environ.get("PHOTO_THUMBNAIL_REDUCING_GAP", 2.0))
+UPLOAD_CHUNK_SIZE = 4 * 1024 * 1024  # 4MB chunks for better handling of large files
+# Worker threads for CPU-heavy upload steps (EXIF parsing, thumbnails)
+MEDIA_WORKERS = int(os.environ.get("PHOTO_MEDIA_WORKERS", 2))
+# Worker threads for background thumbnail generation
+THUMBNAIL_WORKERS = int(os.environ.get("PHOTO_THUMBNAIL_WORKERS", 2))
+# Seconds between WAL checkpoints of the photo index (each one is a single fsync)
+INDEX_CHECKPOINT_INTERVAL = float(os.environ.get("PHOTO_INDEX_CHECKPOINT_INTERVAL", 2.0))
+# Seconds between reconciler sweeps that pick up files changed outside the server
+RECONCILE_INTERVAL = float(os.environ.get("PHOTO_RECONCILE_INTERVAL", 60.0))
+# Files named by inotify events are reconciled once they have been quiet this long,
+# so copies in progress and the server's own uploads have settled first
+RECONCILE_SETTLE_SECONDS = 2.0
+# Deleted photos stay restorable in the trash this many days before their files are purged
+TRASH_RETENTION_DAYS = float(os.environ.get("PHOTO_TRASH_RETENTION_DAYS", 30))
+# I/O budget of the trash purger: bytes of files unlinked per second, on average
+TRASH_PURGE_BYTES_PER_SECOND = int(os.environ.get("PHOTO_TRASH_PURGE_BYTES_PER_SECOND", 64 * 1024 * 1024))
+
+# Bounded pools that keep upload work off the event loop: disk writes go to
+# the I/O pool, EXIF parsing, indexing and thumbnailing to the media pool
+_upload_io_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload-io")
+_media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+# Thumbnails are generated in the background, one in-flight job per file
+_thumbnail_executor = ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnail")
+_thumbnail_jobs: Dict[Tuple[str, str], Future] = {}
+_thumbnail_jobs_lock = threading.Lock()
 
 def extract_exif_metadata(image_path: str) -> Dict[str, Any]:
     """
     Extract EXIF metadata from an image file
     
+    Only the file's headers are read (see exif_header), so large files and
+    bulk reindexing never pull whole images into memory.
+    
     Args:
         image_path (str): Path to the image file
         
     Returns:
-        dict: Dictionary containing EXIF metadata
+        dict: Dictionary containing EXIF metadata, including GPS coordinates when present
     """
     metadata = {}
     
     try:
-        # Try using piexif first
-        import piexif
-        
-        with open(image_path, 'rb') as f:
-            exif_dict = piexif.load(f.read())
-        
-        # Extract common EXIF data
-        if "0th" in exif_dict:
-            ifd = exif_dict["0th"]
-            
-            # Camera make and model
-            if piexif.ImageIFD.Make in ifd:
-                metadata["camera_make"] = ifd[piexif.ImageIFD.Make].decode('utf-8', errors='ignore')
-            if piexif.ImageIFD.Model in ifd:
-                metadata["camera_model"] = ifd[piexif.ImageIFD.Model].decode('utf-8', errors='ignore')
-            
-            # Image dimensions
-            if piexif.ImageIFD.ImageWidth in ifd:
-                metadata["width"] = ifd[piexif.ImageIFD.ImageWidth]
-            if piexif.ImageIFD.ImageLength in ifd:
-                metadata["height"] = ifd[piexif.ImageIFD.ImageLength]
-            
-            # Orientation
-            if piexif.ImageIFD.Orientation in ifd:
-                metadata["orientation"] = ifd[piexif.ImageIFD.Orientation]
-        
-        if "Exif" in exif_dict:
-            exif_ifd = exif_dict["Exif"]
-            
-            # Date taken
-            if piexif.ExifIFD.DateTimeOriginal in exif_ifd:
-                date_str = exif_ifd[piexif.ExifIFD.DateTimeOriginal].decode('utf-8', errors='ignore')
-                try:
-                    metadata["date_taken"] = datetime.strptime(date_str, "%Y:%m:%d %H:%M:%S").isoformat()
-                except ValueError:
-                    metadata["date_taken"] = date_str
-            
-            # ISO speed
-            if piexif.ExifIFD.ISOSpeedRatings in exif_ifd:
-                metadata["iso"] = exif_ifd[piexif.ExifIFD.ISOSpeedRatings]
-            
-            # Exposure time
-            if piexif.ExifIFD.ExposureTime in exif_ifd:
-                exposure = exif_ifd[piexif.ExifIFD.ExposureTime]
-                metadata["exposure_time"] = f"{exposure[0]}/{exposure[1]}"
-            
-            # F-number (aperture)
-            if piexif.ExifIFD.FNumber in exif_ifd:
-                f_number = exif_ifd[piexif.ExifIFD.FNumber]
-                metadata["f_number"] = f"{f_number[0]}/{f_number[1]}"
-            
-            # Focal length
-            if piexif.ExifIFD.FocalLength in exif_ifd:
-                focal = exif_ifd[piexif.ExifIFD.FocalLength]
-                metadata["focal_length"] = f"{focal[0]}/{focal[1]}mm"
-        
-        # GPS data
-        if "GPS" in exif_dict:
-            gps_ifd = exif_dict["GPS"]
-            if gps_ifd:
-                metadata["has_gps"] = True
-                # Extract GPS coordinates if needed (more complex parsing)
-            else:
-                metadata["has_gps"] = False
-        else:
-            metadata["has_gps"] = False
-            
-    except ImportError:
-        # Fallback to exifread if piexif not available
-        try:
-            import exifread
-            
-            with open(image_path, 'rb') as f:
-                tags = exifread.process_file(f, details=False)
-            
-            # Extract basic information
-            if 'Image Make' in tags:
-                metadata["camera_make"] = str(tags['Image Make'])
-            if 'Image Model' in tags:
-                metadata["camera_model"] = str(tags['Image Model'])
-            if 'EXIF DateTimeOriginal' in tags:
-                metadata["date_taken"] = str(tags['EXIF DateTimeOriginal'])
-            if 'EXIF ISOSpeedRatings' in tags:
-                metadata["iso"] = str(tags['EXIF ISOSpeedRatings'])
-            if 'EXIF ExposureTime' in tags:
-                metadata["exposure_time"] = str(tags['EXIF ExposureTime'])
-            if 'EXIF FNumber' in tags:
-                metadata["f_number"] = str(tags['EXIF FNumber'])
-            if 'EXIF FocalLength' in tags:
-                metadata["focal_length"] = str(tags['EXIF FocalLength'])
-            if 'Image ImageWidth' in tags:
-                metadata["width"] = str(tags['Image ImageWidth'])
-            if 'Image ImageLength' in tags:
-                metadata["height"] = str(tags['Image ImageLength'])
-                
-        except ImportError:
-            # No EXIF libraries available
-            pass
+        metadata = exif_header.extract_metadata(image_path)
     except Exception as e:
         # Log error but don't fail
         logging.warning(f"Failed to extract EXIF data from {image_path}: {str(e)}")
@@ -217,503 +187,1490 @@ def ensure_user_folder(username: str):
 
 def ensure_upload_dir():
     """
-    Ensures that the uploads directory and global folder exist
+    Ensures that the uploads directory, global folder and photo index exist
     """
     os.makedirs(UPLOADS_DIR, exist_ok=True)
     os.makedirs(get_global_folder_path(), exist_ok=True)
-    if not os.path.exists(METADATA_FILE):
-        with open(METADATA_FILE, "w") as f:
-            json.dump({}, f)
+    ensure_photo_index()
+
+_index_ready = False
 
-def load_metadata() -> Dict[str, Any]:
+def ensure_photo_index():
     """
-    Load the photo metadata from the JSON file
-    
-    Returns:
-        dict: Dictionary with photo metadata
+    Ensure the photo index table exists and the legacy metadata.json has been imported
     """
-    ensure_upload_dir()
+    global _index_ready
+    if _index_ready:
+        return
+    init_database()
+    migrate_metadata_json()
+    with _index_write() as conn:
+        # Rows indexed before thumbnail_status existed only had has_thumbnail
+        conn.execute(
+            update(photos_table)
+            .where(photos_table.c.has_thumbnail, photos_table.c.thumbnail_status == "none")
+            .values(thumbnail_status="ready")
+        )
+        # Rows indexed before taken_at existed
+        missing = conn.execute(
+            select(photos_table.c.id, photos_table.c.upload_date, photos_table.c.metadata_json)
+            .where(photos_table.c.taken_at.is_(None))
+        ).all()
+        if missing:
+            conn.execute(
+                update(photos_table).where(photos_table.c.id == bindparam("row_id")).values(taken_at=bindparam("taken")),
+                [
+                    {"row_id": row.id, "taken": _taken_at({
+                        "upload_date": row.upload_date,
+                        "metadata": json.loads(row.metadata_json) if row.metadata_json else {},
+                    })}
+                    for row in missing
+                ],
+            )
+        _index_changed(None)
+    _index_ready = True
+
+# Process-local snapshot of the photo index, tagged with the index version
+# (photo_index_state.version) it reflects. Writes made by this process patch
+# the snapshot with just the rows they touched; when another process has
+# moved the version, the next read rebuilds the snapshot from scratch.
+_metadata_cache_lock = threading.Lock()
+_metadata_cache: Dict[str, Any] = {
+    "version": None,
+    "records": {},      # unique_key -> record
+    "order": {},        # unique_key -> (upload_date, id), the listing sort key
+    "by_filename": {},  # bare filename -> [record], oldest first
+}
+_metadata_cache_stats = {"hits": 0, "misses": 0, "patches": 0}
+# Index transactions committed by this process
+_index_writes = 0
+
+class AmbiguousFilenameError(LookupError):
+    """A bare filename matches files in more than one folder"""
+    
+    def __init__(self, filename: str, candidates: List[str]):
+        self.filename = filename
+        self.candidates = candidates
+        super().__init__(
+            f"'{filename}' matches {len(candidates)} files ({', '.join(candidates)}); "
+            "specify the folder"
+        )
+
+# Photo index writes. The database runs in WAL mode with synchronous=NORMAL:
+# every commit appends only the changed pages to the journal, and the journal
+# is fsynced and folded back into the database file by a periodic checkpoint.
+# A burst of favorites or deletes therefore costs one fsync, and a power loss
+# can only drop the last few commits, never leave a half-written index.
+_index_batch = threading.local()
+_maintenance_stop = threading.Event()
+_maintenance_thread: Optional[threading.Thread] = None
+
+@contextmanager
+def _index_transaction():
+    """
+    Run photo index writes in one transaction, bump the index version and
+    patch the cached snapshot with the rows the writes reported changing
+    """
+    _index_batch.changed = set()
     try:
-        with open(METADATA_FILE, "r") as f:
-            return json.load(f)
-    except (json.JSONDecodeError, FileNotFoundError):
-        # Return empty dict if file doesn't exist or is invalid
-        return {}
+        with get_sync_engine().begin() as conn:
+            _index_batch.conn = conn
+            yield conn
+            version = conn.execute(
+                update(photo_index_state_table)
+                .values(version=photo_index_state_table.c.version + 1)
+                .returning(photo_index_state_table.c.version)
+            ).scalar_one()
+            changed = _index_batch.changed
+            rows = []
+            if changed is not None:
+                keys = list(changed)
+                # Stay well below SQLite's bound-parameter limit
+                for i in range(0, len(keys), 500):
+                    rows.extend(conn.execute(
+                        select(photos_table).where(photos_table.c.unique_key.in_(keys[i:i + 500]))
+                    ).all())
+        _patch_metadata_cache(version, changed, rows)
+    finally:
+        _index_batch.conn = None
+        _index_batch.changed = None
+
+@contextmanager
+def _index_write():
+    """
+    Connection for a photo index write, joining the thread's open one if there is one.
+    Callers report the keys they touch with _index_changed().
+    """
+    conn = getattr(_index_batch, "conn", None)
+    if conn is not None:
+        yield conn
+        return
+    with _index_transaction() as conn:
+        yield conn
 
-def save_metadata(metadata: Dict[str, Any]):
+def _index_changed(unique_keys: Optional[List[str]] = None):
     """
-    Save the photo metadata to the JSON file
+    Record which index rows the current write touched
     
     Args:
-        metadata (dict): Dictionary with photo metadata
+        unique_keys (list): Keys inserted, updated or deleted; None if unknown
+            (the cached snapshot is then rebuilt instead of patched)
     """
-    ensure_upload_dir()
-    with open(METADATA_FILE, "w") as f:
-        json.dump(metadata, f, indent=4)
+    changed = _index_batch.changed
+    if unique_keys is None or changed is None:
+        _index_batch.changed = None
+    else:
+        changed.update(unique_keys)
 
-def save_uploaded_file(file_obj, filename: str, username: str) -> Dict[str, Any]:
+def _record_key(record: Dict[str, Any]) -> str:
+    """Unique key ("folder/filename") of a cached record"""
+    return f"{record['folder']}/{record['filename']}"
+
+def _patch_metadata_cache(version: int, changed: Optional[set], rows: List[Any]):
     """
-    Save an uploaded file and update metadata
+    Apply one committed index transaction to the cached snapshot
     
     Args:
-        file_obj: The file object from FastAPI
-        filename (str): The filename to save
-        username (str): The username of the uploader
-        
-    Returns:
-        dict: Metadata for the saved file
+        version (int): Index version the transaction committed
+        changed (set): Keys the transaction touched, or None if unknown
+        rows: Current rows for those keys (missing keys were deleted)
     """
-    ensure_upload_dir()
-    ensure_user_folder(username)
-    
-    # Get user's folder path
-    user_folder = get_user_folder_path(username)
-    
-    # Generate a unique filename if needed
-    if os.path.exists(os.path.join(user_folder, filename)):
-        name, ext = os.path.splitext(filename)
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{name}_{timestamp}{ext}"
-    
-    # Save the file with proper error handling
-    file_path = os.path.join(user_folder, filename)
-    try:
-        # Print some debug info
-        print(f"Starting upload of file: {filename} by user: {username} to {user_folder}")
-        
-        # Larger chunk size for better performance with large files
-        chunk_size = 4 * 1024 * 1024  # 4MB chunks for better handling of large files
-        bytes_written = 0
-        
-        # Check if we can read from the file object (this will fail if file is closed or invalid)
-        try:
-            # Try to get current position to verify file object is valid
-            current_pos = file_obj.tell()
-        except Exception as e:
-            print(f"Error accessing file object: {str(e)}")
-            raise IOError(f"Invalid file object: {str(e)}") from e
-        
-        with open(file_path, "wb") as buffer:
-            # Read and write in chunks to handle large files better
-            try:
-                while chunk := file_obj.read(chunk_size):
-                    buffer.write(chunk)
-                    bytes_written += len(chunk)
-                    
-                    # Log progress for very large files
-                    if bytes_written % (100 * 1024 * 1024) == 0:  # Log every 100MB
-                        print(f"Upload progress for {filename}: {bytes_written / (1024 * 1024):.1f}MB written")
-            except Exception as chunk_error:
-                print(f"Error during chunk read/write: {str(chunk_error)}")
-                raise IOError(f"Upload failed during file transfer: {str(chunk_error)}") from chunk_error
-                
-        print(f"Upload complete for {filename}: Total size {bytes_written / (1024 * 1024):.2f} MB")
-        
-        # Get file size
-        file_size = os.path.getsize(file_path)
-        print(f"Upload complete. File size: {file_size} bytes")
-        
-    except Exception as e:
-        # If something goes wrong, clean up partial file and re-raise
-        print(f"Error during file upload: {str(e)}")
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Removed partial file: {file_path}")
+    global _index_writes
+    with _metadata_cache_lock:
+        _index_writes += 1
+        cache = _metadata_cache
+        if changed is None or cache["version"] is None or cache["version"] != version - 1:
+            # Unknown change, or another writer got in between: rebuild on next read
+            cache["version"] = None
+            return
+        _metadata_cache_stats["patches"] += 1
         
-        # Add more diagnostic information to the error
-        error_details = str(e)
-        if hasattr(file_obj, 'file'):
-            error_details += f" (File object type: {type(file_obj).__name__}, File attribute type: {type(file_obj.file).__name__})"
+        records, order = cache["records"], cache["order"]
+        removed = [records.pop(key) for key in changed if key in records]
+        added = []
+        for row in rows:
+            record = _row_to_record(row)
+            records[row.unique_key] = record
+            order[row.unique_key] = (row.upload_date, row.id)
+            added.append(record)
+        for key in changed:
+            if key not in records:
+                order.pop(key, None)
         
-        raise IOError(f"File upload failed: {error_details}") from e
-    
-    # Update metadata with folder info
-    metadata = load_metadata()
-    file_metadata = {
-        "filename": filename,
-        "original_name": filename,
-        "uploaded_by": username,
-        "upload_date": datetime.now().isoformat(),
-        "upload_time": datetime.now().isoformat(),  # Alias for compatibility
-        "file_size": file_size,
-        "size": format_file_size(file_size),
-        "file_type": os.path.splitext(filename)[1].lower()[1:],
-        "folder": username,  # Track which folder the file is in
-        "file_path": os.path.join(username, filename),  # Relative path from photos root
-        "is_favorite": False,  # Default to not favorite
-        "metadata": {}  # Initialize metadata field
-    }
-    
-    # Extract EXIF metadata for images
-    if is_image(filename):
-        try:
-            exif_metadata = extract_exif_metadata(file_path)
-            file_metadata["metadata"] = exif_metadata
-            print(f"Extracted EXIF metadata for {filename}: {len(exif_metadata)} fields")
-        except Exception as exif_error:
-            print(f"Error extracting EXIF metadata for {filename}: {str(exif_error)}")
-            file_metadata["metadata"] = {}
-    
-    # Use a unique key that includes the folder to avoid conflicts
-    unique_key = f"{username}/{filename}"
-    metadata[unique_key] = file_metadata
-    save_metadata(metadata)
-    
-    # Generate thumbnail if it's an image
-    if is_image(filename):
-        try:
-            thumbnail_path = generate_thumbnail(username, file_path)
-            if thumbnail_path:
-                print(f"Successfully generated thumbnail for {filename}")
-                file_metadata["has_thumbnail"] = True
-                file_metadata["thumbnail_path"] = f"/thumbnails/{filename}"
+        # Splice the changes into the affected filename lists, keeping their order
+        def sort_key(record):
+            return order[_record_key(record)]
+        removed_ids = {id(record) for record in removed}
+        listing = cache["by_filename"]
+        for group in {record["filename"] for record in removed + added}:
+            kept = [record for record in listing.get(group, []) if id(record) not in removed_ids]
+            new = sorted((record for record in added if record["filename"] == group), key=sort_key)
+            merged = list(heapq.merge(kept, new, key=sort_key)) if new else kept
+            if merged:
+                listing[group] = merged
             else:
-                print(f"Failed to generate thumbnail for {filename}")
-                file_metadata["has_thumbnail"] = False
-        except Exception as thumb_error:
-            print(f"Error generating thumbnail for {filename}: {str(thumb_error)}")
-            file_metadata["has_thumbnail"] = False
-    else:
-        file_metadata["has_thumbnail"] = False
-    
-    return file_metadata
+                listing.pop(group, None)
+        cache["version"] = version
 
-def get_all_files(username: Optional[str] = None) -> List[Dict[str, Any]]:
+def checkpoint_photo_index(mode: str = "PASSIVE"):
     """
-    Get all files with metadata
+    Fold the WAL journal back into the database file
     
     Args:
-        username (str, optional): If provided, filter by username
-        
-    Returns:
-        list: List of dictionaries with file metadata
+        mode (str): SQLite checkpoint mode (PASSIVE, FULL, RESTART or TRUNCATE)
     """
-    metadata = load_metadata()
-    metadata_updated = False
-    
-    # Scan all user folders and global folder for files
-    ensure_upload_dir()
-    
-    # Get all directories in the uploads folder (user folders + global)
-    try:
-        all_items = os.listdir(UPLOADS_DIR)
-        user_folders = [item for item in all_items if os.path.isdir(os.path.join(UPLOADS_DIR, item)) and item != "lost+found"]
-    except OSError:
-        user_folders = []
-    
-    # Track all actual files with their folder paths
-    actual_files = set()
-    for folder in user_folders:
-        folder_path = os.path.join(UPLOADS_DIR, folder)
-        try:
-            files_in_folder = os.listdir(folder_path)
-            for file in files_in_folder:
-                file_path = os.path.join(folder_path, file)
-                if os.path.isfile(file_path):
-                    # Use folder/filename as unique key
-                    unique_key = f"{folder}/{file}"
-                    actual_files.add(unique_key)
-        except OSError:
+    with get_sync_engine().connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})")
+
+def _index_maintenance_loop():
+    """Checkpoint the photo index periodically while there are new writes"""
+    last_writes = _index_writes
+    while not _maintenance_stop.wait(INDEX_CHECKPOINT_INTERVAL):
+        if _index_writes == last_writes:
             continue
-    
-    metadata_files = set(metadata.keys())
-    
-    # Add missing files to metadata
-    for unique_key in actual_files - metadata_files:
-        folder, filename = unique_key.split("/", 1)
-        file_path = os.path.join(UPLOADS_DIR, folder, filename)
-        if os.path.isfile(file_path):
-            file_size = os.path.getsize(file_path)
-            metadata[unique_key] = {
-                "filename": filename,
-                "original_name": filename,
-                "uploaded_by": folder if folder != GLOBAL_FOLDER else "unknown",
-                "upload_date": datetime.fromtimestamp(os.path.getctime(file_path)).isoformat(),
-                "file_size": file_size,
-                "size": format_file_size(file_size),
-                "file_type": os.path.splitext(filename)[1].lower()[1:],
-                "folder": folder,
-                "file_path": unique_key
-            }
-            metadata_updated = True
-    
-    # Update existing metadata entries to add missing attributes
-    for unique_key in metadata_files.intersection(actual_files):
-        file_metadata = metadata[unique_key]
-        updated = False
-        
-        # Add size attribute if missing
-        if "size" not in file_metadata and "file_size" in file_metadata:
-            file_metadata["size"] = format_file_size(file_metadata["file_size"])
-            updated = True
-        
-        # Add folder and file_path if missing (for backward compatibility)
-        if "folder" not in file_metadata or "file_path" not in file_metadata:
-            if "/" in unique_key:
-                folder, filename = unique_key.split("/", 1)
-                file_metadata["folder"] = folder
-                file_metadata["file_path"] = unique_key
-                updated = True
-        
-        if updated:
-            metadata_updated = True
-    
-    # Remove metadata for files that no longer exist
-    for unique_key in metadata_files - actual_files:
-        metadata.pop(unique_key, None)
-        metadata_updated = True
-    
-    # Save updated metadata
-    if metadata_updated:
-        save_metadata(metadata)
-    
-    # Filter by username if provided
-    result = []
-    for unique_key, info in metadata.items():
-        # If username filter is provided, only include files from that user's folder
-        if username is None or info.get("uploaded_by") == username or info.get("folder") == username:
-            result.append(info)
-    
-    # Sort by upload date (newest first)
-    result.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
-    
-    return result
+        last_writes = _index_writes
+        try:
+            checkpoint_photo_index()
+        except Exception as e:
+            logging.warning(f"Photo index checkpoint failed: {str(e)}")
 
-def delete_file(filename: str, username: Optional[str] = None, is_admin: bool = False) -> bool:
+def start_index_maintenance():
+    """
+    Start the background thread that checkpoints the photo index
+    """
+    global _maintenance_thread
+    if _maintenance_thread is not None and _maintenance_thread.is_alive():
+        return
+    _maintenance_stop.clear()
+    _maintenance_thread = threading.Thread(target=_index_maintenance_loop, name="photo-index-maintenance", daemon=True)
+    _maintenance_thread.start()
+
+def stop_index_maintenance():
+    """
+    Stop the maintenance thread and compact the journal one last time
+    """
+    global _maintenance_thread
+    _maintenance_stop.set()
+    if _maintenance_thread is not None:
+        _maintenance_thread.join()
+        _maintenance_thread = None
+    checkpoint_photo_index("TRUNCATE")
+
+def _load_metadata_cache() -> Dict[str, Any]:
     """
-    Delete a file and its metadata
+    Return the cached index snapshot, rebuilding it if it is stale
     
-    Args:
-        filename (str): Filename or unique key (folder/filename) to delete
-        username (str, optional): If provided, only delete if uploader matches
-        is_admin (bool, optional): If True, allow deletion regardless of uploader
-        
     Returns:
-        bool: True if file was deleted, False otherwise
+        dict: Cache entry with records and by_filename maps
     """
-    metadata = load_metadata()
-    
-    # Handle both old format (just filename) and new format (folder/filename)
-    unique_key = filename
-    if "/" not in filename and username:
-        # If no folder specified, assume it's in the user's folder
-        unique_key = f"{username}/{filename}"
-    
-    # Check if file exists in metadata
-    if unique_key not in metadata:
-        # Try to find the file in any folder if admin
-        if is_admin:
-            for key in metadata.keys():
-                if key.endswith(f"/{filename}"):
-                    unique_key = key
-                    break
-            else:
-                return False
-        else:
-            return False
-    
-    file_info = metadata[unique_key]
+    ensure_upload_dir()
+    with get_sync_engine().connect() as conn:
+        version = conn.execute(select(photo_index_state_table.c.version)).scalar()
+        with _metadata_cache_lock:
+            # Versions only grow, so a snapshot patched past what we read is still current
+            if _metadata_cache["version"] is not None and _metadata_cache["version"] >= version:
+                _metadata_cache_stats["hits"] += 1
+                return _metadata_cache
+            _metadata_cache_stats["misses"] += 1
+            
+            # Rows are read after the version, so they are at least that new
+            records = {}
+            order = {}
+            by_filename: Dict[str, List[Dict[str, Any]]] = {}
+            for row in conn.execute(select(photos_table).order_by(*_newest_first())):
+                record = _row_to_record(row)
+                records[row.unique_key] = record
+                order[row.unique_key] = (row.upload_date, row.id)
+                by_filename.setdefault(row.filename, []).append(record)
+            for matches in by_filename.values():
+                matches.reverse()
+            
+            _metadata_cache.update(
+                version=version,
+                records=records,
+                order=order,
+                by_filename=by_filename,
+            )
+            return _metadata_cache
+
+def get_index_version() -> int:
+    """
+    Get the photo index version, which every committed index write increments
     
-    # Check username if provided and user is not an admin
-    if not is_admin and username is not None:
-        if file_info.get("uploaded_by") != username and file_info.get("folder") != username:
-            return False
+    Returns:
+        int: Current version
+    """
+    with get_sync_engine().connect() as conn:
+        return conn.execute(select(photo_index_state_table.c.version)).scalar()
+
+def get_metadata_cache_stats() -> Dict[str, Any]:
+    """
+    Get hit/miss counters for the in-process metadata cache
     
-    # Get the actual file path
-    if "file_path" in file_info:
-        file_path = os.path.join(UPLOADS_DIR, file_info["file_path"])
-    else:
-        # Fallback for old metadata format
-        file_path = os.path.join(UPLOADS_DIR, unique_key)
+    Returns:
+        dict: Cache statistics
+    """
+    with _metadata_cache_lock:
+        lookups = _metadata_cache_stats["hits"] + _metadata_cache_stats["misses"]
+        return {
+            "hits": _metadata_cache_stats["hits"],
+            "misses": _metadata_cache_stats["misses"],
+            "patches": _metadata_cache_stats["patches"],
+            "hit_rate": _metadata_cache_stats["hits"] / lookups if lookups else 0.0,
+            "version": _metadata_cache["version"],
+            "cached_records": len(_metadata_cache["records"]),
+        }
+
+def _load_legacy_metadata() -> Dict[str, Any]:
+    """
+    Load the legacy photo metadata from the JSON file
     
+    Returns:
+        dict: Dictionary with photo metadata
+    """
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        
-        # Also delete the thumbnail if it exists
-        # Extract username from unique_key or file_info
-        file_username = file_info.get("uploaded_by") or file_info.get("folder")
-        if file_username and is_image(filename):
-            delete_thumbnail(file_username, filename)
-        
-        # Remove from metadata
-        metadata.pop(unique_key, None)
-        save_metadata(metadata)
-        return True
-    except Exception:
-        return False
+        with open(METADATA_FILE, "r") as f:
+            return json.load(f)
+    except (json.JSONDecodeError, FileNotFoundError):
+        # Return empty dict if file doesn't exist or is invalid
+        return {}
 
-def get_file_info(filename: str, username: Optional[str] = None) -> Optional[Dict[str, Any]]:
+def migrate_metadata_json() -> int:
     """
-    Get metadata for a specific file
+    One-shot import of the legacy metadata.json into the photo index.
+    The JSON file is renamed afterwards so the import never runs twice.
     
-    Args:
-        filename (str): Filename or unique key (folder/filename) to get info for
-        username (str, optional): Username to help locate the file
-        
     Returns:
-        dict: File metadata or None if not found
+        int: Number of records imported
     """
-    metadata = load_metadata()
-    
-    # Handle both old format (just filename) and new format (folder/filename)
-    unique_key = filename
-    if "/" not in filename and username:
-        # If no folder specified, assume it's in the user's folder
-        unique_key = f"{username}/{filename}"
-    
-    # Try the constructed key first
-    if unique_key in metadata:
-        return metadata[unique_key]
-    
-    # If not found and we only have a filename, search all folders
-    if "/" not in filename:
-        for key, file_info in metadata.items():
-            if key.endswith(f"/{filename}"):
-                return file_info
-    
-    return None
+    if not os.path.exists(METADATA_FILE):
+        return 0
+    
+    rows = [_record_to_row(key, info) for key, info in _load_legacy_metadata().items()]
+    with _index_write() as conn:
+        existing = set(conn.execute(select(photos_table.c.unique_key)).scalars())
+        rows = [row for row in rows if row["unique_key"] not in existing]
+        # De-duplicate legacy keys that normalize to the same folder/filename
+        rows = list({row["unique_key"]: row for row in rows}.values())
+        if rows:
+            conn.execute(insert(photos_table), rows)
+            _index_changed([row["unique_key"] for row in rows])
+    
+    os.replace(METADATA_FILE, METADATA_FILE + ".migrated")
+    print(f"Migrated {len(rows)} records from {METADATA_FILE} into the photo index")
+    return len(rows)
 
-def find_file_info(filename: str) -> Optional[Dict[str, Any]]:
+def _taken_at(info: Dict[str, Any]) -> str:
     """
-    Find file information by filename across all user folders
+    When a photo was taken: its EXIF date_taken in ISO format, else its upload date
     
     Args:
-        filename (str): The filename to search for
+        info (dict): File metadata
         
     Returns:
-        dict or None: File metadata if found, None otherwise
+        str: ISO date and time ("" if neither is known)
     """
-    metadata = load_metadata()
-    
-    # First try to find exact filename match
-    for unique_key, file_info in metadata.items():
-        if file_info.get("filename") == filename:
-            return file_info
-    
-    # If not found, try to find by unique_key (folder/filename)
-    if filename in metadata:
-        return metadata[filename]
-    
-    return None
+    date_taken = str((info.get("metadata") or {}).get("date_taken") or "").strip()
+    if date_taken:
+        try:
+            return datetime.fromisoformat(date_taken).isoformat()
+        except ValueError:
+            pass
+        try:
+            # exifread leaves the raw EXIF format
+            return datetime.strptime(date_taken, "%Y:%m:%d %H:%M:%S").isoformat()
+        except ValueError:
+            pass
+    return info.get("upload_date", "")
 
-def get_file_original_path(filename: str) -> Optional[str]:
+def _record_to_row(unique_key: str, info: Dict[str, Any]) -> Dict[str, Any]:
     """
-    Get the original file path for a given filename
+    Convert a metadata record (metadata.json format) into a photos table row
     
     Args:
-        filename (str): The filename to find
+        unique_key (str): Key of the record, "folder/filename" or a bare filename
+        info (dict): File metadata
         
     Returns:
-        str or None: Full path to the original file if found, None otherwise
+        dict: Column values for photos_table
     """
-    file_info = find_file_info(filename)
-    if not file_info:
-        return None
-    
-    folder = file_info.get("folder")
-    if not folder:
-        return None
+    filename = info.get("filename") or unique_key.rsplit("/", 1)[-1]
+    if "/" in unique_key:
+        folder = info.get("folder") or unique_key.split("/", 1)[0]
+    else:
+        # Old format keys were bare filenames
+        folder = info.get("folder") or info.get("uploaded_by") or GLOBAL_FOLDER
+        unique_key = f"{folder}/{filename}"
     
-    return os.path.join(UPLOADS_DIR, folder, filename)
+    thumbnail_status = info.get("thumbnail_status") or ("ready" if info.get("has_thumbnail") else "none")
+    return {
+        "unique_key": unique_key,
+        "filename": filename,
+        "original_name": info.get("original_name", filename),
+        "folder": folder,
+        "file_path": info.get("file_path", unique_key),
+        "uploaded_by": info.get("uploaded_by", folder),
+        "upload_date": info.get("upload_date", ""),
+        "taken_at": _taken_at(info),
+        "file_size": int(info.get("file_size", 0)),
+        "file_type": info.get("file_type", os.path.splitext(filename)[1].lower()[1:]),
+        "is_favorite": bool(info.get("is_favorite", False)),
+        "has_thumbnail": thumbnail_status == "ready",
+        "thumbnail_status": thumbnail_status,
+        "metadata_json": json.dumps(info.get("metadata", {})),
+        "content_hash": info.get("content_hash"),
+    }
 
-def is_image_file(filename: str) -> bool:
+def _row_to_record(row) -> Dict[str, Any]:
     """
-    Check if a file is an image based on extension
+    Convert a photos table row into the metadata record format used by the API
     
     Args:
-        filename (str): Filename to check
+        row: Row from photos_table
         
     Returns:
-        bool: True if file is an image, False otherwise
+        dict: File metadata
     """
-    image_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
-    _, ext = os.path.splitext(filename.lower())
-    return ext in image_extensions
+    record = {
+        "filename": row.filename,
+        "original_name": row.original_name,
+        "uploaded_by": row.uploaded_by,
+        "upload_date": row.upload_date,
+        "upload_time": row.upload_date,  # Alias for compatibility
+        "taken_at": row.taken_at,
+        "file_size": row.file_size,
+        "size": format_file_size(row.file_size),
+        "file_type": row.file_type,
+        "folder": row.folder,
+        "file_path": row.file_path,
+        "is_favorite": bool(row.is_favorite),
+        "has_thumbnail": row.thumbnail_status == "ready",
+        "thumbnail_status": row.thumbnail_status,
+        "metadata": json.loads(row.metadata_json) if row.metadata_json else {},
+        "content_hash": row.content_hash,
+    }
+    if record["has_thumbnail"]:
+        record["thumbnail_path"] = f"/thumbnails/{row.filename}"
+    return record
 
-def is_video_file(filename: str) -> bool:
+def _upsert_record(unique_key: str, info: Dict[str, Any]):
     """
-    Check if a file is a video based on extension
+    Insert or replace a single record in the photo index
     
     Args:
-        filename (str): Filename to check
-        
-    Returns:
-        bool: True if file is a video, False otherwise
+        unique_key (str): Key of the record ("folder/filename")
+        info (dict): File metadata
     """
-    video_extensions = ['.mp4', '.webm', '.ogg', '.mov', '.avi', '.mkv']
-    _, ext = os.path.splitext(filename.lower())
-    return ext in video_extensions
+    row = _record_to_row(unique_key, info)
+    statement = sqlite_insert(photos_table).values(**row)
+    statement = statement.on_conflict_do_update(
+        index_elements=[photos_table.c.unique_key],
+        set_={key: value for key, value in row.items() if key != "unique_key"},
+    )
+    with _index_write() as conn:
+        conn.execute(statement)
+        _index_changed([row["unique_key"]])
+
+def _accessible_folders_clause(username: str, folder=photos_table.c.folder):
+    """Filter matching a user's own folder plus the global folder"""
+    return folder.in_([username, GLOBAL_FOLDER])
+
+def _newest_first():
+    """Default ordering of photo listings (newest upload first)"""
+    return (photos_table.c.upload_date.desc(), photos_table.c.id.desc())
+
+# Deduplication. Uploads are hashed as they stream in; an upload whose bytes
+# are already stored becomes a hardlink of the stored file, with its metadata
+# and thumbnails linked too. The filesystem's link count is the reference
+# count: deleting or purging one copy unlinks only its own name.
+_dedup_stats = {"linked_uploads": 0, "linked_bytes": 0}
+_dedup_stats_lock = threading.Lock()
 
-def get_user_photos(username: str) -> List[Dict[str, Any]]:
+def write_and_hash(buffer, digest, chunk: bytes):
+    """Write an upload chunk and feed it to the upload's running hash"""
+    buffer.write(chunk)
+    digest.update(chunk)
+
+def hash_file(file_path: str) -> str:
     """
-    Get photos from a specific user's folder
+    SHA-256 of a file, read in upload-sized chunks
     
     Args:
-        username (str): Username to get photos for
+        file_path (str): Path of the file
         
     Returns:
-        list: List of dictionaries with file metadata from user's folder
+        str: Hex digest
     """
-    metadata = load_metadata()
-    result = []
-    
-    for unique_key, info in metadata.items():
-        # Only include files from the user's folder
-        if info.get("folder") == username:
-            result.append(info)
-    
-    # Sort by upload date (newest first)
-    result.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
-    return result
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-def get_global_photos() -> List[Dict[str, Any]]:
+def _find_duplicate(content_hash: str, file_size: int) -> Optional[Dict[str, Any]]:
+    """Indexed photo with this content whose file is still on disk, or None"""
+    with get_sync_engine().connect() as conn:
+        rows = conn.execute(
+            select(photos_table)
+            .where(photos_table.c.content_hash == content_hash, photos_table.c.file_size == file_size)
+            .order_by(photos_table.c.id)
+            .limit(5)
+        ).all()
+    for row in rows:
+        try:
+            if os.stat(os.path.join(UPLOADS_DIR, row.file_path)).st_size == file_size:
+                return _row_to_record(row)
+        except OSError:
+            continue
+    return None
+
+def _link_into_place(source_path: str, target_path: str):
     """
-    Get photos from the global shared folder
-    
-    Returns:
-        list: List of dictionaries with file metadata from global folder
+    Hardlink source_path to target_path, replacing whatever is there. Only for
+    paths the caller owns: the thumbnails of an upload name it has claimed.
     """
-    metadata = load_metadata()
-    result = []
-    
-    for unique_key, info in metadata.items():
-        # Only include files from the global folder
-        if info.get("folder") == GLOBAL_FOLDER:
-            result.append(info)
-    
-    # Sort by upload date (newest first)
-    result.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
-    return result
+    link_path = os.path.join(os.path.dirname(target_path), f".link-{uuid.uuid4().hex}.part")
+    os.link(source_path, link_path)
+    try:
+        os.replace(link_path, target_path)
+    except OSError:
+        os.remove(link_path)
+        raise
 
-def get_all_user_accessible_photos(username: str) -> List[Dict[str, Any]]:
+def _link_thumbnails(source: Dict[str, Any], folder: str, filename: str) -> bool:
     """
-    Get all photos accessible to a user (their own + global)
+    Give a new file the thumbnails of an identical one, as hardlinks
     
     Args:
-        username (str): Username to get accessible photos for
+        source (dict): Index record of the identical file
+        folder (str): Folder of the new file
+        filename (str): Name of the new file
         
     Returns:
-        list: List of dictionaries with file metadata accessible to user
+        bool: True if at least one rendition was linked
     """
-    metadata = load_metadata()
-    result = []
+    source_dir = os.path.join(UPLOADS_DIR, source["folder"], "thumbnails")
+    target_dir = ensure_thumbnails_dir(folder)
+    linked = 0
+    for thumbnail_path in _thumbnail_files(source["folder"], source["filename"]):
+        # thumbnails/<name> and thumbnails/<size>/<name>.<ext>: swap in the new name
+        size_dir, name = os.path.split(os.path.relpath(thumbnail_path, source_dir))
+        target_path = os.path.join(target_dir, size_dir, filename + name[len(source["filename"]):])
+        try:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            _link_into_place(thumbnail_path, target_path)
+            linked += 1
+        except OSError as e:
+            logging.warning(f"Could not link thumbnail {thumbnail_path}: {str(e)}")
+    return linked > 0
+
+def get_dedup_stats() -> Dict[str, Any]:
+    """
+    Get how much storage content deduplication saves
     
-    for unique_key, info in metadata.items():
-        # Include files from user's folder or global folder
-        if info.get("folder") == username or info.get("folder") == GLOBAL_FOLDER:
-            result.append(info)
+    Only files that really share an inode count as duplicates: rows with the
+    same content hash may be full copies (linking fell back to copying, or the
+    files were copied in by hand). Just the files of repeated hashes are stat'ed.
     
-    # Sort by upload date (newest first)
-    result.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
-    return result
+    Returns:
+        dict: Hashed files, distinct contents, duplicate files and bytes saved across
+        the library, plus uploads linked since this process started
+    """
+    repeated = (
+        select(photos_table.c.content_hash)
+        .where(photos_table.c.content_hash.is_not(None))
+        .group_by(photos_table.c.content_hash)
+        .having(func.count() > 1)
+    )
+    with get_sync_engine().connect() as conn:
+        hashed, contents = conn.execute(
+            select(func.count(), func.count(photos_table.c.content_hash.distinct()))
+            .where(photos_table.c.content_hash.is_not(None))
+        ).one()
+        copies = conn.execute(
+            select(photos_table.c.content_hash, photos_table.c.file_path)
+            .where(photos_table.c.content_hash.in_(repeated))
+        ).all()
+    
+    duplicates = saved = 0
+    groups: Dict[str, List[str]] = {}
+    for content_hash, file_path in copies:
+        groups.setdefault(content_hash, []).append(file_path)
+    for file_paths in groups.values():
+        inodes = {}
+        for file_path in file_paths:
+            try:
+                stat = os.stat(os.path.join(UPLOADS_DIR, file_path))
+            except OSError:
+                continue
+            inodes.setdefault((stat.st_dev, stat.st_ino), [0, stat.st_size])[0] += 1
+        for links, size in inodes.values():
+            duplicates += links - 1
+            saved += (links - 1) * size
+    with _dedup_stats_lock:
+        return dict(
+            _dedup_stats,
+            hashed_files=hashed,
+            distinct_contents=contents,
+            duplicate_files=duplicates,
+            saved_bytes=saved,
+            saved=format_file_size(saved),
+        )
 
-def is_image(filename: str) -> bool:
+# os.link errors meaning the filesystem (e.g. FAT/exFAT) has no hardlinks
+_LINK_UNSUPPORTED = {errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP, errno.ENOSYS}
+
+def _upload_name_candidates(filename: str) -> Iterator[str]:
+    """The requested filename, then timestamped variants of it, then numbered ones"""
+    yield filename
+    name, ext = os.path.splitext(filename)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    yield f"{name}_{timestamp}{ext}"
+    for number in itertools.count(1):
+        yield f"{name}_{timestamp}_{number}{ext}"
+
+def _claim_upload_name(filename: str, username: str, claim: Callable[[str], None]) -> Tuple[str, str]:
     """
-    Check if a file is an image based on its extension
+    Atomically take the first free name for an upload in the user's folder
     
     Args:
-        filename (str): Name of the file to check
+        filename (str): The requested filename
+        username (str): The username of the uploader
+        claim (callable): Creates the file at a path, raising FileExistsError if the
+            path is taken (os.link never overwrites, nor does O_CREAT|O_EXCL)
+        
+    Returns:
+        tuple: (final filename, full path)
+    """
+    ensure_upload_dir()
+    ensure_user_folder(username)
+    user_folder = get_user_folder_path(username)
+    
+    # Concurrent uploads of the same name each get their own: whoever loses a
+    # name moves on to the next candidate instead of overwriting the winner
+    for candidate in _upload_name_candidates(filename):
+        file_path = os.path.join(user_folder, candidate)
+        try:
+            claim(file_path)
+        except FileExistsError:
+            continue
+        return candidate, file_path
+
+def _create_exclusive(file_path: str):
+    """Create an empty file, failing if the path exists"""
+    os.close(os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+
+def _prepare_upload_path(filename: str, username: str) -> Tuple[str, str]:
+    """
+    Reserve the destination for an upload, making the filename unique if needed
+    
+    Args:
+        filename (str): The requested filename
+        username (str): The username of the uploader
+        
+    Returns:
+        tuple: (final filename, full path of the empty file reserved for it)
+    """
+    return _claim_upload_name(filename, username, _create_exclusive)
+
+async def save_uploaded_file_async(upload_file, filename: str, username: str) -> Dict[str, Any]:
+    """
+    Save an uploaded file and update metadata without blocking the event loop
+    
+    Args:
+        upload_file: The UploadFile object from FastAPI
+        filename (str): The filename to save
+        username (str): The username of the uploader
+        
+    Returns:
+        dict: Metadata for the saved file
+    """
+    async def read_chunks():
+        while chunk := await upload_file.read(UPLOAD_CHUNK_SIZE):
+            yield chunk
+    
+    return await save_upload_stream_async(read_chunks(), filename, username)
+
+def new_temp_upload_path(username: str) -> str:
+    """
+    Get a path for a hidden temp file in the user's folder. Uploads are
+    assembled there and renamed into place, so the rename never copies data.
+    
+    Args:
+        username (str): The username of the uploader
+        
+    Returns:
+        str: Full path for the temp file
+    """
+    ensure_upload_dir()
+    ensure_user_folder(username)
+    return os.path.join(get_user_folder_path(username), f".upload-{uuid.uuid4().hex}.part")
+
+def _discard_temp_file(temp_path: str):
+    """Delete a partial upload, if it is still there"""
+    try:
+        os.remove(temp_path)
+        print(f"Removed partial file: {temp_path}")
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"Failed to remove partial file {temp_path}: {str(e)}")
+
+def _discard_temp_file_soon(temp_path: str):
+    """Delete a partial upload on the upload I/O pool, without waiting (safe while being cancelled)"""
+    try:
+        _upload_io_executor.submit(_discard_temp_file, temp_path)
+    except RuntimeError:
+        # The pool is already shut down
+        _discard_temp_file(temp_path)
+
+# Interrupted uploads and dedup links leave these behind; resumable upload
+# sessions keep theirs until they complete or expire
+_TEMP_FILE_PREFIXES = (".upload-", ".link-")
+# Temp files untouched for this long belong to no upload still in progress
+STALE_TEMP_FILE_AGE = 3600
+
+def remove_stale_temp_files(keep: Optional[List[str]] = None) -> int:
+    """
+    Delete temp files that interrupted uploads left in the photo store
+    
+    Args:
+        keep (list, optional): Paths to leave alone (temp files of live upload sessions)
+        
+    Returns:
+        int: Number of files removed
+    """
+    keep = set(keep or [])
+    cutoff = time.time() - STALE_TEMP_FILE_AGE
+    removed = 0
+    for directory, _, names in os.walk(UPLOADS_DIR):
+        for name in names:
+            if not name.startswith(_TEMP_FILE_PREFIXES) or not name.endswith(".part"):
+                continue
+            temp_path = os.path.join(directory, name)
+            try:
+                if temp_path in keep or os.stat(temp_path).st_mtime > cutoff:
+                    continue
+                os.remove(temp_path)
+                removed += 1
+            except OSError:
+                continue
+    if removed:
+        print(f"Removed {removed} temp files left by interrupted uploads")
+    return removed
+
+async def run_upload_io(func, *args):
+    """
+    Run a blocking disk operation on the upload I/O pool
+    """
+    return await asyncio.get_running_loop().run_in_executor(_upload_io_executor, func, *args)
+
+def _commit_temp_upload(temp_path: str, filename: str, username: str,
+                        content_hash: str) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+    """
+    Store a completed temp upload under a unique final name: as a hardlink of an
+    identical stored file if there is one, else fsynced and linked into place.
+    Names are claimed atomically, so concurrent uploads never overwrite each other.
+    
+    Returns:
+        tuple: (final filename, full path, index record of the file it duplicates or None)
+    """
+    duplicate = _find_duplicate(content_hash, os.path.getsize(temp_path))
+    if duplicate is not None:
+        source_path = os.path.join(UPLOADS_DIR, duplicate["file_path"])
+        try:
+            filename, file_path = _claim_upload_name(filename, username, partial(os.link, source_path))
+            os.remove(temp_path)
+            return filename, file_path, duplicate
+        except OSError as e:
+            # Too many links, or a filesystem without hardlinks: keep a full copy
+            logging.warning(f"Could not link {filename} to {duplicate['file_path']}: {str(e)}")
+    
+    fd = os.open(temp_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    try:
+        # Linking claims the final name atomically; the temp name is then dropped
+        filename, file_path = _claim_upload_name(filename, username, partial(os.link, temp_path))
+        os.remove(temp_path)
+    except OSError as e:
+        if e.errno not in _LINK_UNSUPPORTED:
+            raise
+        filename, file_path = _prepare_upload_path(filename, username)
+        try:
+            os.replace(temp_path, file_path)
+        except OSError:
+            os.remove(file_path)
+            raise
+    return filename, file_path, None
+
+async def commit_temp_upload_async(temp_path: str, filename: str, username: str, file_size: int,
+                                   content_hash: Optional[str] = None,
+                                   on_committed: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Make a completed temp upload durable, rename it into place and index it
+    (EXIF metadata and thumbnail run on the bounded media pool). Content that
+    is already stored is linked to instead, reusing its metadata and thumbnails.
+    
+    Args:
+        temp_path (str): Path returned by new_temp_upload_path
+        filename (str): The requested filename
+        username (str): The username of the uploader
+        file_size (int): Size of the upload in bytes
+        content_hash (str, optional): SHA-256 of the upload if it was hashed while
+            streaming; otherwise the temp file is read back to hash it
+        on_committed (callable, optional): Called with the final filename once the file
+            is in place under it (and the temp path is gone), before it is indexed
+        
+    Returns:
+        dict: Metadata for the saved file
+    """
+    if content_hash is None:
+        content_hash = await run_upload_io(hash_file, temp_path)
+    filename, file_path, duplicate = await run_upload_io(_commit_temp_upload, temp_path, filename, username, content_hash)
+    if on_committed is not None:
+        on_committed(filename)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _media_executor, _finish_upload, file_path, filename, username, file_size, content_hash, duplicate
+    )
+
+async def save_upload_stream_async(chunks: AsyncIterator[bytes], filename: str, username: str) -> Dict[str, Any]:
+    """
+    Stream an upload straight into the user's folder without blocking the event loop.
+    Bytes go to a hidden temp file in the destination folder which is renamed
+    into place once complete, so each byte hits the disk once and a partial
+    upload is never visible under the final name.
+    
+    Args:
+        chunks: Async iterator of body chunks (e.g. Request.stream())
+        filename (str): The filename to save
+        username (str): The username of the uploader
+        
+    Returns:
+        dict: Metadata for the saved file
+    """
+    temp_path = await run_upload_io(new_temp_upload_path, username)
+    # Once the commit starts, the temp file is the commit's to link or remove
+    committing = False
+    
+    try:
+        try:
+            print(f"Starting upload of file: {filename} by user: {username} to {os.path.dirname(temp_path)}")
+            bytes_written = 0
+            next_progress = 100 * 1024 * 1024
+            digest = hashlib.sha256()
+            
+            buffer = await run_upload_io(open, temp_path, "wb")
+            try:
+                async for chunk in chunks:
+                    if not chunk:
+                        continue
+                    await run_upload_io(write_and_hash, buffer, digest, chunk)
+                    bytes_written += len(chunk)
+                    
+                    # Log progress for very large files
+                    if bytes_written >= next_progress:  # Log every 100MB
+                        print(f"Upload progress for {filename}: {bytes_written / (1024 * 1024):.1f}MB written")
+                        next_progress += 100 * 1024 * 1024
+            finally:
+                await run_upload_io(buffer.close)
+            
+            print(f"Upload complete for {filename}: Total size {bytes_written / (1024 * 1024):.2f} MB")
+        except Exception as e:
+            print(f"Error during file upload: {str(e)}")
+            raise IOError(f"File upload failed: {str(e)}") from e
+        
+        committing = True
+        try:
+            return await commit_temp_upload_async(temp_path, filename, username, bytes_written, digest.hexdigest())
+        except OSError as e:
+            if os.path.exists(temp_path):
+                await run_upload_io(os.remove, temp_path)
+            raise IOError(f"File upload failed: {str(e)}") from e
+    finally:
+        # Also runs when the upload is cancelled (client gone, server shutting
+        # down), which no `except Exception` sees
+        if not committing:
+            _discard_temp_file_soon(temp_path)
+
+def _finish_upload(file_path: str, filename: str, username: str, file_size: int,
+                   content_hash: Optional[str] = None, duplicate: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Index a file that has been written to its user folder: extract EXIF
+    metadata, record it in the photo index and generate its thumbnail
+    
+    Args:
+        file_path (str): Full path of the stored file
+        filename (str): Final filename within the user's folder
+        username (str): The username of the uploader
+        file_size (int): Size of the stored file in bytes
+        content_hash (str, optional): SHA-256 of the file
+        duplicate (dict, optional): Index record of the identical file this one is
+            linked to; its metadata and thumbnails are reused
+        
+    Returns:
+        dict: Metadata for the saved file
+    """
+    # Update metadata with folder info
+    file_metadata = {
+        "filename": filename,
+        "original_name": filename,
+        "uploaded_by": username,
+        "upload_date": datetime.now().isoformat(),
+        "upload_time": datetime.now().isoformat(),  # Alias for compatibility
+        "file_size": file_size,
+        "size": format_file_size(file_size),
+        "file_type": os.path.splitext(filename)[1].lower()[1:],
+        "folder": username,  # Track which folder the file is in
+        "file_path": os.path.join(username, filename),  # Relative path from photos root
+        "is_favorite": False,  # Default to not favorite
+        "metadata": {},  # Initialize metadata field
+        "content_hash": content_hash
+    }
+    
+    if duplicate is not None:
+        # Same bytes: same EXIF, and the thumbnails can be linked rather than rendered
+        file_metadata["metadata"] = duplicate.get("metadata", {})
+        thumbnails_linked = duplicate.get("thumbnail_status") == "ready" and _link_thumbnails(duplicate, username, filename)
+        file_metadata["thumbnail_status"] = "ready" if thumbnails_linked else ("pending" if is_image(filename) else "none")
+        file_metadata["has_thumbnail"] = thumbnails_linked
+        _upsert_record(f"{username}/{filename}", file_metadata)
+        if file_metadata["thumbnail_status"] == "pending":
+            request_thumbnail(username, filename)
+        with _dedup_stats_lock:
+            _dedup_stats["linked_uploads"] += 1
+            _dedup_stats["linked_bytes"] += file_size
+        print(f"Stored {filename} as a link to identical content ({format_file_size(file_size)} saved)")
+        return file_metadata
+    
+    # Extract EXIF metadata for images
+    if is_image(filename):
+        try:
+            exif_metadata = extract_exif_metadata(file_path)
+            file_metadata["metadata"] = exif_metadata
+            print(f"Extracted EXIF metadata for {filename}: {len(exif_metadata)} fields")
+        except Exception as exif_error:
+            print(f"Error extracting EXIF metadata for {filename}: {str(exif_error)}")
+            file_metadata["metadata"] = {}
+    
+    # Images get their thumbnail from the background pool; the upload
+    # returns as soon as the file is stored and indexed
+    file_metadata["thumbnail_status"] = "pending" if is_image(filename) else "none"
+    file_metadata["has_thumbnail"] = False
+    
+    # Use a unique key that includes the folder to avoid conflicts
+    unique_key = f"{username}/{filename}"
+    _upsert_record(unique_key, file_metadata)
+    
+    if is_image(filename):
+        request_thumbnail(username, filename)
+    
+    return file_metadata
+
+def _set_thumbnail_status(unique_key: str, thumbnail_status: str):
+    """Record the thumbnail state of an indexed file"""
+    with _index_write() as conn:
+        conn.execute(
+            update(photos_table)
+            .where(photos_table.c.unique_key == unique_key)
+            .values(thumbnail_status=thumbnail_status, has_thumbnail=thumbnail_status == "ready")
+        )
+        _index_changed([unique_key])
+
+def request_thumbnail(folder: str, filename: str) -> Future:
+    """
+    Queue generation of a file's thumbnail renditions on the background pool.
+    Concurrent requests for the same file share one in-flight job instead
+    of each decoding the full-size image.
+    
+    Args:
+        folder (str): Folder the original lives in (the owner's username or global)
+        filename (str): Name of the original file
+        
+    Returns:
+        Future: Resolves to {size: JPEG path} for each rendition, or {} if generation failed
+    """
+    key = (folder, filename)
+    with _thumbnail_jobs_lock:
+        future = _thumbnail_jobs.get(key)
+        if future is None:
+            future = _thumbnail_executor.submit(_run_thumbnail_job, folder, filename)
+            _thumbnail_jobs[key] = future
+    return future
+
+def _run_thumbnail_job(folder: str, filename: str) -> Dict[int, str]:
+    """
+    Generate one file's renditions and record the outcome in the photo index.
+    Never raises: any error (e.g. a locked database) is logged and reported as
+    a failed job, {}, so callers need no handling beyond the failed path.
+    """
+    try:
+        original_path = os.path.join(UPLOADS_DIR, folder, filename)
+        renditions = generate_renditions(folder, original_path) if os.path.exists(original_path) else {}
+        if renditions:
+            print(f"Successfully generated thumbnails for {filename}")
+        else:
+            print(f"Failed to generate thumbnails for {filename}")
+        _set_thumbnail_status(f"{folder}/{filename}", "ready" if renditions else "failed")
+        return renditions
+    except Exception as e:
+        logging.error(f"Thumbnail job for {folder}/{filename} failed: {str(e)}")
+        return {}
+    finally:
+        with _thumbnail_jobs_lock:
+            _thumbnail_jobs.pop((folder, filename), None)
+
+# Reconciler. Files can appear in or vanish from the photo store behind the
+# server's back (copied in over SSH, deleted by hand); a background thread folds
+# those changes into the photo index so reads never have to scan the disk.
+# A sweep only lists folders whose directory mtime moved since their last
+# reconcile, and with inotify the files named by events are checked one by one.
+_reconcile_stop = threading.Event()
+_reconcile_thread: Optional[threading.Thread] = None
+_reconcile_lock = threading.Lock()
+# Directory mtime (ns) of each folder as of its last reconcile
+_folder_mtimes: Dict[str, int] = {}
+_reconcile_stats = {"sweeps": 0, "folders_scanned": 0, "files_checked": 0, "added": 0, "removed": 0,
+                    "last_sweep": None}
+
+def _store_folders() -> Dict[str, int]:
+    """Folders of the photo store with their directory mtimes (ns)"""
+    folders = {}
+    try:
+        with os.scandir(UPLOADS_DIR) as entries:
+            for entry in entries:
+                if entry.name == "lost+found" or entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_dir():
+                        folders[entry.name] = entry.stat().st_mtime_ns
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return folders
+
+def _indexed_folders() -> set:
+    """Folders with at least one indexed photo, from the per-day counts"""
+    with get_sync_engine().connect() as conn:
+        return set(conn.execute(select(photo_day_counts_table.c.folder).distinct()).scalars())
+
+def _sync_folder_files(folder: str, present: List[str], gone: List[str]) -> Tuple[int, int]:
+    """
+    Index files found on disk and drop rows whose files are missing
+    
+    Args:
+        folder (str): Folder the files live in
+        present (list): Unindexed filenames seen on disk
+        gone (list): Indexed filenames not seen on disk
+        
+    Returns:
+        tuple: (files added, files removed)
+    """
+    folder_path = os.path.join(UPLOADS_DIR, folder)
+    new_rows = []
+    for filename in present:
+        file_path = os.path.join(folder_path, filename)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+        unique_key = f"{folder}/{filename}"
+        new_rows.append(_record_to_row(unique_key, {
+            "filename": filename,
+            "original_name": filename,
+            "uploaded_by": folder if folder != GLOBAL_FOLDER else "unknown",
+            "upload_date": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+            "file_size": stat.st_size,
+            "file_type": os.path.splitext(filename)[1].lower()[1:],
+            "folder": folder,
+            "file_path": unique_key,
+            # Header-only, so indexing a folder of large files stays cheap
+            "metadata": extract_exif_metadata(file_path) if is_image(filename) else {}
+        }))
+    # An upload can land between the listing and now, so only drop rows whose
+    # file is still missing
+    stale_keys = [f"{folder}/{filename}" for filename in gone
+                  if not os.path.isfile(os.path.join(folder_path, filename))]
+    
+    if new_rows or stale_keys:
+        with _index_write() as conn:
+            if new_rows:
+                # Rows a concurrent upload indexed meanwhile win
+                conn.execute(
+                    sqlite_insert(photos_table).on_conflict_do_nothing(index_elements=[photos_table.c.unique_key]),
+                    new_rows,
+                )
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(stale_keys), 500):
+                conn.execute(delete(photos_table).where(photos_table.c.unique_key.in_(stale_keys[i:i + 500])))
+            _index_changed([row["unique_key"] for row in new_rows] + stale_keys)
+    return len(new_rows), len(stale_keys)
+
+def reconcile_folder(folder: str) -> Tuple[int, int]:
+    """
+    Bring a folder's index rows in line with the files in its directory
+    
+    Args:
+        folder (str): Folder name (username or global)
+        
+    Returns:
+        tuple: (files added, files removed)
+    """
+    on_disk = set()
+    try:
+        with os.scandir(os.path.join(UPLOADS_DIR, folder)) as entries:
+            for entry in entries:
+                # Skip hidden files such as in-progress upload temp files
+                if entry.name.startswith("."):
+                    continue
+                try:
+                    if entry.is_file():
+                        on_disk.add(entry.name)
+                except OSError:
+                    continue
+    except FileNotFoundError:
+        pass  # The folder itself is gone, and so are its files
+    except OSError as e:
+        logging.warning(f"Could not list photo folder {folder}: {str(e)}")
+        return 0, 0
+    
+    with get_sync_engine().connect() as conn:
+        indexed = set(conn.execute(select(photos_table.c.filename).where(photos_table.c.folder == folder)).scalars())
+        # Trashed files stay on disk until they are purged
+        trashed = set(conn.execute(
+            select(photo_trash_table.c.filename).where(photo_trash_table.c.folder == folder)
+        ).scalars())
+    return _sync_folder_files(folder, sorted(on_disk - indexed - trashed), sorted(indexed - on_disk))
+
+def reconcile_files(folder: str, filenames: List[str]) -> Tuple[int, int]:
+    """
+    Reconcile only the named files of a folder, e.g. the ones inotify reported
+    
+    Args:
+        folder (str): Folder the files live in
+        filenames (list): Filenames to check
+        
+    Returns:
+        tuple: (files added, files removed)
+    """
+    filenames = [filename for filename in set(filenames) if not filename.startswith(".")]
+    indexed = set()
+    trashed = set()
+    with get_sync_engine().connect() as conn:
+        # Stay well below SQLite's bound-parameter limit
+        for i in range(0, len(filenames), 500):
+            indexed.update(conn.execute(
+                select(photos_table.c.filename)
+                .where(photos_table.c.folder == folder, photos_table.c.filename.in_(filenames[i:i + 500]))
+            ).scalars())
+            trashed.update(conn.execute(
+                select(photo_trash_table.c.filename)
+                .where(photo_trash_table.c.folder == folder, photo_trash_table.c.filename.in_(filenames[i:i + 500]))
+            ).scalars())
+    folder_path = os.path.join(UPLOADS_DIR, folder)
+    present = [name for name in filenames
+               if name not in indexed and name not in trashed and os.path.isfile(os.path.join(folder_path, name))]
+    gone = [name for name in filenames if name in indexed and not os.path.isfile(os.path.join(folder_path, name))]
+    with _reconcile_lock:
+        added, removed = _sync_folder_files(folder, present, gone)
+        _reconcile_stats["files_checked"] += len(filenames)
+        _reconcile_stats["added"] += added
+        _reconcile_stats["removed"] += removed
+    return added, removed
+
+def reconcile_photo_store(force: bool = False) -> Dict[str, int]:
+    """
+    Reconcile every folder whose directory changed since it was last reconciled
+    
+    Args:
+        force (bool): Rescan every folder regardless of its mtime
+        
+    Returns:
+        dict: Folders scanned and files added and removed by this sweep
+    """
+    ensure_upload_dir()
+    result = {"folders_scanned": 0, "added": 0, "removed": 0}
+    with _reconcile_lock:
+        # mtimes are read before listing, so a change made mid-listing shows up next sweep
+        folders = _store_folders()
+        for folder in sorted(folders.keys() | _indexed_folders()):
+            mtime = folders.get(folder)
+            if not force and mtime is not None and _folder_mtimes.get(folder) == mtime:
+                continue
+            added, removed = reconcile_folder(folder)
+            result["folders_scanned"] += 1
+            result["added"] += added
+            result["removed"] += removed
+            if mtime is None:
+                _folder_mtimes.pop(folder, None)
+            else:
+                _folder_mtimes[folder] = mtime
+        _reconcile_stats["sweeps"] += 1
+        _reconcile_stats["last_sweep"] = datetime.now().isoformat()
+        for key, value in result.items():
+            _reconcile_stats[key] += value
+    if result["added"] or result["removed"]:
+        print(f"Reconciled photo store: {result['added']} added, {result['removed']} removed")
+    return result
+
+def _watch_folders(watcher, watches: Dict[int, str]):
+    """Add inotify watches for store folders that are not watched yet"""
+    watched = set(watches.values())
+    for folder in _store_folders():
+        if folder in watched:
+            continue
+        try:
+            wd = watcher.add_watch(
+                os.path.join(UPLOADS_DIR, folder),
+                inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO | inotify_flags.DELETE | inotify_flags.MOVED_FROM,
+            )
+        except OSError as e:
+            # Out of watches: the folder is still covered by the mtime sweeps
+            logging.warning(f"Could not watch photo folder {folder}: {str(e)}")
+            continue
+        watches[wd] = folder
+
+def _open_watcher():
+    """An inotify instance watching the store root, or None without inotify"""
+    if not INOTIFY_AVAILABLE:
+        return None
+    try:
+        watcher = INotify()
+        watcher.add_watch(UPLOADS_DIR, inotify_flags.CREATE | inotify_flags.DELETE
+                          | inotify_flags.MOVED_TO | inotify_flags.MOVED_FROM | inotify_flags.ONLYDIR)
+        return watcher
+    except OSError as e:
+        logging.warning(f"inotify unavailable, reconciling by sweeps only: {str(e)}")
+        return None
+
+def _reconcile_loop():
+    """Sweep the photo store periodically and reconcile files named by inotify events"""
+    watcher = _open_watcher()
+    watches: Dict[int, str] = {}
+    # (folder, filename) -> time of its latest event
+    pending: Dict[Tuple[str, str], float] = {}
+    next_sweep = 0.0
+    try:
+        while not _reconcile_stop.is_set():
+            if time.monotonic() >= next_sweep:
+                try:
+                    reconcile_photo_store()
+                except Exception as e:
+                    logging.warning(f"Photo store reconcile failed: {str(e)}")
+                if watcher is not None:
+                    _watch_folders(watcher, watches)
+                next_sweep = time.monotonic() + RECONCILE_INTERVAL
+            
+            if watcher is None:
+                _reconcile_stop.wait(max(next_sweep - time.monotonic(), 0))
+                continue
+            
+            for event in watcher.read(timeout=1000):
+                if event.mask & inotify_flags.Q_OVERFLOW:
+                    # Events were dropped: rescan everything on the next sweep
+                    with _reconcile_lock:
+                        _folder_mtimes.clear()
+                    next_sweep = 0.0
+                elif event.mask & inotify_flags.IGNORED:
+                    watches.pop(event.wd, None)
+                elif event.wd not in watches:
+                    if event.mask & inotify_flags.ISDIR:
+                        # A folder was created, removed or renamed in the store root
+                        next_sweep = 0.0
+                elif not event.mask & inotify_flags.ISDIR:
+                    pending[(watches[event.wd], event.name)] = time.monotonic()
+            
+            settled = time.monotonic() - RECONCILE_SETTLE_SECONDS
+            ready: Dict[str, List[str]] = {}
+            for (folder, filename), seen in list(pending.items()):
+                if seen <= settled:
+                    ready.setdefault(folder, []).append(filename)
+                    del pending[(folder, filename)]
+            for folder, filenames in ready.items():
+                try:
+                    mtime = os.stat(os.path.join(UPLOADS_DIR, folder)).st_mtime_ns
+                except FileNotFoundError:
+                    continue  # Removed folder: the sweep its root event triggered drops its rows
+                try:
+                    reconcile_files(folder, filenames)
+                except Exception as e:
+                    logging.warning(f"Photo store reconcile failed for {folder}: {str(e)}")
+                    continue
+                # Any change not handled yet still has an event queued, so the next
+                # sweep can skip this folder (unless it was never swept at all)
+                with _reconcile_lock:
+                    if folder in _folder_mtimes:
+                        _folder_mtimes[folder] = mtime
+    finally:
+        if watcher is not None:
+            watcher.close()
+
+def start_reconciler():
+    """
+    Start the background thread that reconciles the photo index with the photo store
+    """
+    global _reconcile_thread
+    if _reconcile_thread is not None and _reconcile_thread.is_alive():
+        return
+    _reconcile_stop.clear()
+    _reconcile_thread = threading.Thread(target=_reconcile_loop, name="photo-store-reconciler", daemon=True)
+    _reconcile_thread.start()
+
+def stop_reconciler():
+    """
+    Stop the reconciler thread
+    """
+    global _reconcile_thread
+    _reconcile_stop.set()
+    if _reconcile_thread is not None:
+        _reconcile_thread.join()
+        _reconcile_thread = None
+
+def get_reconcile_stats() -> Dict[str, Any]:
+    """
+    Get counters for the photo store reconciler
+    
+    Returns:
+        dict: Reconciler statistics
+    """
+    with _reconcile_lock:
+        return dict(_reconcile_stats, inotify=INOTIFY_AVAILABLE, running=_reconcile_thread is not None)
+
+def delete_file(filename: str, username: Optional[str] = None, is_admin: bool = False) -> bool:
+    """
+    Move a file to the trash. It disappears from the index at once; the trash
+    purger removes the file and its thumbnails after the retention window.
+    
+    Args:
+        filename (str): Filename or unique key (folder/filename) to delete
+        username (str, optional): If provided, only delete if uploader matches
+        is_admin (bool, optional): If True, allow deletion regardless of uploader
+        
+    Returns:
+        bool: True if file was deleted, False otherwise
+        
+    Raises:
+        AmbiguousFilenameError: If an admin passes a bare filename that exists in several folders
+    """
+    # Handle both old format (just filename) and new format (folder/filename)
+    unique_key = filename
+    if "/" not in filename and username:
+        # If no folder specified, assume it's in the user's folder
+        unique_key = f"{username}/{filename}"
+    
+    # Check if file exists in the index
+    cache = _load_metadata_cache()
+    file_info = cache["records"].get(unique_key)
+    if file_info is None:
+        # Try to find the file in any folder if admin
+        if not is_admin:
+            return False
+        file_info = _single_match(cache, filename)
+        if file_info is None:
+            return False
+        unique_key = _record_key(file_info)
+    
+    # Check username if provided and user is not an admin
+    if not is_admin and username is not None:
+        if file_info.get("uploaded_by") != username and file_info.get("folder") != username:
+            return False
+    
+    try:
+        with _index_write() as conn:
+            _move_to_trash(conn, [unique_key], username or file_info.get("uploaded_by"))
+        return True
+    except Exception:
+        return False
+
+def _single_match(cache: Dict[str, Any], filename: str, folders: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Look up a bare filename across folders
+    
+    Args:
+        cache (dict): Index snapshot from _load_metadata_cache
+        filename (str): Bare filename
+        folders (list, optional): Only consider these folders
+        
+    Returns:
+        dict: The one matching record, or None if there is none
+        
+    Raises:
+        AmbiguousFilenameError: If files in several folders have this name
+    """
+    matches = cache["by_filename"].get(filename, [])
+    if folders is not None:
+        matches = [record for record in matches if record["folder"] in folders]
+    if len(matches) > 1:
+        raise AmbiguousFilenameError(filename, [_record_key(record) for record in matches])
+    return matches[0] if matches else None
+
+def get_file_info(filename: str, username: Optional[str] = None, folders: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Get metadata for a specific file
+    
+    Args:
+        filename (str): Filename or unique key (folder/filename) to get info for
+        username (str, optional): Username to help locate the file
+        folders (list, optional): Folders to search when the file is not in the user's own
+        
+    Returns:
+        dict: File metadata or None if not found
+        
+    Raises:
+        AmbiguousFilenameError: If a bare filename matches files in several folders
+    """
+    return _cached_file_info(_load_metadata_cache(), filename, username, folders)
+
+def _cached_file_info(cache: Dict[str, Any], filename: str, username: Optional[str] = None,
+                      folders: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """get_file_info against an index snapshot from _load_metadata_cache"""
+    # Handle both old format (just filename) and new format (folder/filename)
+    unique_key = filename
+    if "/" not in filename and username:
+        # If no folder specified, assume it's in the user's folder
+        unique_key = f"{username}/{filename}"
+    
+    # Try the constructed key first
+    if unique_key in cache["records"]:
+        return cache["records"][unique_key]
+    
+    # If not found and we only have a filename, search the other folders
+    if "/" not in filename:
+        return _single_match(cache, filename, folders)
+    
+    return None
+
+def find_file_info(filename: str) -> Optional[Dict[str, Any]]:
+    """
+    Find file information by filename across all user folders
+    
+    Args:
+        filename (str): The filename to search for
+        
+    Returns:
+        dict or None: File metadata if found, None otherwise
+        
+    Raises:
+        AmbiguousFilenameError: If files in several folders have this name
+    """
+    return _cached_find_file_info(_load_metadata_cache(), filename)
+
+def _cached_find_file_info(cache: Dict[str, Any], filename: str) -> Optional[Dict[str, Any]]:
+    """find_file_info against an index snapshot from _load_metadata_cache"""
+    # First try to find exact filename match
+    file_info = _single_match(cache, filename)
+    if file_info is not None:
+        return file_info
+    
+    # If not found, try to find by unique_key (folder/filename)
+    return cache["records"].get(filename)
+
+def get_files_info(filenames: List[str], username: Optional[str] = None,
+                   ambiguous: Optional[Dict[str, List[str]]] = None) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    Look up many files against a single snapshot of the index
+    
+    Args:
+        filenames (list): Filenames or unique keys (folder/filename)
+        username (str, optional): Resolve like get_file_info for this user (own folder,
+            then global); None resolves across every folder like find_file_info
+        ambiguous (dict, optional): If given, bare filenames matching files in several
+            folders map to None and are recorded here (filename -> candidate keys)
+            instead of raising
+        
+    Returns:
+        dict: filename -> file metadata, or None if not found
+        
+    Raises:
+        AmbiguousFilenameError: If a bare filename matches files in several folders
+            and no `ambiguous` dict was given
+    """
+    cache = _load_metadata_cache()
+    folders = [username, GLOBAL_FOLDER]
+    
+    def lookup(filename: str) -> Optional[Dict[str, Any]]:
+        try:
+            if username is None:
+                return _cached_find_file_info(cache, filename)
+            return _cached_file_info(cache, filename, username, folders)
+        except AmbiguousFilenameError as e:
+            if ambiguous is None:
+                raise
+            ambiguous[filename] = e.candidates
+            return None
+    
+    return {filename: lookup(filename) for filename in filenames}
+
+def is_image(filename: str) -> bool:
+    """
+    Check if a file is an image based on its extension
+    
+    Args:
+        filename (str): Name of the file to check
         
     Returns:
         bool: True if file is an image, False otherwise
@@ -743,6 +1700,139 @@ def ensure_thumbnails_dir(username: str) -> str:
     os.makedirs(thumbnails_dir, exist_ok=True)
     return thumbnails_dir
 
+def pick_thumbnail_size(requested: Optional[int] = None) -> int:
+    """
+    Map a requested size onto a configured rendition size
+    
+    Args:
+        requested (int): Desired maximum width/height in pixels
+        
+    Returns:
+        int: Smallest rendition at least as large as requested (or the largest one)
+    """
+    if requested is None:
+        return DEFAULT_THUMBNAIL_SIZE
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+def _rendition_path(username: str, filename: str, size: int, image_format: str) -> str:
+    """
+    Path of one rendition. The default-size JPEG keeps the original
+    thumbnails/<filename> location so existing thumbnails stay valid;
+    everything else goes to thumbnails/<size>/<filename>.<ext>
+    """
+    thumbnails_dir = os.path.join(UPLOADS_DIR, username, "thumbnails")
+    if size == DEFAULT_THUMBNAIL_SIZE and image_format == "jpeg":
+        return os.path.join(thumbnails_dir, filename)
+    return os.path.join(thumbnails_dir, str(size), f"{filename}.{THUMBNAIL_FORMATS[image_format]['extension']}")
+
+def _load_rgb_image(img: Image.Image, max_size: Optional[int] = None, fast_decode: bool = True) -> Image.Image:
+    """
+    Decode an image for thumbnailing: apply EXIF orientation and flatten it onto RGB
+    
+    Args:
+        img (Image): Opened, not yet loaded image
+        max_size (int): Largest rendition that will be cut from it
+        fast_decode (bool): Decode JPEGs at reduced resolution when max_size allows
+        
+    Returns:
+        Image: Decoded RGB image
+    """
+    if fast_decode and max_size:
+        width, height = img.size
+        scale = max_size / max(width, height)
+        if scale < 1:
+            # libjpeg scales by 1/2, 1/4 or 1/8 in the DCT domain while decoding,
+            # never below the size asked for, so a 24MP photo bound for a 256px
+            # thumbnail is decoded at 750x500 instead of 6000x4000. No-op for
+            # other formats.
+            img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+    
+    # Handle images with EXIF orientation data
+    img = ImageOps.exif_transpose(img)
+    
+    # Convert to RGB if necessary (handles RGBA, P mode images)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        # Create a white background for transparency
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    return img
+
+def render_renditions(original: Image.Image, sizes: List[int], fast_decode: bool = True) -> Iterator[Tuple[int, Image.Image]]:
+    """
+    Resize an opened image down to each rendition size, largest first
+    
+    Each rendition is cut from the previous (larger) one. The resizes are
+    plain Image.thumbnail() calls, whose reducing_gap already box-reduces by
+    integer factors before the LANCZOS pass; the saving over a full decode
+    comes from _load_rgb_image decoding JPEGs at reduced resolution.
+    
+    Args:
+        original (Image): Opened, not yet loaded image
+        sizes (list): Rendition sizes to produce
+        fast_decode (bool): Decode JPEGs at reduced resolution (see _load_rgb_image)
+        
+    Yields:
+        tuple: (size, image) for each size, largest first
+    """
+    sizes = sorted(set(sizes), reverse=True)
+    img = _load_rgb_image(original, sizes[0], fast_decode)
+    for size in sizes:
+        # Create thumbnail maintaining aspect ratio
+        img.thumbnail((size, size), Image.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+        yield size, img
+
+def generate_renditions(username: str, image_path: str, sizes: Optional[List[int]] = None) -> Dict[int, str]:
+    """
+    Generate the thumbnail pyramid for an image file
+    
+    The original is decoded once, at the lowest resolution that still
+    covers the largest missing rendition, and written as JPEG (plus WebP
+    when Pillow supports it). Renditions that already exist are left alone.
+    
+    Args:
+        username (str): Username of the file owner
+        image_path (str): Full path to the original image
+        sizes (list): Rendition sizes to produce (default: THUMBNAIL_SIZES)
+        
+    Returns:
+        dict: Maps each size to its JPEG rendition path; empty if generation failed
+    """
+    sizes = sorted(set(sizes or THUMBNAIL_SIZES), reverse=True)
+    filename = os.path.basename(image_path)
+    
+    wanted = {
+        size: [fmt for fmt in THUMBNAIL_FORMATS if not os.path.exists(_rendition_path(username, filename, size, fmt))]
+        for size in sizes
+    }
+    missing_sizes = [size for size in sizes if wanted[size]]
+    if missing_sizes:
+        try:
+            with Image.open(image_path) as original:
+                # Larger renditions that already exist don't need decoding for
+                for size, img in render_renditions(original, [size for size in sizes if size <= missing_sizes[0]], THUMBNAIL_FAST_DECODE):
+                    for fmt in wanted[size]:
+                        settings = THUMBNAIL_FORMATS[fmt]
+                        rendition_path = _rendition_path(username, filename, size, fmt)
+                        os.makedirs(os.path.dirname(rendition_path), exist_ok=True)
+                        # Write to a temporary name so readers never see a partial file
+                        temp_path = f"{rendition_path}.tmp"
+                        img.save(temp_path, settings["pil_format"], **settings["options"])
+                        os.replace(temp_path, rendition_path)
+            logging.info(f"Generated renditions {missing_sizes} for {filename}")
+        except Exception as e:
+            logging.error(f"Failed to generate thumbnails for {image_path}: {str(e)}")
+            return {}
+    
+    return {size: _rendition_path(username, filename, size, "jpeg") for size in sizes}
+
 def generate_thumbnail(username: str, image_path: str, thumbnail_size: int = None) -> Optional[str]:
     """
     Generate a thumbnail for an image file
@@ -757,83 +1847,100 @@ def generate_thumbnail(username: str, image_path: str, thumbnail_size: int = Non
     """
     if thumbnail_size is None:
         thumbnail_size = DEFAULT_THUMBNAIL_SIZE
-    try:
-        # Ensure thumbnails directory exists
-        thumbnails_dir = ensure_thumbnails_dir(username)
-        
-        # Get original filename
-        filename = os.path.basename(image_path)
-        
-        # Create thumbnail path
-        thumb_path = os.path.join(thumbnails_dir, filename)
-        
-        # Skip if thumbnail already exists
-        if os.path.exists(thumb_path):
-            logging.info(f"Thumbnail already exists for {filename}")
-            return thumb_path
-        
-        # Open and process the image
-        with Image.open(image_path) as img:
-            # Handle images with EXIF orientation data
-            img = ImageOps.exif_transpose(img)
-            
-            # Convert to RGB if necessary (handles RGBA, P mode images)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                # Create a white background for transparency
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Create thumbnail maintaining aspect ratio
-            img.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS)
-            
-            # Save thumbnail as JPEG with good quality
-            img.save(thumb_path, 'JPEG', quality=85, optimize=True)
-        
-        logging.info(f"Generated thumbnail for {filename}: {thumb_path}")
-        return thumb_path
-        
-    except Exception as e:
-        logging.error(f"Failed to generate thumbnail for {image_path}: {str(e)}")
-        return None
+    return generate_renditions(username, image_path, [thumbnail_size]).get(thumbnail_size)
 
-def get_thumbnail_path(username: str, filename: str) -> Optional[str]:
+def get_thumbnail_path(username: str, filename: str, size: int = None, image_format: str = "jpeg") -> Optional[str]:
     """
     Get the path to a thumbnail file if it exists
     
     Args:
         username (str): Username of the file owner
         filename (str): Name of the original file
+        size (int): Rendition size (default: DEFAULT_THUMBNAIL_SIZE)
+        image_format (str): "jpeg" or "webp"
         
     Returns:
         str: Path to thumbnail if it exists, None otherwise
     """
-    thumbnails_dir = os.path.join(UPLOADS_DIR, username, "thumbnails")
-    thumb_path = os.path.join(thumbnails_dir, filename)
+    if size is None:
+        size = DEFAULT_THUMBNAIL_SIZE
+    if image_format not in THUMBNAIL_FORMATS:
+        return None
+    thumb_path = _rendition_path(username, filename, size, image_format)
     
     return thumb_path if os.path.exists(thumb_path) else None
 
+# Most thumbnails one /thumbnails/batch request may ask for
+THUMBNAIL_BATCH_LIMIT = 100
+
+def pack_thumbnail_batch(items: List[Dict[str, Any]]) -> bytes:
+    """
+    Pack thumbnails into one response body:
+    
+        4 bytes   big-endian length N of the index
+        N bytes   UTF-8 JSON index: {"items": [{"file", "status", "media_type",
+                  "offset", "length", "candidates"}, ...]}, in request order
+        ...       the thumbnails, at `offset` bytes after the end of the index
+    
+    Args:
+        items (list): Dicts with "file", "status" and, for status "ready",
+            "path" and "media_type" (for "ambiguous", "candidates"). Unreadable
+            files become "unavailable".
+        
+    Returns:
+        bytes: The packed batch
+    """
+    index = []
+    blobs = []
+    offset = 0
+    for item in items:
+        entry = {"file": item["file"], "status": item["status"]}
+        if "candidates" in item:
+            entry["candidates"] = item["candidates"]
+        if item["status"] == "ready":
+            try:
+                with open(item["path"], "rb") as f:
+                    data = f.read()
+            except OSError:
+                entry["status"] = "unavailable"
+            else:
+                entry.update(media_type=item["media_type"], offset=offset, length=len(data))
+                blobs.append(data)
+                offset += len(data)
+        index.append(entry)
+    
+    header = json.dumps({"items": index}, separators=(",", ":")).encode()
+    return b"".join([len(header).to_bytes(4, "big"), header, *blobs])
+
+def _thumbnail_files(username: str, filename: str) -> List[str]:
+    """Paths of every existing rendition of a file's thumbnail"""
+    thumbnails_dir = os.path.join(UPLOADS_DIR, username, "thumbnails")
+    candidates = [os.path.join(thumbnails_dir, filename)]
+    # Include size directories that are no longer configured
+    if os.path.isdir(thumbnails_dir):
+        for entry in os.scandir(thumbnails_dir):
+            if entry.is_dir():
+                candidates.extend(
+                    os.path.join(entry.path, f"{filename}.{settings['extension']}")
+                    for settings in _ALL_THUMBNAIL_FORMATS.values()
+                )
+    return [path for path in candidates if os.path.exists(path)]
+
 def delete_thumbnail(username: str, filename: str) -> bool:
     """
-    Delete a thumbnail file if it exists
+    Delete every rendition of a file's thumbnail
     
     Args:
         username (str): Username of the file owner
         filename (str): Name of the original file
         
     Returns:
-        bool: True if thumbnail was deleted or didn't exist, False if deletion failed
+        bool: True if thumbnails were deleted or didn't exist, False if deletion failed
     """
     try:
-        thumbnail_path = get_thumbnail_path(username, filename)
-        if thumbnail_path and os.path.exists(thumbnail_path):
+        for thumbnail_path in _thumbnail_files(username, filename):
             os.remove(thumbnail_path)
             logging.info(f"Deleted thumbnail for {filename}: {thumbnail_path}")
-            return True
         # If thumbnail doesn't exist, that's still considered success
         return True
     except Exception as e:
@@ -852,15 +1959,522 @@ def update_photo_favorite_status(filename: str, username: str, is_favorite: bool
     Returns:
         bool: True if updated successfully, False otherwise
     """
-    metadata = load_metadata()
+    ensure_upload_dir()
     unique_key = f"{username}/{filename}"
     
-    if unique_key in metadata:
-        metadata[unique_key]["is_favorite"] = is_favorite
-        save_metadata(metadata)
-        return True
+    with _index_write() as conn:
+        result = conn.execute(
+            update(photos_table)
+            .where(photos_table.c.unique_key == unique_key)
+            .values(is_favorite=is_favorite)
+        )
+        _index_changed([unique_key])
+    
+    return result.rowcount > 0
+
+BULK_ACTIONS = ("delete", "favorite", "unfavorite", "move_to_global")
+
+def _resolve_bulk_item(cache: Dict[str, Any], filename: str, username: Optional[str],
+                       is_admin: bool) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Resolve one bulk item against an index snapshot, with the same rules as delete_file
+    
+    Returns:
+        tuple: (record, None), or (None, error message)
+    """
+    # Handle both old format (just filename) and new format (folder/filename)
+    unique_key = filename
+    if "/" not in filename and username:
+        unique_key = f"{username}/{filename}"
+    record = cache["records"].get(unique_key)
+    if record is None and is_admin and "/" not in filename:
+        try:
+            record = _single_match(cache, filename)
+        except AmbiguousFilenameError as e:
+            return None, str(e)
+    if record is None:
+        return None, "File not found or permission denied"
+    if not is_admin and username is not None:
+        if record.get("uploaded_by") != username and record.get("folder") != username:
+            return None, "File not found or permission denied"
+    return record, None
+
+def _remove_photo_files(record: Dict[str, Any]) -> Optional[str]:
+    """Delete a photo and its thumbnails from disk; returns an error message on failure"""
+    try:
+        file_path = os.path.join(UPLOADS_DIR, record["file_path"])
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    except OSError as e:
+        return str(e)
+    if is_image(record["filename"]):
+        delete_thumbnail(record["folder"], record["filename"])
+    return None
+
+def _move_photo_files(record: Dict[str, Any]) -> Optional[str]:
+    """Move a photo and its thumbnails into the global folder; returns an error message on failure"""
+    source_dir = os.path.join(UPLOADS_DIR, record["folder"])
+    target_dir = get_global_folder_path()
+    filename = record["filename"]
+    try:
+        # link() refuses to replace an existing global file, unlike rename()
+        os.link(os.path.join(source_dir, filename), os.path.join(target_dir, filename))
+        os.remove(os.path.join(source_dir, filename))
+    except FileExistsError:
+        return "A file with this name already exists in the global folder"
+    except OSError as e:
+        return str(e)
+    for thumbnail_path in _thumbnail_files(record["folder"], filename):
+        target_path = os.path.join(target_dir, os.path.relpath(thumbnail_path, source_dir))
+        try:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            os.replace(thumbnail_path, target_path)
+        except OSError as e:
+            # The thumbnail is regenerated on demand
+            logging.warning(f"Failed to move thumbnail for {filename}: {str(e)}")
+    return None
+
+def bulk_update_photos(action: str, filenames: List[str], username: Optional[str] = None,
+                       is_admin: bool = False) -> List[Dict[str, Any]]:
+    """
+    Apply one action to many photos. Every name is resolved against a single index
+    snapshot and the index changes commit in one transaction. Deletes move the
+    photos to the trash; moves relocate the files concurrently on the upload I/O pool.
+    
+    Args:
+        action (str): One of BULK_ACTIONS
+        filenames (list): Filenames or unique keys (folder/filename)
+        username (str, optional): Acting user; only their own photos are changed
+        is_admin (bool, optional): If True, allow changing any photo
+        
+    Returns:
+        list: One result per requested name, in order, with filename, success,
+        key (once resolved), new_key (for moves) and error (on failure)
+        
+    Raises:
+        ValueError: If the action is unknown
+    """
+    if action not in BULK_ACTIONS:
+        raise ValueError(f"action must be one of: {', '.join(BULK_ACTIONS)}")
+    
+    cache = _load_metadata_cache()
+    results = []
+    targets: Dict[str, Dict[str, Any]] = {}
+    for filename in filenames:
+        result = {"filename": filename, "success": False}
+        results.append(result)
+        record, error = _resolve_bulk_item(cache, filename, username, is_admin)
+        if record is None:
+            result["error"] = error
+            continue
+        result["key"] = key = _record_key(record)
+        if action == "move_to_global":
+            result["new_key"] = f"{GLOBAL_FOLDER}/{record['filename']}"
+            if record["folder"] == GLOBAL_FOLDER:
+                result["error"] = "Already in the global folder"
+                continue
+            if result["new_key"] in cache["records"]:
+                result["error"] = "A file with this name already exists in the global folder"
+                continue
+        targets[key] = record
+    
+    keys = list(targets)
+    errors: Dict[str, Optional[str]] = {}
+    if action == "delete" and keys:
+        # Files stay in place until the trash purger removes them
+        with _index_write() as conn:
+            _move_to_trash(conn, keys, username)
+    elif action == "move_to_global" and keys:
+        # Hold off the reconciler until the index follows the files, or it would
+        # drop the moved rows as stale and index the files again as bare new ones
+        with _reconcile_lock:
+            errors = dict(zip(keys, _upload_io_executor.map(_move_photo_files, targets.values())))
+            moves = [{"old_key": key, "new_key": f"{GLOBAL_FOLDER}/{targets[key]['filename']}"}
+                     for key in keys if errors[key] is None]
+            if moves:
+                with _index_write() as conn:
+                    conn.execute(
+                        update(photos_table)
+                        .where(photos_table.c.unique_key == bindparam("old_key"))
+                        .values(unique_key=bindparam("new_key"), file_path=bindparam("new_key"), folder=GLOBAL_FOLDER),
+                        moves,
+                    )
+                    _index_changed([move["old_key"] for move in moves] + [move["new_key"] for move in moves])
+    elif keys:
+        with _index_write() as conn:
+            for i in range(0, len(keys), 500):
+                conn.execute(
+                    update(photos_table)
+                    .where(photos_table.c.unique_key.in_(keys[i:i + 500]))
+                    .values(is_favorite=action == "favorite")
+                )
+            _index_changed(keys)
+    
+    for result in results:
+        if result.get("key") in targets:
+            error = errors.get(result["key"])
+            if error is None:
+                result["success"] = True
+            else:
+                result["error"] = error
+    return results
+
+# Trash. Deleting moves a photo's row from photos to photo_trash in the same
+# transaction as any other index write, so the photo vanishes from every
+# listing at once while its files stay on disk. A background purger unlinks
+# the files of rows past purge_after, paced to TRASH_PURGE_BYTES_PER_SECOND
+# so purging a pile of large videos doesn't starve uploads and browsing. A row
+# stays in the trash until its files are unlinked, so the reconciler never
+# mistakes a file awaiting its purge for a new one.
+_TRASH_ROW_COLUMNS = [column.name for column in photos_table.columns if column.name not in ("id", "created_at")]
+TRASH_PURGE_INTERVAL = 60.0
+# A purge claimed longer ago than this was abandoned (the server stopped mid-purge)
+TRASH_PURGE_CLAIM_TIMEOUT = 3600
+_trash_purge_stop = threading.Event()
+_trash_purge_wake = threading.Event()
+_trash_purge_thread: Optional[threading.Thread] = None
+_trash_stats = {"purged_files": 0, "purged_bytes": 0}
+
+def _move_to_trash(conn, unique_keys: List[str], deleted_by: Optional[str]) -> List[str]:
+    """
+    Move index rows to the trash inside an open index write
     
-    return False
+    Args:
+        conn: Connection from _index_write
+        unique_keys (list): Keys of the photos to delete
+        deleted_by (str): User deleting them
+        
+    Returns:
+        list: Keys that were moved
+    """
+    rows = []
+    # Stay well below SQLite's bound-parameter limit
+    for i in range(0, len(unique_keys), 500):
+        rows.extend(conn.execute(
+            select(photos_table).where(photos_table.c.unique_key.in_(unique_keys[i:i + 500]))
+        ).all())
+    if not rows:
+        return []
+    
+    now = datetime.now()
+    purge_after = (now + timedelta(days=TRASH_RETENTION_DAYS)).isoformat()
+    trash_rows = [{
+        "unique_key": row.unique_key,
+        "filename": row.filename,
+        "folder": row.folder,
+        "file_path": row.file_path,
+        "uploaded_by": row.uploaded_by,
+        "file_size": row.file_size,
+        "deleted_by": deleted_by or row.uploaded_by,
+        "deleted_at": now.isoformat(),
+        "purge_after": purge_after,
+        "row_json": json.dumps({column: row._mapping[column] for column in _TRASH_ROW_COLUMNS}),
+        "purge_started": None,
+    } for row in rows]
+    statement = sqlite_insert(photo_trash_table)
+    # A leftover trash row for the same path describes the same file
+    conn.execute(statement.on_conflict_do_update(
+        index_elements=[photo_trash_table.c.unique_key],
+        set_={key: statement.excluded[key] for key in trash_rows[0] if key != "unique_key"},
+    ), trash_rows)
+    moved = [row.unique_key for row in rows]
+    for i in range(0, len(moved), 500):
+        conn.execute(delete(photos_table).where(photos_table.c.unique_key.in_(moved[i:i + 500])))
+    _index_changed(moved)
+    return moved
+
+def _trash_item(row) -> Dict[str, Any]:
+    """API representation of a photo_trash row"""
+    return {
+        "key": row.unique_key,
+        "filename": row.filename,
+        "folder": row.folder,
+        "uploaded_by": row.uploaded_by,
+        "file_size": row.file_size,
+        "size": format_file_size(row.file_size),
+        "deleted_by": row.deleted_by,
+        "deleted_at": row.deleted_at,
+        "purge_after": row.purge_after,
+    }
+
+def _trash_owner_clause(username: Optional[str], is_admin: bool):
+    """Trash rows a user may see, restore and purge: like deletes, their own folder or uploads"""
+    if is_admin or username is None:
+        return true()
+    return or_(photo_trash_table.c.folder == username, photo_trash_table.c.uploaded_by == username)
+
+def _trash_keys(filenames: List[str], username: Optional[str]) -> List[str]:
+    """Unique keys for trash requests; bare filenames mean the user's own folder"""
+    return [filename if "/" in filename or not username else f"{username}/{filename}" for filename in filenames]
+
+def get_trash(username: Optional[str] = None, is_admin: bool = False, limit: int = 500) -> List[Dict[str, Any]]:
+    """
+    List trashed photos, most recently deleted first
+    
+    Args:
+        username (str, optional): Only list this user's photos
+        is_admin (bool, optional): If True, list every trashed photo
+        limit (int): Maximum number of items
+        
+    Returns:
+        list: Trash items with key, file details, deleted_at and purge_after
+    """
+    with get_sync_engine().connect() as conn:
+        rows = conn.execute(
+            select(photo_trash_table)
+            .where(_trash_owner_clause(username, is_admin))
+            .order_by(photo_trash_table.c.deleted_at.desc(), photo_trash_table.c.id.desc())
+            .limit(limit)
+        ).all()
+    return [_trash_item(row) for row in rows]
+
+def restore_photos(filenames: List[str], username: Optional[str] = None, is_admin: bool = False) -> List[Dict[str, Any]]:
+    """
+    Move trashed photos back into the photo index in one transaction
+    
+    Args:
+        filenames (list): Filenames or unique keys (folder/filename) of trashed photos
+        username (str, optional): Acting user; only their own photos are restored
+        is_admin (bool, optional): If True, allow restoring any photo
+        
+    Returns:
+        list: One result per requested name, in order, with filename, key, success and error
+    """
+    keys = _trash_keys(filenames, username)
+    results = [{"filename": filename, "key": key, "success": False} for filename, key in zip(filenames, keys)]
+    with _index_write() as conn:
+        trashed = {}
+        existing = set()
+        unique = list(dict.fromkeys(keys))
+        for i in range(0, len(unique), 500):
+            chunk = unique[i:i + 500]
+            trashed.update((row.unique_key, row) for row in conn.execute(
+                select(photo_trash_table)
+                .where(photo_trash_table.c.unique_key.in_(chunk), _trash_owner_clause(username, is_admin))
+            ))
+            existing.update(conn.execute(
+                select(photos_table.c.unique_key).where(photos_table.c.unique_key.in_(chunk))
+            ).scalars())
+        
+        restorable = {}
+        for result in results:
+            key = result["key"]
+            row = trashed.get(key)
+            if row is None:
+                result["error"] = "Not in the trash or permission denied"
+            elif key in existing:
+                result["error"] = "A photo with this name exists again"
+            elif row.purge_started is not None:
+                result["error"] = "The file is being purged"
+            elif not os.path.isfile(os.path.join(UPLOADS_DIR, row.file_path)):
+                result["error"] = "The file has already been purged"
+            else:
+                restorable[key] = row
+                result["success"] = True
+        
+        if restorable:
+            conn.execute(insert(photos_table), [json.loads(row.row_json) for row in restorable.values()])
+            restored = list(restorable)
+            for i in range(0, len(restored), 500):
+                conn.execute(delete(photo_trash_table).where(photo_trash_table.c.unique_key.in_(restored[i:i + 500])))
+            _index_changed(restored)
+    return results
+
+def purge_trash(filenames: Optional[List[str]] = None, username: Optional[str] = None, is_admin: bool = False) -> int:
+    """
+    Schedule trashed photos for purging now instead of after the retention window
+    
+    Args:
+        filenames (list, optional): Filenames or unique keys to purge; None empties
+            the user's whole trash
+        username (str, optional): Acting user; only their own photos are purged
+        is_admin (bool, optional): If True, allow purging any photo
+        
+    Returns:
+        int: Number of trashed photos scheduled
+    """
+    statement = (
+        update(photo_trash_table)
+        .where(_trash_owner_clause(username, is_admin))
+        .values(purge_after=datetime.now().isoformat())
+    )
+    scheduled = 0
+    with get_sync_engine().begin() as conn:
+        if filenames is None:
+            scheduled = conn.execute(statement).rowcount
+        else:
+            keys = _trash_keys(filenames, username)
+            for i in range(0, len(keys), 500):
+                scheduled += conn.execute(
+                    statement.where(photo_trash_table.c.unique_key.in_(keys[i:i + 500]))
+                ).rowcount
+    _trash_purge_wake.set()
+    return scheduled
+
+def _claim_due_trash() -> Optional[Any]:
+    """
+    Mark the next trash row past purge_after as being purged. The row stays (and
+    restores refuse it) until _finish_trash_purge, so its file is never unlisted
+    while still on disk; claims are taken one at a time, right before the unlink.
+    """
+    now = datetime.now()
+    abandoned = (now - timedelta(seconds=TRASH_PURGE_CLAIM_TIMEOUT)).isoformat()
+    due = (
+        select(photo_trash_table.c.id)
+        .where(
+            photo_trash_table.c.purge_after <= now.isoformat(),
+            or_(photo_trash_table.c.purge_started.is_(None), photo_trash_table.c.purge_started < abandoned),
+        )
+        .order_by(photo_trash_table.c.purge_after)
+        .limit(1)
+    )
+    with get_sync_engine().begin() as conn:
+        return conn.execute(
+            update(photo_trash_table)
+            .where(photo_trash_table.c.id == due.scalar_subquery())
+            .values(purge_started=now.isoformat())
+            .returning(photo_trash_table.c.id, photo_trash_table.c.filename, photo_trash_table.c.folder,
+                       photo_trash_table.c.file_path, photo_trash_table.c.file_size)
+        ).first()
+
+def _finish_trash_purge(trash_id: int):
+    """Drop a trash row once its files are unlinked"""
+    with get_sync_engine().begin() as conn:
+        conn.execute(delete(photo_trash_table).where(photo_trash_table.c.id == trash_id))
+
+def _trash_purge_loop():
+    """Unlink the files of due trash rows, pacing the I/O to the purge budget"""
+    while not _trash_purge_stop.is_set():
+        try:
+            row = _claim_due_trash()
+        except Exception as e:
+            logging.warning(f"Trash purge failed: {str(e)}")
+            row = None
+        if row is None:
+            _trash_purge_wake.wait(TRASH_PURGE_INTERVAL)
+            _trash_purge_wake.clear()
+            continue
+        # A failed purge keeps its claim and is retried once the claim is abandoned
+        error = _remove_photo_files(row._mapping)
+        if error:
+            logging.warning(f"Failed to purge {row.file_path}: {error}")
+            continue
+        try:
+            _finish_trash_purge(row.id)
+        except Exception as e:
+            logging.warning(f"Failed to drop trash row for {row.file_path}: {str(e)}")
+        _trash_stats["purged_files"] += 1
+        _trash_stats["purged_bytes"] += row.file_size
+        # Pace between claims, so nothing waits claimed while the budget refills
+        _trash_purge_stop.wait(row.file_size / TRASH_PURGE_BYTES_PER_SECOND)
+
+def start_trash_purger():
+    """
+    Start the background thread that purges expired trash
+    """
+    global _trash_purge_thread
+    if _trash_purge_thread is not None and _trash_purge_thread.is_alive():
+        return
+    _trash_purge_stop.clear()
+    _trash_purge_thread = threading.Thread(target=_trash_purge_loop, name="photo-trash-purger", daemon=True)
+    _trash_purge_thread.start()
+
+def stop_trash_purger():
+    """
+    Stop the trash purger thread
+    """
+    global _trash_purge_thread
+    _trash_purge_stop.set()
+    _trash_purge_wake.set()
+    if _trash_purge_thread is not None:
+        _trash_purge_thread.join()
+        _trash_purge_thread = None
+
+def get_trash_stats() -> Dict[str, Any]:
+    """
+    Get the size of the trash and what the purger has removed
+    
+    Returns:
+        dict: Trash statistics
+    """
+    with get_sync_engine().connect() as conn:
+        count, size = conn.execute(
+            select(func.count(), func.coalesce(func.sum(photo_trash_table.c.file_size), 0))
+        ).one()
+    return dict(_trash_stats, trashed_files=count, trashed_bytes=size,
+                retention_days=TRASH_RETENTION_DAYS, running=_trash_purge_thread is not None)
+
+# /photos sort orders: sort_by -> (sort expression, descending). Ties are
+# broken by unique_key so every position in a listing is unique.
+_PAGE_ORDERS = {
+    "date": (photos_table.c.upload_date, True),
+    "name": (func.lower(photos_table.c.filename), False),
+    "size": (photos_table.c.file_size, True),
+    "taken": (photos_table.c.taken_at, True),
+}
+
+# The photos_search FTS5 index (see database.py); rowid is photos.id and rank
+# is the bm25 relevance of the current MATCH (lower is better)
+_photos_search = table(PHOTO_SEARCH_TABLE, column("rowid"), column("rank"))
+# The trigram tokenizer can only look up queries of at least 3 characters
+SEARCH_MIN_INDEXED_LENGTH = 3
+
+def _search_match(search: str):
+    """MATCH clause finding `search` as a substring of any indexed column"""
+    phrase = '"' + search.replace('"', '""') + '"'
+    return literal_column(PHOTO_SEARCH_TABLE).op("MATCH")(phrase)
+
+def _search_indexed(search: str) -> bool:
+    """Whether a search can use the photos_search index"""
+    return search_index_available() and len(search) >= SEARCH_MIN_INDEXED_LENGTH
+
+# Searches matching at most this many photos are read from the search index
+# and sorted; broader ones walk the sort index and keep the photos that match
+SEARCH_SORT_MATCH_LIMIT = int(os.environ.get("PHOTO_SEARCH_SORT_MATCH_LIMIT", "5000"))
+
+def _search_scan_clause(search: str):
+    """
+    Filter matching photos whose filename, original name or camera make/model
+    contains `search` (case-insensitive), checked row by row. Used for searches
+    the photos_search index can't answer.
+    """
+    needle = func.lower(search)
+    metadata_json = photos_table.c.metadata_json
+    camera = [
+        case((func.json_valid(metadata_json) == 1, func.json_extract(metadata_json, path)))
+        for path in ("$.camera_make", "$.camera_model")
+    ]
+    return or_(*(
+        func.instr(func.lower(value), needle) > 0
+        for value in (photos_table.c.filename, photos_table.c.original_name, *camera)
+    ))
+
+def _search_ranking(search: str):
+    """Photo ids matching `search` with their bm25 rank (lower is more relevant)"""
+    return select(_photos_search.c.rowid, _photos_search.c.rank).where(_search_match(search)).subquery("ranking")
+
+def _encode_cursor(sort_by: str, sort_value: Any, unique_key: str) -> str:
+    """Opaque cursor pointing just past the given listing position"""
+    payload = json.dumps([sort_by, sort_value, unique_key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def _decode_cursor(cursor: str, sort_by: str) -> Tuple[Any, str]:
+    """
+    Decode a cursor from _encode_cursor
+    
+    Returns:
+        tuple: (sort value, unique_key) of the last item of the previous page
+        
+    Raises:
+        ValueError: If the cursor is malformed or was issued for another sort order
+    """
+    try:
+        cursor_sort, sort_value, unique_key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if cursor_sort != sort_by:
+        raise ValueError("Cursor was issued for a different sort order")
+    return sort_value, unique_key
 
 def get_photos_paginated(
     username: Optional[str] = None,
@@ -870,84 +2484,260 @@ def get_photos_paginated(
     sort_by: str = "date",
     search: Optional[str] = None,
     date_from: Optional[str] = None,
-    date_to: Optional[str] = None
+    date_to: Optional[str] = None,
+    cursor: Optional[str] = None,
+    folder: Optional[str] = None,
+    count_total: bool = True
 ) -> Dict[str, Any]:
     """
     Get paginated photos with filtering and sorting
     
+    Pages are fetched by keyset: pass the previous page's next_cursor (with
+    the same filters and sort) to continue right after its last photo. Each
+    page is an index range scan of at most limit + 1 rows per folder, so it
+    costs the same at any depth. offset is still honoured when no cursor is
+    given, but deep offsets have to skip every earlier row.
+    
     Args:
         username (str, optional): Filter by username (None for all accessible photos)
         limit (int): Number of photos to return (max 100)
-        offset (int): Number of photos to skip
+        offset (int): Number of photos to skip (ignored when cursor is given)
         favorite (bool, optional): Filter by favorite status
-        sort_by (str): Sort field ("date", "name", "size")
-        search (str, optional): Search in filename
+        sort_by (str): Sort field ("date" uploaded, "taken", "name", "size", or "relevance"
+            with a search of at least SEARCH_MIN_INDEXED_LENGTH characters; otherwise "date")
+        search (str, optional): Substring of the filename, original name or camera make/model
         date_from (str, optional): Filter by date from (ISO format)
         date_to (str, optional): Filter by date to (ISO format)
+        cursor (str, optional): next_cursor from the previous page
+        folder (str, optional): Only list this folder (if accessible)
+        count_total (bool): Count the matching photos for the first page; counting
+            reads every match, so pages that don't show the total can skip it
         
     Returns:
-        dict: Paginated results with photos and metadata
+        dict: Paginated results with photos and metadata. total is only
+        counted for the first page (it is None when a cursor is given or
+        count_total is False).
+        
+    Raises:
+        ValueError: If the cursor is invalid
     """
-    metadata = load_metadata()
-    
-    # Get all accessible photos
-    if username:
-        # User can see their own photos + global photos
-        accessible_photos = []
-        for unique_key, info in metadata.items():
-            if info.get("folder") == username or info.get("folder") == GLOBAL_FOLDER:
-                accessible_photos.append(info)
-    else:
-        # Admin can see all photos
-        accessible_photos = list(metadata.values())
-    
     # Apply filters
-    filtered_photos = []
-    for photo in accessible_photos:
-        # Favorite filter
-        if favorite is not None and photo.get("is_favorite", False) != favorite:
-            continue
-            
-        # Search filter
-        if search and search.lower() not in photo.get("filename", "").lower():
-            continue
-            
-        # Date filters
-        upload_date = photo.get("upload_date", "")
-        if date_from and upload_date < date_from:
-            continue
-        if date_to and upload_date > date_to:
-            continue
-            
-        filtered_photos.append(photo)
+    conditions = []
+    if favorite is not None:
+        conditions.append(photos_table.c.is_favorite == favorite)
+    indexed_search = bool(search) and _search_indexed(search)
+    if search and not indexed_search:
+        conditions.append(_search_scan_clause(search))
+    if date_from:
+        conditions.append(photos_table.c.upload_date >= date_from)
+    if date_to:
+        conditions.append(photos_table.c.upload_date <= date_to)
     
     # Sort photos
-    if sort_by == "name":
-        filtered_photos.sort(key=lambda x: x.get("filename", "").lower())
-    elif sort_by == "size":
-        filtered_photos.sort(key=lambda x: x.get("file_size", 0), reverse=True)
-    else:  # Default to date
-        filtered_photos.sort(key=lambda x: x.get("upload_date", ""), reverse=True)
-    
-    # Apply pagination
-    total_count = len(filtered_photos)
-    limit = min(limit, 100)  # Cap at 100
-    paginated_photos = filtered_photos[offset:offset + limit]
-    
-    # Format response with URLs
-    photos_with_urls = []
-    for photo in paginated_photos:
-        photo_data = photo.copy()
-        # Add URLs
-        filename = photo_data.get("filename", "")
-        photo_data["thumbnail_url"] = f"/thumbnails/{filename}" if photo_data.get("has_thumbnail") else None
-        photo_data["original_url"] = f"/uploads/{photo_data.get('file_path', '')}"
-        photos_with_urls.append(photo_data)
+    source = photos_table
+    ranking = None
+    if sort_by == "relevance" and indexed_search:
+        # Join the matches once so each rank is computed in a single index pass
+        ranking = _search_ranking(search)
+        source = photos_table.join(ranking, ranking.c.rowid == photos_table.c.id)
+        sort_expr, descending = ranking.c.rank, False
+    else:
+        if sort_by not in _PAGE_ORDERS:
+            sort_by = "date"
+        sort_expr, descending = _PAGE_ORDERS[sort_by]
+    unique_key = photos_table.c.unique_key
+    order_by = (sort_expr.desc(), unique_key.desc()) if descending else (sort_expr, unique_key)
+    
+    def page_query(*extra_conditions):
+        return (
+            select(photos_table, sort_expr.label("sort_value"))
+            .select_from(source)
+            .where(*conditions, *extra_conditions)
+            .order_by(*order_by)
+        )
     
+    ensure_upload_dir()
+    limit = min(limit, 100)  # Cap at 100
+    total_count = None
+    with get_sync_engine().connect() as conn:
+        # SQLite can't estimate how many photos a MATCH returns, so choose the
+        # plan here and pin it: `folder || ''` keeps SQLite off the folder
+        # indexes, `id + 0` keeps it from looking matches up by id
+        search_conditions, folder_column = [], photos_table.c.folder
+        count_conditions, count_folder = [], photos_table.c.folder
+        per_folder = True
+        if ranking is not None:
+            folder_column = count_folder = photos_table.c.folder.concat("")
+            per_folder = False
+        elif indexed_search:
+            matches = select(_photos_search.c.rowid).where(_search_match(search))
+            match_ids = conn.execute(matches.limit(SEARCH_SORT_MATCH_LIMIT + 1)).scalars().all()
+            if len(match_ids) <= SEARCH_SORT_MATCH_LIMIT:
+                # Few matches: look them up by id and sort them
+                search_conditions = count_conditions = [photos_table.c.id.in_(match_ids)]
+                folder_column = count_folder = photos_table.c.folder.concat("")
+                per_folder = False
+            else:
+                # Many: walk the sort index and keep the photos that match.
+                # Counting visits every match either way, so it starts from them.
+                search_conditions = [(photos_table.c.id + 0).in_(matches)]
+                count_conditions = [photos_table.c.id.in_(matches)]
+                count_folder = photos_table.c.folder.concat("")
+        
+        # User can see their own photos + global photos; admin can see all photos
+        accessible = [_accessible_folders_clause(username, folder_column)] if username else []
+        count_accessible = [_accessible_folders_clause(username, count_folder)] if username else []
+        if folder is not None:
+            accessible.append(folder_column == folder)
+            count_accessible.append(count_folder == folder)
+        if cursor is None and count_total:
+            total_count = conn.execute(
+                select(func.count()).select_from(source).where(
+                    *conditions, *count_conditions, *count_accessible
+                )
+            ).scalar_one()
+        
+        if cursor is None and offset:
+            rows = conn.execute(
+                page_query(*search_conditions, *accessible).limit(limit + 1).offset(offset)
+            ).all()
+        else:
+            after = []
+            if cursor is not None:
+                last_value, last_key = _decode_cursor(cursor, sort_by)
+                position, last = tuple_(sort_expr, unique_key), tuple_(last_value, last_key)
+                # The plain bound on the sort value lets SQLite seek expression
+                # indexes (lower(filename)), which it won't do for row values alone
+                if descending:
+                    after = [sort_expr <= last_value, position < last]
+                else:
+                    after = [sort_expr >= last_value, position > last]
+            # One index range per folder, merged here (a search that starts
+            # from its matches reads them all in one query instead)
+            if username and per_folder:
+                folder_conditions = [
+                    [folder_column == name] for name in dict.fromkeys([username, GLOBAL_FOLDER])
+                    if folder in (None, name)
+                ]
+            else:
+                folder_conditions = [accessible]
+            rows = []
+            for folder_condition in folder_conditions:
+                rows.extend(conn.execute(
+                    page_query(*search_conditions, *folder_condition, *after).limit(limit + 1)
+                ).all())
+            rows.sort(key=lambda row: (row.sort_value, row.unique_key), reverse=descending)
+    
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = _encode_cursor(sort_by, rows[-1].sort_value, rows[-1].unique_key) if has_more else None
+    
+    # URLs are signed per viewer by the API layer (python/signed_urls.py)
     return {
-        "photos": photos_with_urls,
+        "photos": [_row_to_record(row) for row in rows],
         "total": total_count,
         "limit": limit,
-        "offset": offset,
-        "has_more": offset + limit < total_count
+        "offset": offset if cursor is None else None,
+        "has_more": has_more,
+        "next_cursor": next_cursor
+    }
+
+# Timeline granularities -> length of the date prefix ("2024", "2024-05", "2024-05-17")
+TIMELINE_GRANULARITIES = {"year": 4, "month": 7, "day": 10}
+
+def timeline_cursor(period: str) -> str:
+    """
+    Cursor that makes /photos?sort_by=taken start at the newest photo taken
+    during `period` (or before it, if there are none)
+    
+    Args:
+        period (str): "YYYY", "YYYY-MM" or "YYYY-MM-DD"
+        
+    Returns:
+        str: Cursor for get_photos_paginated(sort_by="taken")
+        
+    Raises:
+        ValueError: If period is not a valid year, month or day
+    """
+    # Position the cursor at the start of the next period; taken_at values
+    # are ISO strings, so every one inside the period sorts before it
+    if len(period) == 4:
+        end = str(int(period) + 1).zfill(4)
+    elif len(period) == 7:
+        start = datetime.strptime(period, "%Y-%m")
+        end = f"{start.year + start.month // 12:04d}-{start.month % 12 + 1:02d}"
+    elif len(period) == 10:
+        end = (datetime.strptime(period, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    else:
+        raise ValueError("Period must be YYYY, YYYY-MM or YYYY-MM-DD")
+    return _encode_cursor("taken", end, "")
+
+def get_timeline(username: Optional[str] = None, granularity: str = "month") -> Dict[str, Any]:
+    """
+    Count photos per year, month or day taken, newest first. Read from the
+    photo_day_counts aggregate (kept current by triggers), so the cost
+    depends on the number of days with photos, not the number of photos.
+    
+    Args:
+        username (str, optional): Count the user's own and global photos (None for all)
+        granularity (str): "year", "month" or "day"
+        
+    Returns:
+        dict: granularity, total and buckets of {period, count, cursor}; each
+        cursor starts /photos?sort_by=taken at that period
+        
+    Raises:
+        ValueError: If granularity is unknown
+    """
+    if granularity not in TIMELINE_GRANULARITIES:
+        raise ValueError(f"granularity must be one of: {', '.join(TIMELINE_GRANULARITIES)}")
+    ensure_upload_dir()
+    
+    day_counts = photo_day_counts_table.c
+    period = func.substr(day_counts.day, 1, TIMELINE_GRANULARITIES[granularity])
+    query = (
+        select(period.label("period"), func.sum(day_counts.count).label("count"))
+        .where(day_counts.day != "")
+        .group_by(period)
+        .order_by(period.desc())
+    )
+    if username:
+        query = query.where(day_counts.folder.in_([username, GLOBAL_FOLDER]))
+    with get_sync_engine().connect() as conn:
+        rows = conn.execute(query).all()
+    
+    buckets = []
+    for row in rows:
+        try:
+            cursor = timeline_cursor(row.period)
+        except ValueError:
+            # A date_taken we couldn't normalise; still counted, but not a jump target
+            cursor = None
+        buckets.append({"period": row.period, "count": row.count, "cursor": cursor})
+    return {
+        "granularity": granularity,
+        "total": sum(bucket["count"] for bucket in buckets),
+        "buckets": buckets,
     }
+
+def get_folder_counts(folders: Optional[List[str]] = None) -> Dict[str, int]:
+    """
+    Count photos per folder from the photo_day_counts aggregate, so the cost
+    doesn't grow with the number of photos
+    
+    Args:
+        folders (list, optional): Folders to count (None for every folder)
+        
+    Returns:
+        dict: folder -> number of photos (0 for requested folders without any)
+    """
+    ensure_upload_dir()
+    day_counts = photo_day_counts_table.c
+    query = select(day_counts.folder, func.sum(day_counts.count)).group_by(day_counts.folder)
+    if folders is not None:
+        query = query.where(day_counts.folder.in_(folders))
+    with get_sync_engine().connect() as conn:
+        counts = {folder: int(count) for folder, count in conn.execute(query)}
+    if folders is not None:
+        counts = {folder: counts.get(folder, 0) for folder in folders}
+    return counts
@@ -0,0 +1,124 @@
+"""
+Short-lived signed URLs for thumbnails and originals.
+/photos hands out URLs that carry the viewer's username, the file's content
+version and an expiry, HMAC-signed with a server key, so <img> and <video>
+tags can load them without an Authorization header. Expiries are rounded to
+fixed windows, so a file listed again within a window gets the very same URL
+and browsers can cache the response as immutable; a changed file gets a new
+version and therefore a new URL.
+"""
+
+import hashlib
+import hmac
+import os
+import time
+from typing import Any, Dict, Mapping, Optional
+from urllib.parse import quote, urlencode
+
+# Defaults to a key derived from the JWT secret (so the two never verify each other)
+URL_SIGNING_KEY = (
+    os.environ.get("PHOTO_URL_SIGNING_KEY", "").encode()
+    or hmac.new(os.environ.get("SECRET_KEY", "your-secret-key").encode(),
+                b"signed file urls", hashlib.sha256).digest()
+)
+# URLs stay valid for between one and two of these windows (seconds)
+SIGNED_URL_TTL = int(os.environ.get("PHOTO_SIGNED_URL_TTL", 3600))
+
+THUMBNAIL = "thumbnail"
+ORIGINAL = "original"
+
+def content_version(record: Dict[str, Any]) -> str:
+    """
+    Short tag that changes whenever the file behind a record is replaced
+
+    Args:
+        record (dict): File metadata from the photo index
+
+    Returns:
+        str: Version tag for the v= URL parameter
+    """
+    if record.get("content_hash"):
+        return record["content_hash"][:12]
+    source = f"{record.get('upload_date')}|{record.get('file_size')}"
+    return hashlib.sha256(source.encode()).hexdigest()[:12]
+
+def url_window(now: Optional[float] = None) -> int:
+    """
+    Index of the current expiry window; every URL signed within it is identical
+
+    Args:
+        now (float, optional): Current time, for tests
+
+    Returns:
+        int: Window number
+    """
+    return int(now if now is not None else time.time()) // SIGNED_URL_TTL
+
+def _signature(kind: str, folder: str, filename: str, username: str, version: str, expires: int) -> str:
+    """HMAC over everything a signed URL grants"""
+    message = "\n".join([kind, folder, filename, username, version, str(expires)])
+    return hmac.new(URL_SIGNING_KEY, message.encode(), hashlib.sha256).hexdigest()[:32]
+
+def sign_url(kind: str, record: Dict[str, Any], username: str, now: Optional[float] = None) -> str:
+    """
+    Build a signed /thumbnails or /uploads URL for a file
+
+    Args:
+        kind (str): THUMBNAIL or ORIGINAL
+        record (dict): File metadata from the photo index
+        username (str): Viewer the URL is issued to
+        now (float, optional): Current time, for tests
+
+    Returns:
+        str: Root-relative URL
+    """
+    folder, filename = record["folder"], record["filename"]
+    version = content_version(record)
+    expires = (url_window(now) + 2) * SIGNED_URL_TTL
+    params = {"u": username, "v": version, "exp": expires,
+              "sig": _signature(kind, folder, filename, username, version, expires)}
+    if kind == THUMBNAIL:
+        return f"/thumbnails/{quote(filename)}?{urlencode({'folder': folder, **params})}"
+    return f"/uploads/{quote(folder)}/{quote(filename)}?{urlencode(params)}"
+
+def file_urls(record: Dict[str, Any], username: str) -> Dict[str, Optional[str]]:
+    """
+    Signed thumbnail_url (None until the thumbnail is ready) and original_url for a record
+    """
+    return {
+        "thumbnail_url": sign_url(THUMBNAIL, record, username) if record.get("has_thumbnail") else None,
+        "original_url": sign_url(ORIGINAL, record, username),
+    }
+
+def verify_signed_url(kind: str, record: Dict[str, Any], params: Mapping[str, str]) -> Optional[str]:
+    """
+    Check a request's signed-URL parameters against the file it asks for
+
+    Args:
+        kind (str): THUMBNAIL or ORIGINAL
+        record (dict): Index record of the requested file
+        params (mapping): The request's query parameters
+
+    Returns:
+        str or None: Username the URL was issued to, or None if the signature is
+        invalid, expired or for another version of the file
+    """
+    try:
+        expires = int(params.get("exp", ""))
+    except ValueError:
+        return None
+    username, version = params.get("u", ""), params.get("v", "")
+    if expires < time.time() or version != content_version(record):
+        return None
+    expected = _signature(kind, record["folder"], record["filename"], username, version, expires)
+    if not hmac.compare_digest(expected, params.get("sig", "")):
+        return None
+    return username
+
+def cache_control(params: Mapping[str, str]) -> str:
+    """
+    Cache-Control for a response to a verified signed URL: the URL is unique to
+    this content and viewer, so it can be cached privately until it expires
+    """
+    max_age = max(int(params["exp"]) - int(time.time()), 0)
+    return f"private, max-age={max_age}, immutable"
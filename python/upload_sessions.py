@@ -0,0 +1,381 @@
+"""
+Resumable upload sessions for the photo server backend.
+A client creates a session for a file, PUTs chunks at byte offsets (in any
+order, in parallel, retrying as needed), checks progress, and finalizes.
+Chunks are written in place into a preallocated hidden file in the user's
+folder, so finalizing is a rename rather than a copy.
+"""
+
+import hashlib
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from sqlalchemy import select, insert, update, delete, or_
+from database import upload_sessions_table, upload_chunks_table, get_sync_engine
+from python import photo_utils
+
+MAX_UPLOAD_SIZE = 10 * 1024 * 1024 * 1024  # 10GB, same limit as /upload
+# Recommended chunk size handed out to clients
+SESSION_CHUNK_SIZE = int(os.environ.get("UPLOAD_SESSION_CHUNK_SIZE", 8 * 1024 * 1024))
+# Sessions not finalized within this window are discarded
+SESSION_TTL = timedelta(hours=int(os.environ.get("UPLOAD_SESSION_TTL_HOURS", 24)))
+# A finalize claimed longer ago than this was abandoned (the server stopped mid-way)
+COMPLETE_CLAIM_TIMEOUT = timedelta(hours=1)
+
+# Running SHA-256 of each session whose chunks have so far arrived in order:
+# session_id -> (hash, offset of the next byte). Out-of-order or retried chunks
+# drop the entry, and the file is hashed by reading it back when finalized.
+_session_hashes: Dict[str, Tuple[Any, int]] = {}
+# Chunk writes in progress in this process: session_id -> count. A write and
+# a finalize each announce themselves before checking for the other, so at
+# most one of them proceeds.
+_session_writes: Dict[str, int] = {}
+_session_hashes_lock = threading.Lock()
+
+class SessionCompletingError(RuntimeError):
+    """The upload session is being finalized (or, for a finalize, still receiving chunks)"""
+
+def _session_to_dict(row) -> Dict[str, Any]:
+    """Convert an upload_sessions row into a session dict"""
+    return {
+        "session_id": row.id,
+        "username": row.username,
+        "filename": row.filename,
+        "size": row.total_size,
+        "temp_path": row.temp_path,
+        "created_at": row.created_at.isoformat(),
+        "completed_filename": row.completed_filename,
+    }
+
+def _merge_ranges(chunks: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Merge (offset, length) chunks into sorted, non-overlapping [start, end) ranges
+    """
+    merged: List[Tuple[int, int]] = []
+    for offset, length in sorted(chunks):
+        end = offset + length
+        if merged and offset <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((offset, end))
+    return merged
+
+def _create_temp_file(temp_path: str, size: int):
+    """Create the sparse file that chunks are written into"""
+    with open(temp_path, "wb") as f:
+        f.truncate(size)
+
+def purge_expired_sessions() -> int:
+    """
+    Remove sessions (and their temp files) older than SESSION_TTL
+
+    Returns:
+        int: Number of sessions removed
+    """
+    now = datetime.utcnow()
+    with get_sync_engine().connect() as conn:
+        expired = conn.execute(
+            select(upload_sessions_table).where(
+                upload_sessions_table.c.created_at < now - SESSION_TTL,
+                or_(upload_sessions_table.c.completing_at.is_(None),
+                    upload_sessions_table.c.completing_at < now - COMPLETE_CLAIM_TIMEOUT),
+            )
+        ).all()
+    removed = 0
+    for row in expired:
+        # Claiming first keeps a finalize that started since the query from
+        # losing its temp file
+        if _claim_completion(row.id):
+            abort_session(_session_to_dict(row))
+            removed += 1
+    return removed
+
+def active_temp_paths() -> List[str]:
+    """
+    Temp files of sessions that can still be resumed
+
+    Returns:
+        list: Paths of the sessions' partial files
+    """
+    with get_sync_engine().connect() as conn:
+        return list(conn.execute(select(upload_sessions_table.c.temp_path)).scalars())
+
+def create_session(username: str, filename: str, size: int) -> Dict[str, Any]:
+    """
+    Start a resumable upload
+
+    Args:
+        username (str): The username of the uploader
+        filename (str): The filename to save once complete
+        size (int): Total size of the file in bytes
+
+    Returns:
+        dict: The new session
+    """
+    if size < 0 or size > MAX_UPLOAD_SIZE:
+        raise ValueError("File size must be between 0 and 10GB")
+
+    purge_expired_sessions()
+
+    temp_path = photo_utils.new_temp_upload_path(username)
+    _create_temp_file(temp_path, size)
+
+    session_id = uuid.uuid4().hex
+    with get_sync_engine().begin() as conn:
+        conn.execute(insert(upload_sessions_table).values(
+            id=session_id,
+            username=username,
+            filename=filename,
+            total_size=size,
+            temp_path=temp_path,
+        ))
+
+    print(f"Created upload session {session_id} for {filename} ({size} bytes) by {username}")
+    return get_session(session_id, username)
+
+def get_session(session_id: str, username: str) -> Optional[Dict[str, Any]]:
+    """
+    Get an upload session with its progress
+
+    Args:
+        session_id (str): Session identifier
+        username (str): Only return the session if it belongs to this user
+
+    Returns:
+        dict: Session with received byte count and missing ranges, or None
+    """
+    with get_sync_engine().connect() as conn:
+        row = conn.execute(
+            select(upload_sessions_table).where(
+                upload_sessions_table.c.id == session_id,
+                upload_sessions_table.c.username == username,
+            )
+        ).first()
+        if row is None:
+            return None
+        chunks = conn.execute(
+            select(upload_chunks_table.c.offset, upload_chunks_table.c.length)
+            .where(upload_chunks_table.c.session_id == session_id)
+        ).all()
+
+    session = _session_to_dict(row)
+    received = _merge_ranges([(chunk.offset, chunk.length) for chunk in chunks])
+
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = end
+    if position < session["size"]:
+        missing.append([position, session["size"]])
+
+    session["received"] = sum(end - start for start, end in received)
+    session["missing"] = missing
+    session["complete"] = not missing
+    session["chunk_size"] = SESSION_CHUNK_SIZE
+    return session
+
+def _completion_claimed(session_id: str) -> bool:
+    """Whether a request currently holds the session's finalize claim"""
+    with get_sync_engine().connect() as conn:
+        completing_at = conn.execute(
+            select(upload_sessions_table.c.completing_at).where(upload_sessions_table.c.id == session_id)
+        ).scalar()
+    return completing_at is not None and completing_at >= datetime.utcnow() - COMPLETE_CLAIM_TIMEOUT
+
+def _end_write(session_id: str):
+    """Forget a finished chunk write"""
+    with _session_hashes_lock:
+        _session_writes[session_id] -= 1
+        if not _session_writes[session_id]:
+            del _session_writes[session_id]
+
+async def write_chunk_async(session: Dict[str, Any], offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """
+    Write one chunk of an upload at the given byte offset
+
+    Args:
+        session (dict): Session returned by get_session
+        offset (int): Byte offset of the chunk within the file
+        chunks: Async iterator over the chunk's body (e.g. Request.stream())
+
+    Returns:
+        dict: Updated session progress
+
+    Raises:
+        ValueError: If the chunk lies outside the file
+        SessionCompletingError: If the session is being (or has been) finalized
+    """
+    if session["completed_filename"] is not None:
+        raise SessionCompletingError("Upload has already been completed")
+    if offset < 0 or offset > session["size"]:
+        raise ValueError(f"Offset {offset} is outside the file (size {session['size']})")
+
+    session_id = session["session_id"]
+    with _session_hashes_lock:
+        _session_writes[session_id] = _session_writes.get(session_id, 0) + 1
+    try:
+        if _completion_claimed(session_id):
+            raise SessionCompletingError("Upload is being completed")
+        return await _write_chunk(session, offset, chunks)
+    finally:
+        _end_write(session_id)
+
+async def _write_chunk(session: Dict[str, Any], offset: int, chunks: AsyncIterator[bytes]) -> Dict[str, Any]:
+    """Body of write_chunk_async, run while the write is announced"""
+    session_id = session["session_id"]
+    with _session_hashes_lock:
+        digest, next_offset = _session_hashes.pop(session_id, (None, None))
+        if offset == 0 and session["received"] == 0:
+            digest, next_offset = hashlib.sha256(), 0
+        if next_offset != offset:
+            digest = None
+
+    try:
+        fd = await photo_utils.run_upload_io(os.open, session["temp_path"], os.O_WRONLY)
+    except FileNotFoundError as e:
+        # Renamed into place (or discarded) since the session was looked up
+        raise SessionCompletingError("Upload has already been completed") from e
+    position = offset
+    try:
+        async for data in chunks:
+            if not data:
+                continue
+            if position + len(data) > session["size"]:
+                raise ValueError("Chunk extends past the declared file size")
+            await photo_utils.run_upload_io(os.pwrite, fd, data, position)
+            if digest is not None:
+                await photo_utils.run_upload_io(digest.update, data)
+            position += len(data)
+    finally:
+        await photo_utils.run_upload_io(os.close, fd)
+
+    # Only a chunk written through to the end keeps the running hash
+    if digest is not None:
+        with _session_hashes_lock:
+            _session_hashes[session_id] = (digest, position)
+
+    # Only record the range once every byte of it is on disk
+    if position > offset:
+        with get_sync_engine().begin() as conn:
+            conn.execute(insert(upload_chunks_table).values(
+                session_id=session["session_id"],
+                offset=offset,
+                length=position - offset,
+            ))
+
+    return get_session(session["session_id"], session["username"])
+
+def _claim_completion(session_id: str) -> bool:
+    """Mark a session as being finalized; False if another request already is"""
+    now = datetime.utcnow()
+    with get_sync_engine().begin() as conn:
+        return conn.execute(
+            update(upload_sessions_table)
+            .where(
+                upload_sessions_table.c.id == session_id,
+                or_(upload_sessions_table.c.completing_at.is_(None),
+                    upload_sessions_table.c.completing_at < now - COMPLETE_CLAIM_TIMEOUT),
+            )
+            .values(completing_at=now)
+        ).rowcount == 1
+
+def _release_completion(session_id: str):
+    """Let a session be finalized again after a failed attempt"""
+    with get_sync_engine().begin() as conn:
+        conn.execute(
+            update(upload_sessions_table)
+            .where(upload_sessions_table.c.id == session_id)
+            .values(completing_at=None)
+        )
+
+async def complete_session_async(session: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Finalize a fully received upload: rename it into place and index it.
+    Finalizing a session again (e.g. a retry after a lost response) returns
+    the stored file's metadata; the session is kept for SESSION_TTL for that.
+
+    Args:
+        session (dict): Session returned by get_session (must be complete)
+
+    Returns:
+        dict: Metadata for the saved file
+
+    Raises:
+        ValueError: If the upload is incomplete
+        SessionCompletingError: If another request is already finalizing the session
+    """
+    if session["completed_filename"] is not None:
+        return _completed_metadata(session)
+    if not session["complete"]:
+        raise ValueError("Upload is incomplete")
+    session_id = session["session_id"]
+    if not _claim_completion(session_id):
+        raise SessionCompletingError("Upload is already being completed")
+    with _session_hashes_lock:
+        writing = _session_writes.get(session_id, 0)
+    if writing:
+        _release_completion(session_id)
+        raise SessionCompletingError("Chunks are still being written")
+
+    with _session_hashes_lock:
+        digest, next_offset = _session_hashes.pop(session_id, (None, None))
+    content_hash = digest.hexdigest() if next_offset == session["size"] else None
+
+    committed = False
+
+    def on_committed(filename: str):
+        # The temp file is gone from under the session now, so the session only
+        # remembers the result, even if indexing fails (the reconciler indexes
+        # the file then)
+        nonlocal committed
+        committed = True
+        with get_sync_engine().begin() as conn:
+            conn.execute(
+                update(upload_sessions_table)
+                .where(upload_sessions_table.c.id == session_id)
+                .values(completed_filename=filename)
+            )
+
+    try:
+        file_metadata = await photo_utils.commit_temp_upload_async(
+            session["temp_path"], session["filename"], session["username"], session["size"], content_hash,
+            on_committed=on_committed,
+        )
+    except BaseException:
+        if not committed:
+            _release_completion(session_id)
+        raise
+    print(f"Completed upload session {session_id} as {file_metadata['filename']}")
+    return file_metadata
+
+def _completed_metadata(session: Dict[str, Any]) -> Dict[str, Any]:
+    """Index record of a finalized session's file (bare details if it isn't indexed)"""
+    filename = session["completed_filename"]
+    record = photo_utils.find_file_info(f"{session['username']}/{filename}")
+    return record or {"filename": filename, "folder": session["username"]}
+
+def abort_session(session: Dict[str, Any]):
+    """
+    Discard an upload session and its partial file
+
+    Args:
+        session (dict): Session to discard
+    """
+    try:
+        if os.path.exists(session["temp_path"]):
+            os.remove(session["temp_path"])
+    except OSError as e:
+        print(f"Error removing partial upload {session['temp_path']}: {str(e)}")
+    _delete_session_rows(session["session_id"])
+
+def _delete_session_rows(session_id: str):
+    """Remove a session and its chunk records"""
+    with _session_hashes_lock:
+        _session_hashes.pop(session_id, None)
+    with get_sync_engine().begin() as conn:
+        conn.execute(delete(upload_chunks_table).where(upload_chunks_table.c.session_id == session_id))
+        conn.execute(delete(upload_sessions_table).where(upload_sessions_table.c.id == session_id))
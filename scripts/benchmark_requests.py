@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Measure authenticated request throughput against a running photo server.
+
+Logs in once, then hammers `GET /photos` and `GET /thumbnails/{filename}`
+(for the newest photo with a thumbnail) from several client threads and
+reports requests per second and latency percentiles for each endpoint.
+Run it against the server before and after a change to compare.
+
+Usage:
+    python scripts/benchmark_requests.py [--url http://localhost:8000]
+        [--username alice] [--password secret] [--requests 500] [--concurrency 8]
+"""
+
+import argparse
+import json
+import statistics
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def login(base_url, username, password):
+    """Get a bearer token from /token"""
+    body = urllib.parse.urlencode({"username": username, "password": password}).encode()
+    with urllib.request.urlopen(urllib.request.Request(f"{base_url}/token", data=body)) as response:
+        return json.load(response)["access_token"]
+
+
+def fetch(url, token):
+    """GET a URL, returning (status, seconds)"""
+    request = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}", "Accept": "application/json"})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - start
+
+
+def run(name, url, token, total, concurrency):
+    """Issue `total` GETs with `concurrency` threads and print a summary line"""
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(lambda _: fetch(url, token), range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(seconds * 1000 for _, seconds in results)
+    errors = sum(1 for status, _ in results if status != 200)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<12} {total / elapsed:>9.1f} {statistics.median(latencies):>9.1f} {p95:>9.1f} "
+          f"{latencies[-1]:>9.1f} {errors:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--username", default="alice")
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--requests", type=int, default=500, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8, help="client threads")
+    args = parser.parse_args()
+
+    base_url = args.url.rstrip("/")
+    token = login(base_url, args.username, args.password)
+
+    request = urllib.request.Request(f"{base_url}/photos?limit=100", headers={"Authorization": f"Bearer {token}"})
+    with urllib.request.urlopen(request) as response:
+        photos = json.load(response)["photos"]
+    thumbnail = next((photo for photo in photos if photo.get("thumbnail_url")), None)
+
+    # Warm up (first requests populate server-side caches)
+    fetch(f"{base_url}/photos", token)
+
+    print(f"{args.requests} requests per endpoint, {args.concurrency} concurrent clients")
+    print(f"{'endpoint':<12} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'errors':>7}")
+    run("/photos", f"{base_url}/photos", token, args.requests, args.concurrency)
+    if thumbnail:
+        run("/thumbnails", f"{base_url}{thumbnail['thumbnail_url']}", token, args.requests, args.concurrency)
+    else:
+        print("/thumbnails  skipped: no photo with a ready thumbnail (upload an image first)")
+
+
+if __name__ == "__main__":
+    main()
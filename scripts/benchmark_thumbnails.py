@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Benchmark thumbnail generation: full-resolution decode vs. the reduced-
+resolution (JPEG draft) decode path in python/photo_utils.py.
+
+Builds a synthetic corpus of large JPEGs, then thumbnails it once per path,
+each in its own subprocess so peak RSS is measured independently. Reports
+per-image latency, peak RSS and how close the fast output is to the full
+decode output (PSNR).
+
+Usage:
+    python scripts/benchmark_thumbnails.py [--count 8] [--megapixels 24]
+        [--sizes 256] [--corpus /tmp/thumbnail-corpus]
+"""
+
+import argparse
+import io
+import json
+import math
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from PIL import Image, ImageChops, ImageStat
+
+
+def build_corpus(corpus_dir, count, megapixels):
+    """Write `count` synthetic photos of roughly `megapixels` MP (reused if present)"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    height = int(math.sqrt(megapixels * 1_000_000 * 2 / 3))
+    width = height * 3 // 2
+    paths = []
+    for i in range(count):
+        path = os.path.join(corpus_dir, f"photo_{i:03d}_{width}x{height}.jpg")
+        paths.append(path)
+        if os.path.exists(path):
+            continue
+        # Smooth gradients and fractal detail plus mild sensor noise, which
+        # compresses roughly like a camera photo (~0.3 bytes/pixel at q92)
+        gradient = Image.linear_gradient("L").resize((width, height))
+        detail = Image.effect_mandelbrot((width, height), (-2.2 + i * 0.1, -1.2, 1.0, 1.2), 64)
+        noise = Image.effect_noise((width, height), 6)
+        img = Image.merge("RGB", (
+            ImageChops.add(detail, noise, scale=1.5),
+            ImageChops.blend(gradient, noise, 0.2),
+            ImageChops.blend(gradient.rotate(180), detail, 0.5),
+        ))
+        exif = Image.Exif()
+        # Every other image is stored rotated, like a portrait phone shot
+        exif[0x0112] = 6 if i % 2 else 1
+        img.save(path, "JPEG", quality=92, exif=exif.tobytes())
+        print(f"  wrote {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    return paths
+
+
+def run_worker(mode, paths, sizes, output_dir):
+    """Thumbnail every image with one path; print timings and peak RSS as JSON"""
+    from python import photo_utils
+
+    fast_decode = mode == "fast"
+    os.makedirs(output_dir, exist_ok=True)
+    latencies = []
+    for path in paths:
+        start = time.perf_counter()
+        with Image.open(path) as original:
+            for size, img in photo_utils.render_renditions(original, sizes, fast_decode):
+                buffer = io.BytesIO()
+                img.save(buffer, "JPEG", quality=85, optimize=True)
+                if size == min(sizes):
+                    with open(os.path.join(output_dir, os.path.basename(path)), "wb") as f:
+                        f.write(buffer.getvalue())
+        latencies.append(time.perf_counter() - start)
+
+    print(json.dumps({"latencies": latencies, "peak_rss_kb": peak_rss_kb()}))
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB"""
+    # Linux carries ru_maxrss across exec (so a worker would inherit the
+    # corpus builder's peak); VmHWM is per process image
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux, bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+
+def psnr(path_a, path_b):
+    """Peak signal-to-noise ratio between two images of the same size"""
+    with Image.open(path_a) as a, Image.open(path_b) as b:
+        if a.size != b.size:
+            return None
+        stat = ImageStat.Stat(ImageChops.difference(a.convert("RGB"), b.convert("RGB")))
+        mse = sum(value for value in stat.sum2) / (3 * a.size[0] * a.size[1])
+    return float("inf") if mse == 0 else 10 * math.log10(255 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=8, help="images in the corpus")
+    parser.add_argument("--megapixels", type=float, default=24, help="size of each image")
+    parser.add_argument("--sizes", default="256",
+                        help="comma separated rendition sizes, e.g. 128,256,1024,2048")
+    parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "thumbnail-corpus"))
+    parser.add_argument("--worker", choices=["full", "fast"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    if args.worker:
+        paths = sorted(os.path.join(args.corpus, name) for name in os.listdir(args.corpus) if name.endswith(".jpg"))
+        run_worker(args.worker, paths, sizes, os.path.join(args.corpus, "out", args.worker))
+        return
+
+    print(f"Building corpus in {args.corpus}")
+    paths = build_corpus(args.corpus, args.count, args.megapixels)
+    # Only benchmark this run's images
+    for name in os.listdir(args.corpus):
+        if name.endswith(".jpg") and os.path.join(args.corpus, name) not in paths:
+            os.remove(os.path.join(args.corpus, name))
+
+    results = {}
+    for mode in ("full", "fast"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", mode,
+             "--sizes", args.sizes, "--corpus", args.corpus],
+            check=True, capture_output=True, text=True, cwd=REPO_ROOT,
+        ).stdout
+        results[mode] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"\n{len(paths)} images, renditions {sizes}")
+    print(f"{'path':<6} {'mean ms':>9} {'median ms':>10} {'max ms':>8} {'peak RSS MB':>12}")
+    for mode, result in results.items():
+        latencies = [latency * 1000 for latency in result["latencies"]]
+        print(f"{mode:<6} {statistics.mean(latencies):>9.0f} {statistics.median(latencies):>10.0f} "
+              f"{max(latencies):>8.0f} {result['peak_rss_kb'] / 1024:>12.0f}")
+
+    speedup = statistics.mean(results["full"]["latencies"]) / statistics.mean(results["fast"]["latencies"])
+    scores = [
+        psnr(os.path.join(args.corpus, "out", "full", os.path.basename(path)),
+             os.path.join(args.corpus, "out", "fast", os.path.basename(path)))
+        for path in paths
+    ]
+    matched = [score for score in scores if score is not None]
+    print(f"\nSpeedup: {speedup:.1f}x")
+    if matched:
+        print(f"Fast vs full output at {min(sizes)}px: min PSNR {min(matched):.1f} dB "
+              f"(above ~40 dB is visually indistinguishable)")
+    if len(matched) != len(scores):
+        print(f"{len(scores) - len(matched)} outputs differed in size")
+
+
+if __name__ == "__main__":
+    main()